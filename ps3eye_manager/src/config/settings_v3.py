@@ -43,12 +43,21 @@ class Settings:
                 "max_clients": 5,
                 "buffer_size": 1024 * 1024  # 1MB
             },
+            "http": {
+                "enabled": False,
+                "host": "localhost",
+                "port": 8080,
+                "jpeg_quality": 80,
+                "max_fps": 30
+            },
             "virtual_camera": {
                 "enabled": False,
                 "device_name": "PS3 Eye Virtual Camera",
                 "width": 640,
                 "height": 480,
-                "fps": 30
+                "fps": 30,
+                "upscale_method": "lanczos",  # linear, lanczos, edge, dnn o auto
+                "upscale_fit": "letterbox"  # letterbox, crop o stretch
             },
             "ui": {
                 "theme": "dark",
@@ -73,6 +82,7 @@ class Settings:
         # Assegna le impostazioni agli attributi
         self.camera = self.settings["camera"]
         self.server = self.settings["server"]
+        self.http = self.settings.get("http", self.default_settings["http"])
         self.virtual_camera = self.settings["virtual_camera"]
         self.ui = self.settings["ui"]
         self.logging = self.settings["logging"]
@@ -0,0 +1,310 @@
+"""
+Client asyncio per la ricezione dei frame dalla telecamera PS3 Eye
+"""
+import asyncio
+import logging
+import struct
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Callable, Deque, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from core.camera_client import CameraClient, decode_frame_header, decode_frame_message, backoff_delay, track_sequence
+
+logger = logging.getLogger('ps3eye.client')
+
+class _FrameBuffer:
+    """
+    Buffer tra il task di ricezione e un consumatore
+
+    In modalità latest_only conserva solo l'ultimo messaggio e scarta i
+    precedenti senza decodificarli. Altrimenti accoda fino a maxsize messaggi
+    e sospende la lettura dal socket quando è pieno (backpressure TCP).
+    """
+
+    def __init__(self, latest_only: bool, maxsize: int):
+        self.latest_only = latest_only
+        self.maxsize = max(1, maxsize)
+        self.dropped = 0
+        self.closed = False
+        self.error: Optional[str] = None
+        self._items: Deque[Tuple[Dict[str, Any], bytes]] = deque()
+        self._ready = asyncio.Event()
+        self._space = asyncio.Event()
+        self._space.set()
+
+    async def put(self, message: Tuple[Dict[str, Any], bytes]):
+        if self.latest_only:
+            if self._items:
+                self.dropped += 1
+                self._items.clear()
+        else:
+            while len(self._items) >= self.maxsize and not self.closed:
+                self._space.clear()
+                await self._space.wait()
+        self._items.append(message)
+        self._ready.set()
+
+    async def get(self) -> Optional[Tuple[Dict[str, Any], bytes]]:
+        while not self._items:
+            if self.closed:
+                return None
+            self._ready.clear()
+            await self._ready.wait()
+        message = self._items.popleft()
+        self._space.set()
+        return message
+
+    def close(self, error: Optional[str] = None):
+        self.closed = True
+        self.error = error
+        self._ready.set()
+        self._space.set()
+
+
+class AsyncCameraClient:
+    """
+    Client asyncio nativo per lo stream dei frame di CameraServer
+
+    Esempio:
+        async with AsyncCameraClient('localhost', 50000) as client:
+            async for frame in client.frames(latest_only=True):
+                ...
+    """
+
+    def __init__(
+        self,
+        host: str = 'localhost',
+        port: int = 50000,
+        auto_reconnect: bool = False,
+        reconnect_callback: Optional[Callable[[Optional[int]], None]] = None,
+        reconnect_max_delay: float = 2.0,
+        reconnect_timeout: Optional[float] = None
+    ):
+        """
+        Args:
+            host: Host del server
+            port: Porta del server
+            auto_reconnect: Se True, riconnette automaticamente dopo una perdita di connessione
+            reconnect_callback: Chiamato al primo frame dopo una riconnessione con il numero
+                di frame persi (None se il server ha ricominciato la numerazione)
+            reconnect_max_delay: Attesa massima tra due tentativi di riconnessione (s)
+            reconnect_timeout: Tempo massimo di riconnessione prima di arrendersi (None = illimitato)
+        """
+        self.host = host
+        self.port = port
+        self.auto_reconnect = auto_reconnect
+        self.reconnect_callback = reconnect_callback
+        self.reconnect_base_delay = 0.1
+        self.reconnect_max_delay = reconnect_max_delay
+        self.reconnect_timeout = reconnect_timeout
+        self.last_sequence: Optional[int] = None
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._task: Optional[asyncio.Task] = None
+        self._buffers: List[_FrameBuffer] = []
+        self._running = False
+        self._error: Optional[str] = None
+        self._resuming = False
+        self._stats = {
+            'frames_received': 0,
+            'frames_delivered': 0,
+            'frames_dropped': 0,
+            'frames_missed': 0,
+            'frames_duplicated': 0,
+            'reconnects': 0,
+            'sequence_resets': 0
+        }
+
+    async def start(self):
+        """Connette al server e avvia il task di ricezione"""
+        if self._running:
+            return
+        await self._connect()
+        self._error = None
+        self._running = True
+        self._task = asyncio.create_task(self._receive_loop())
+
+    async def stop(self):
+        """Ferma il client e chiude la connessione"""
+        if not self._running:
+            return
+        self._running = False
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self._close_connection()
+        for buffer in self._buffers:
+            buffer.close()
+
+    async def __aenter__(self) -> 'AsyncCameraClient':
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.stop()
+
+    async def frames(self, latest_only: bool = True, maxsize: int = 4) -> AsyncIterator[np.ndarray]:
+        """
+        Itera sui frame ricevuti
+
+        Args:
+            latest_only: Se True restituisce sempre il frame più recente, scartando
+                quelli non ancora consumati (nessun arretrato)
+            maxsize: Frame accodati al massimo quando latest_only è False; oltre
+                questo limite la lettura dal socket viene sospesa
+
+        Yields:
+            np.ndarray: Frame in sola lettura
+
+        Raises:
+            ConnectionError: Se la connessione si interrompe in modo non recuperabile
+                (anche se si era già interrotta prima della chiamata)
+        """
+        if not self._running:
+            # Ricezione terminata o mai avviata: nessuno chiuderebbe il buffer
+            if self._error:
+                raise ConnectionError(self._error)
+            return
+        buffer = _FrameBuffer(latest_only, maxsize)
+        self._buffers.append(buffer)
+        try:
+            while True:
+                message = await buffer.get()
+                if message is None:
+                    if buffer.error:
+                        raise ConnectionError(buffer.error)
+                    return
+
+                # La decodifica dei dati avviene solo per i frame effettivamente consegnati
+                header, payload = message
+                if header.get('type') != 'frame':
+                    continue
+                decoded = decode_frame_message(payload)
+                if decoded is None:
+                    continue
+                self._stats['frames_delivered'] += 1
+                yield decoded[0]
+        finally:
+            self._stats['frames_dropped'] += buffer.dropped
+            if buffer in self._buffers:
+                self._buffers.remove(buffer)
+
+    @property
+    def stats(self) -> dict:
+        """Restituisce le statistiche di ricezione"""
+        stats = self._stats.copy()
+        stats['frames_dropped'] += sum(buffer.dropped for buffer in self._buffers)
+        return stats
+
+    async def _connect(self):
+        self._reader, self._writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port), timeout=5.0
+        )
+
+    async def _close_connection(self):
+        if self._writer:
+            try:
+                self._writer.close()
+                await self._writer.wait_closed()
+            except Exception:
+                pass
+            self._writer = None
+            self._reader = None
+
+    async def _receive_loop(self):
+        """Task di ricezione, con riconnessione automatica se abilitata"""
+        error = None
+        while self._running:
+            try:
+                await self._receive_messages()
+                reason, recoverable = "Connessione persa", True
+            except asyncio.IncompleteReadError:
+                reason, recoverable = "Connessione persa durante la lettura", True
+            except ValueError as e:
+                reason, recoverable = str(e), False
+            except (ConnectionError, OSError) as e:
+                reason, recoverable = f"Errore di comunicazione: {e}", True
+
+            if not (self.auto_reconnect and recoverable):
+                error = reason
+                break
+
+            logger.warning(f"{reason}, riconnessione in corso...")
+            if not await self._reconnect():
+                error = f"{reason}: riconnessione fallita"
+                break
+
+        self._running = False
+        self._error = error
+        await self._close_connection()
+        for buffer in self._buffers:
+            buffer.close(error)
+
+    async def _reconnect(self) -> bool:
+        """Riconnette al server con backoff esponenziale e jitter"""
+        await self._close_connection()
+        started = time.monotonic()
+        attempt = 0
+        while self._running:
+            await asyncio.sleep(backoff_delay(attempt, self.reconnect_base_delay, self.reconnect_max_delay))
+            attempt += 1
+            try:
+                await self._connect()
+            except (OSError, asyncio.TimeoutError) as e:
+                if self.reconnect_timeout is not None and time.monotonic() - started > self.reconnect_timeout:
+                    logger.error(f"Riconnessione non riuscita dopo {attempt} tentativi: {e}")
+                    return False
+                continue
+
+            self._stats['reconnects'] += 1
+            self._resuming = True
+            logger.info(f"Riconnesso a {self.host}:{self.port} dopo {time.monotonic() - started:.2f}s")
+            return True
+        return False
+
+    async def _receive_messages(self):
+        """Legge i messaggi dalla connessione corrente e li smista ai buffer"""
+        reader = self._reader
+        while self._running:
+            try:
+                header = await reader.readexactly(4)
+            except asyncio.IncompleteReadError as e:
+                if not e.partial:
+                    return
+                raise
+
+            message_size = struct.unpack('!I', header)[0]
+            if message_size > CameraClient.MAX_MESSAGE_SIZE:
+                raise ValueError(f"Dimensione messaggio troppo grande: {message_size} bytes")
+
+            payload = await reader.readexactly(message_size)
+            self._stats['frames_received'] += 1
+            # Intestazione decodificata una sola volta e condivisa con i consumatori
+            header = decode_frame_header(payload)
+            if header is None:
+                raise ValueError("Messaggio non valido dal server")
+            self._track_sequence(header.get('seq'))
+
+            message = (header, payload)
+            for buffer in list(self._buffers):
+                await buffer.put(message)
+
+    def _track_sequence(self, sequence: Optional[int]):
+        """Aggiorna il numero di sequenza e rileva i frame persi"""
+        if sequence is None:
+            return
+        missed = track_sequence(self._stats, self.last_sequence, sequence)
+        self.last_sequence = sequence
+
+        if self._resuming:
+            self._resuming = False
+            if missed:
+                logger.warning(f"Frame persi durante la riconnessione: {missed}")
+            if self.reconnect_callback:
+                self.reconnect_callback(missed)
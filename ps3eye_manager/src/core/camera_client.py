@@ -8,25 +8,126 @@ import threading
 import numpy as np
 import json
 import time
-from typing import Optional, Callable
+import random
+from typing import Any, Dict, Optional, Callable, Tuple
+
+def decode_frame_message(payload: bytes) -> Optional[Tuple[np.ndarray, Optional[int], Optional[int]]]:
+    """
+    Decodifica un messaggio del server
+    
+    Args:
+        payload: Corpo JSON del messaggio (senza il prefisso di lunghezza)
+        
+    Returns:
+        Optional[Tuple[np.ndarray, Optional[int], Optional[int]]]: Frame, sequenza
+            di trasporto e sequenza del frame catturato, None se il messaggio
+            non è un frame
+    """
+    message = json.loads(bytes(payload).decode('utf-8'))
+    if message.get('type') != 'frame':
+        return None
+    
+    frame = np.frombuffer(
+        message['data'].encode('latin-1'), 
+        dtype=np.uint8
+    ).reshape(message['shape'])
+    return frame, message.get('seq'), message.get('content_seq')
+
+def decode_frame_header(payload: bytes) -> Optional[Dict[str, Any]]:
+    """
+    Decodifica i campi di un messaggio del server senza i dati del frame
+    
+    Il server scrive 'data' per ultimo: i campi che lo precedono (type, seq,
+    content_seq, shape) vengono decodificati senza toccare i pixel.
+    
+    Args:
+        payload: Corpo JSON del messaggio (senza il prefisso di lunghezza)
+        
+    Returns:
+        Optional[Dict[str, Any]]: Campi del messaggio, None se non è JSON valido
+    """
+    end = payload.find(b', "data": ')
+    try:
+        header = json.loads(bytes(payload[:end]) + b'}' if end >= 0 else bytes(payload))
+    except ValueError:
+        return None
+    return header if isinstance(header, dict) else None
+
+def track_sequence(stats: Dict[str, int], last_sequence: Optional[int], sequence: Optional[int]) -> Optional[int]:
+    """
+    Confronta un numero di sequenza di trasporto con il precedente
+    
+    Aggiorna in stats i contatori frames_missed, frames_duplicated e sequence_resets.
+    
+    Returns:
+        Optional[int]: Frame persi tra i due (0 per un duplicato), None se una
+            delle due sequenze manca o il server ha ricominciato la numerazione
+    """
+    if sequence is None or last_sequence is None:
+        return None
+    if sequence > last_sequence:
+        missed = sequence - last_sequence - 1
+        stats['frames_missed'] += missed
+        return missed
+    if sequence == last_sequence:
+        # Stesso frame ricevuto di nuovo (es. ultimo frame reinviato dopo una riconnessione)
+        stats['frames_duplicated'] += 1
+        return 0
+    # Il server ha ricominciato la numerazione (es. riavvio)
+    stats['sequence_resets'] += 1
+    return None
+
+def backoff_delay(attempt: int, base_delay: float, max_delay: float) -> float:
+    """
+    Attesa prima del tentativo di riconnessione, con backoff esponenziale e jitter
+    
+    Il jitter evita che più client si riconnettano tutti nello stesso istante.
+    """
+    return min(max_delay, base_delay * (2 ** attempt)) * random.uniform(0.5, 1.0)
 
 class CameraClient:
     """Client per la ricezione dei frame dalla telecamera PS3 Eye"""
     
+    MAX_MESSAGE_SIZE = 16 * 1024 * 1024  # 16MB: un frame VGA RGBA serializzato supera 1MB
+    
     def __init__(self):
         self.socket = None
         self.running = False
         self.receive_thread = None
         self.frame_callback = None
         self.error_callback = None
+        self.reconnect_callback = None
+        self.auto_reconnect = False
+        self.reconnect_base_delay = 0.1
+        self.reconnect_max_delay = 2.0
+        self.reconnect_timeout: Optional[float] = None
+        self.last_sequence: Optional[int] = None
+        # Sequenza del frame catturato (content_seq), diversa da quella di trasporto
+        self.last_content_sequence: Optional[int] = None
+        self._host = 'localhost'
+        self._port = 50000
+        self._resuming = False
+        self._stop_event = threading.Event()
         self._lock = threading.Lock()
+        self._stats = {
+            'frames_received': 0,
+            'frames_missed': 0,
+            'frames_duplicated': 0,
+            'bytes_received': 0,
+            'reconnects': 0,
+            'sequence_resets': 0
+        }
     
     def start(
         self,
         frame_callback: Optional[Callable[[np.ndarray], None]] = None,
         error_callback: Optional[Callable[[str], None]] = None,
         host: str = 'localhost',
-        port: int = 50000
+        port: int = 50000,
+        auto_reconnect: bool = False,
+        reconnect_callback: Optional[Callable[[Optional[int]], None]] = None,
+        reconnect_max_delay: float = 2.0,
+        reconnect_timeout: Optional[float] = None
     ) -> bool:
         """
         Avvia il client
@@ -36,19 +137,29 @@ class CameraClient:
             error_callback: Callback per gli errori
             host: Host del server
             port: Porta del server
+            auto_reconnect: Se True, riconnette automaticamente dopo una perdita di connessione
+            reconnect_callback: Chiamato al primo frame dopo una riconnessione con il numero
+                di frame persi (None se il server ha ricominciato la numerazione)
+            reconnect_max_delay: Attesa massima tra due tentativi di riconnessione (s)
+            reconnect_timeout: Tempo massimo di riconnessione prima di arrendersi (None = illimitato)
         
         Returns:
             bool: True se il client è stato avviato con successo
         """
         try:
-            # Salva i callback
+            # Salva i callback e la sottoscrizione, riusati ad ogni riconnessione
             self.frame_callback = frame_callback
             self.error_callback = error_callback
+            self.reconnect_callback = reconnect_callback
+            self.auto_reconnect = auto_reconnect
+            self.reconnect_max_delay = reconnect_max_delay
+            self.reconnect_timeout = reconnect_timeout
+            self._host = host
+            self._port = port
+            self._stop_event.clear()
             
             # Crea il socket
-            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.socket.connect((host, port))
-            self.socket.settimeout(5.0)  # Match server timeout
+            self.socket = self._connect()
             
             # Avvia il thread di ricezione
             self.running = True
@@ -63,6 +174,12 @@ class CameraClient:
             self.stop()
             return False
     
+    def _connect(self) -> socket.socket:
+        """Apre una nuova connessione verso il server"""
+        sock = socket.create_connection((self._host, self._port), timeout=5.0)
+        sock.settimeout(5.0)  # Match server timeout
+        return sock
+    
     def stop(self):
         """Ferma il client"""
         with self._lock:
@@ -70,18 +187,10 @@ class CameraClient:
                 return
             
             self.running = False
+            self._stop_event.set()
             
             # Chiudi il socket
-            if self.socket:
-                try:
-                    self.socket.shutdown(socket.SHUT_RDWR)
-                except:
-                    pass
-                try:
-                    self.socket.close()
-                except:
-                    pass
-                self.socket = None
+            self._close_socket()
             
             # Aspetta che il thread termini
             if self.receive_thread and self.receive_thread.is_alive():
@@ -89,55 +198,142 @@ class CameraClient:
                     self.receive_thread.join(timeout=1.0)
                 self.receive_thread = None
     
+    def _close_socket(self):
+        """Chiude il socket corrente"""
+        if self.socket:
+            try:
+                self.socket.shutdown(socket.SHUT_RDWR)
+            except:
+                pass
+            try:
+                self.socket.close()
+            except:
+                pass
+            self.socket = None
+    
+    @property
+    def stats(self) -> dict:
+        """Restituisce le statistiche di ricezione"""
+        return self._stats.copy()
+    
     def _receive_loop(self):
-        """Loop di ricezione dei frame"""
+        """Loop di ricezione dei frame, con riconnessione automatica se abilitata"""
+        while self.running:
+            reason, recoverable = self._receive_messages()
+            if not self.running:
+                break
+            
+            if not (self.auto_reconnect and recoverable):
+                if self.error_callback:
+                    self.error_callback(reason)
+                break
+            
+            logging.warning(f"{reason}, riconnessione in corso...")
+            if not self._reconnect():
+                if self.running and self.error_callback:
+                    self.error_callback(f"{reason}: riconnessione fallita")
+                break
+    
+    def _reconnect(self) -> bool:
+        """
+        Riconnette al server con backoff esponenziale e jitter
+        
+        Returns:
+            bool: True se la connessione è stata ripristinata
+        """
+        with self._lock:
+            self._close_socket()
+        
+        started = time.monotonic()
+        attempt = 0
+        while self.running:
+            delay = backoff_delay(attempt, self.reconnect_base_delay, self.reconnect_max_delay)
+            if self._stop_event.wait(delay):
+                return False
+            attempt += 1
+            
+            try:
+                sock = self._connect()
+            except OSError as e:
+                if self.reconnect_timeout is not None and time.monotonic() - started > self.reconnect_timeout:
+                    logging.error(f"Riconnessione non riuscita dopo {attempt} tentativi: {e}")
+                    return False
+                logging.debug(f"Tentativo di riconnessione {attempt} fallito: {e}")
+                continue
+            
+            with self._lock:
+                if not self.running:
+                    sock.close()
+                    return False
+                self.socket = sock
+            
+            self._stats['reconnects'] += 1
+            self._resuming = True
+            logging.info(f"Riconnesso a {self._host}:{self._port} dopo {time.monotonic() - started:.2f}s")
+            return True
+        return False
+    
+    def _track_sequence(self, sequence: Optional[int]):
+        """Aggiorna il numero di sequenza e rileva i frame persi"""
+        missed = track_sequence(self._stats, self.last_sequence, sequence)
+        self.last_sequence = sequence
+        
+        if self._resuming:
+            self._resuming = False
+            if missed:
+                logging.warning(f"Frame persi durante la riconnessione: {missed}")
+            if self.reconnect_callback:
+                self.reconnect_callback(missed)
+    
+    def _receive_messages(self) -> Tuple[str, bool]:
+        """
+        Riceve i messaggi dalla connessione corrente finché non si interrompe
+        
+        Returns:
+            Tuple[str, bool]: Motivo dell'interruzione e se è recuperabile con una riconnessione
+        """
         buffer = bytearray()
         message_size = None
-        MAX_MESSAGE_SIZE = 1024 * 1024  # 1MB limite massimo
+        sock = self.socket
         
         while self.running:
             try:
                 # Prima leggiamo la dimensione del messaggio (4 byte)
                 if message_size is None:
                     if len(buffer) < 4:
-                        chunk = self.socket.recv(4 - len(buffer))
+                        chunk = sock.recv(4 - len(buffer))
                         if not chunk:
-                            if self.error_callback:
-                                self.error_callback("Connessione persa")
-                            break
+                            return "Connessione persa", True
                         buffer.extend(chunk)
                         continue
                         
                     message_size = struct.unpack('!I', buffer[:4])[0]
-                    if message_size > MAX_MESSAGE_SIZE:
-                        if self.error_callback:
-                            self.error_callback(f"Dimensione messaggio troppo grande: {message_size} bytes")
-                        break
+                    if message_size > self.MAX_MESSAGE_SIZE:
+                        return f"Dimensione messaggio troppo grande: {message_size} bytes", False
                     buffer = buffer[4:]
                 
                 # Poi leggiamo il resto del messaggio
                 if len(buffer) < message_size:
                     try:
-                        chunk = self.socket.recv(min(8192, message_size - len(buffer)))
+                        chunk = sock.recv(min(65536, message_size - len(buffer)))
                         if not chunk:
-                            if self.error_callback:
-                                self.error_callback("Connessione persa durante la lettura")
-                            break
+                            return "Connessione persa durante la lettura", True
                         buffer.extend(chunk)
                         continue
                     except socket.timeout:
                         continue
                 
                 # Processa il messaggio completo
+                self._stats['bytes_received'] += 4 + message_size
                 try:
                     # Decodifica il messaggio JSON
-                    message = json.loads(buffer[:message_size].decode('utf-8'))
+                    decoded = decode_frame_message(buffer[:message_size])
                     
-                    if message.get('type') == 'frame':
-                        frame_data = np.frombuffer(
-                            message['data'].encode('latin-1'), 
-                            dtype=np.uint8
-                        ).reshape(message['shape'])
+                    if decoded is not None:
+                        frame_data, sequence, content_sequence = decoded
+                        self._track_sequence(sequence)
+                        self.last_content_sequence = content_sequence
+                        self._stats['frames_received'] += 1
                         
                         if self.frame_callback:
                             self.frame_callback(frame_data)
@@ -156,10 +352,12 @@ class CameraClient:
                 continue
                 
             except Exception as e:
-                logging.error(f"Errore nella ricezione: {e}", exc_info=True)
-                if self.error_callback:
-                    self.error_callback(f"Errore di comunicazione: {e}")
-                break
+                if not self.running:
+                    break
+                logging.error(f"Errore nella ricezione: {e}")
+                return f"Errore di comunicazione: {e}", True
+        
+        return "Client arrestato", False
 
     def __del__(self):
         """Cleanup quando l'oggetto viene distrutto"""
@@ -26,6 +26,16 @@ class CameraServer:
         self._frame_lock = threading.Lock()  # Add dedicated lock for frame operations
         self._current_frame = None
         self._client_threads = []  # Keep track of client threads
+        self._sequence = 0
+        # Numero di sequenza di trasporto: avanza solo per i frame effettivamente inviati,
+        # così i client non contano come persi i frame invariati non ritrasmessi
+        self._transport_sequence = 0
+        # Ultimo frame per i client appena connessi: il messaggio già serializzato
+        # (sequenza di trasporto, byte) se è stato inviato, altrimenti una copia
+        # del frame da serializzare alla prima connessione
+        self._last_message: Optional[Tuple[int, bytes]] = None
+        self._pending_frame: Optional[Tuple[np.ndarray, int]] = None
+        self._last_version = 0
         logger.debug("Server inizializzato")
     
     def start(self, host: str = 'localhost', port: int = 50000) -> bool:
@@ -159,33 +169,59 @@ class CameraServer:
             
             logger.info("Server arrestato con successo")
     
-    def broadcast_frame(self, frame: np.ndarray):
+    def _frame_message(self, frame: np.ndarray, sequence: int, content_sequence: int) -> bytes:
+        """Serializza un messaggio di frame con il prefisso della dimensione"""
+        message = {
+            'type': 'frame',
+            'seq': sequence,
+            'content_seq': content_sequence,
+            'shape': frame.shape,
+            'data': frame.tobytes().decode('latin-1')
+        }
+        json_data = json.dumps(message).encode('utf-8')
+        return struct.pack('!I', len(json_data)) + json_data
+
+    def broadcast_frame(self, frame: np.ndarray, sequence: Optional[int] = None, changed: bool = True):
         """
         Invia il frame a tutti i client connessi
         
+        Il messaggio contiene due numeri: 'seq' è la sequenza di trasporto,
+        che avanza di uno per ogni frame inviato (un salto indica frame
+        persi), 'content_seq' è la sequenza del frame catturato.
+        
         Args:
             frame: Frame da inviare
+            sequence: Numero di sequenza del frame (se None usa un contatore interno)
+            changed: False se il frame è invariato rispetto al precedente
+                (FrameTag.changed): non viene inviato e i client mostrano
+                ancora l'ultimo ricevuto
         """
-        if not frame.size or not self.clients:
+        if sequence is None:
+            self._sequence += 1
+            sequence = self._sequence
+        else:
+            self._sequence = sequence
+        
+        if not frame.size:
+            return
+        if not changed or not self.clients:
+            with self._frame_lock:
+                if changed or not self._last_version:
+                    # Nessun invio: copia del frame, serializzata solo se si connette un client
+                    self._pending_frame = (frame.copy(), sequence)
+                    self._last_message = None
+                    self._last_version += 1
             return
             
         try:
-            # Prepara il messaggio una sola volta per tutti i client
-            message = {
-                'type': 'frame',
-                'shape': frame.shape,
-                'data': frame.tobytes().decode('latin-1')
-            }
-            
-            # Serializza il messaggio
-            json_data = json.dumps(message).encode('utf-8')
-            message_size = struct.pack('!I', len(json_data))
-            
-            # Prepara il buffer completo una sola volta
-            full_message = message_size + json_data
-            
-            # Invia a tutti i client connessi
+            # Invia a tutti i client connessi; il messaggio viene preparato una sola volta
             with self._lock:
+                self._transport_sequence += 1
+                full_message = self._frame_message(frame, self._transport_sequence, sequence)
+                with self._frame_lock:
+                    self._last_message = (self._transport_sequence, full_message)
+                    self._pending_frame = None
+                    self._last_version += 1
                 disconnected_clients = []
                 for client, addr in self.clients:
                     try:
@@ -209,6 +245,45 @@ class CameraServer:
         except Exception as e:
             logger.error(f"Errore nel broadcast del frame: {e}", exc_info=True)
 
+    def _join_client(self, client: socket.socket, addr) -> bool:
+        """
+        Invia l'ultimo frame a un client appena connesso e lo aggiunge ai destinatari
+        
+        L'invio avviene fuori da self._lock, così un client lento non blocca i
+        broadcast; se nel frattempo è stato inviato un frame più recente lo si
+        rispedisce prima di registrare il client.
+        
+        Returns:
+            bool: False se l'invio è fallito
+        """
+        sent_version = None
+        while self.running:
+            with self._lock:
+                with self._frame_lock:
+                    version = self._last_version
+                    last_message = self._last_message
+                    pending = self._pending_frame
+                if version == sent_version or (last_message is None and pending is None):
+                    self.clients.append((client, addr))
+                    return True
+                transport_sequence = self._transport_sequence
+            if last_message is not None:
+                message = last_message[1]
+            else:
+                # Stessa sequenza di trasporto dell'ultimo invio: per il nuovo client non è un salto
+                frame, content_sequence = pending
+                message = self._frame_message(frame, transport_sequence, content_sequence)
+            try:
+                client.settimeout(1.0)
+                client.sendall(message)
+            except Exception as e:
+                logger.warning(f"Errore nell'invio dell'ultimo frame al client {addr}: {e}")
+                return False
+            finally:
+                client.settimeout(5.0)
+            sent_version = version
+        return False
+
     def _accept_clients(self):
         """Thread per accettare nuove connessioni client"""
         logger.debug("Avvio thread di accettazione client")
@@ -225,9 +300,6 @@ class CameraServer:
                     # Imposta timeout per il client
                     client.settimeout(5.0)  # 5 secondi di timeout
                     
-                    with self._lock:
-                        self.clients.append((client, addr))
-                        
                     # Avvia thread per gestire il client
                     client_thread = threading.Thread(
                         target=self._handle_client,
@@ -256,6 +328,15 @@ class CameraServer:
         """
         logger.info(f"Nuova connessione client da {addr}")
         
+        # Su una scena statica il prossimo broadcast può tardare:
+        # il nuovo client riceve subito l'ultimo frame
+        if not self._join_client(client, addr):
+            try:
+                client.close()
+            except:
+                pass
+            return
+        
         # Imposta timeout sul socket
         client.settimeout(5.0)  # 5 secondi di timeout
         
@@ -328,6 +409,10 @@ class CameraServer:
                         break
                         
                 except socket.timeout:
+                    if message_size is None and not buffer:
+                        # Client inattivo tra due comandi: i client che ricevono solo
+                        # lo stream dei frame non inviano nulla e non vanno disconnessi
+                        continue
                     consecutive_errors += 1
                     if consecutive_errors >= MAX_CONSECUTIVE_ERRORS:
                         logger.error(f"Troppi timeout consecutivi da {addr}, chiusura connessione")
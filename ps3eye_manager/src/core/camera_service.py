@@ -8,14 +8,23 @@ import logging
 import threading
 import numpy as np
 from pathlib import Path
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Tuple, Callable
 
 from core.ps3eye_camera import PS3EyeCamera, CLEyeCameraColorMode, CLEyeCameraResolution, CLEyeCameraParameter
 from core.virtual_camera import VirtualCamera
+from core.pixel_format import PixelFormat, FrameConversionCache
+from core.change_detector import ChangeDetector, FrameTag
+from effects.upscale import Upscaler, UPSCALE_METHODS, FIT_MODES
 
 class CLEyeService:
     """Servizio per la gestione della telecamera PS3 Eye"""
     
+    # Formato dei frame restituiti da PS3EyeCamera.get_frame
+    pixel_format = PixelFormat.RGBA
+    # Risoluzione di cattura richiesta alla telecamera e dimensioni dei frame risultanti
+    capture_resolution = CLEyeCameraResolution.CLEYE_VGA
+    capture_size = (640, 480)
+    
     def __init__(self):
         self.camera = PS3EyeCamera()
         self.virtual_camera = VirtualCamera()
@@ -24,10 +33,86 @@ class CLEyeService:
         self._lock = threading.Lock()
         self._frame_lock = threading.Lock()
         self._current_frame = None
+        self._frame_sequence = 0
+        self._conversions = FrameConversionCache(self.pixel_format)
+        self.change_detector = ChangeDetector()
+        self._frame_tag = FrameTag()
         self._frame_count = 0
         self._start_time = None
         self._frame_callback = None
+        # Ascoltatori notificati a ogni nuovo frame (tupla sostituita a ogni modifica)
+        self._frame_listeners: Tuple[Callable[[np.ndarray, int, FrameTag], None], ...] = ()
         self._virtual_camera_enabled = False
+        self._upscaled_content = -1
+        self._upscaled_frame: Optional[np.ndarray] = None
+        # Ingrandimento dei frame per la webcam virtuale (None = risoluzione di cattura)
+        self.upscaler: Optional[Upscaler] = None
+        
+    def set_output_resolution(self, width: int, height: int, method: str = 'lanczos', fit: str = 'letterbox'):
+        """
+        Imposta la risoluzione esposta dalla webcam virtuale
+        
+        I frame catturati vengono ingranditi (ad esempio a 1280x720 o 1920x1080)
+        con il metodo indicato; la risoluzione di cattura (capture_size)
+        disattiva l'ingrandimento. Ha effetto al prossimo avvio della webcam
+        virtuale.
+        
+        Args:
+            width: Larghezza di uscita
+            height: Altezza di uscita
+            method: Metodo di ingrandimento (vedi effects.upscale.UPSCALE_METHODS) o 'auto'
+            fit: Adattamento del rapporto d'aspetto: 'letterbox', 'crop' o 'stretch'
+            
+        Raises:
+            ValueError: Se il metodo o l'adattamento non esistono
+        """
+        if method != 'auto' and method not in UPSCALE_METHODS:
+            raise ValueError(f"Metodo di ingrandimento sconosciuto: {method}")
+        if fit not in FIT_MODES:
+            raise ValueError(f"Adattamento sconosciuto: {fit}")
+        if (width, height) == self.capture_size:
+            self.upscaler = None
+        elif self.upscaler is None:
+            # In 'auto' l'ingrandimento ha a disposizione metà del tempo di un frame
+            self.upscaler = Upscaler((width, height), method, budget_ms=1000 / 30 / 2, fit=fit)
+        else:
+            self.upscaler.set_output_size(width, height)
+            self.upscaler.set_method(method)
+            self.upscaler.set_fit(fit)
+        self._upscaled_frame = None
+        
+    def add_frame_listener(self, listener: Callable[[np.ndarray, int, FrameTag], None]):
+        """
+        Registra un ascoltatore dei nuovi frame
+        
+        L'ascoltatore viene chiamato dal thread di cattura, fuori dal lock,
+        con il frame, il suo numero di sequenza e l'etichetta di cambiamento;
+        deve restituire subito (ad esempio svegliando un proprio thread) e
+        trattare il frame in sola lettura.
+        """
+        with self._lock:
+            self._frame_listeners = self._frame_listeners + (listener,)
+            
+    def remove_frame_listener(self, listener: Callable[[np.ndarray, int, FrameTag], None]):
+        """Rimuove un ascoltatore registrato con add_frame_listener"""
+        with self._lock:
+            self._frame_listeners = tuple(l for l in self._frame_listeners if l != listener)
+        
+    def _on_virtual_camera_frame(self, frame: np.ndarray, sequence: int, tag: FrameTag):
+        """Inoltra alla webcam virtuale la notifica di un nuovo frame"""
+        self.virtual_camera.notify_frame(sequence)
+        
+    def _virtual_camera_frame(self) -> Tuple[Optional[np.ndarray], int]:
+        """Ultimo frame nel formato e alla risoluzione della webcam virtuale, con la sua sequenza"""
+        frame, sequence = self.get_latest_frame_as(VirtualCamera.pixel_format)
+        if frame is None or self.upscaler is None:
+            return frame, sequence
+        # Su una scena statica l'ultimo ingrandimento è ancora valido
+        content = self.get_frame_tag().content_sequence
+        if content != self._upscaled_content or self._upscaled_frame is None:
+            self._upscaled_frame = self.upscaler.upscale(frame)
+            self._upscaled_content = content
+        return self._upscaled_frame, sequence
         
     def start(self, frame_callback=None, enable_virtual_camera=True) -> bool:
         """
@@ -60,7 +145,7 @@ class CLEyeService:
             success = self.camera.create_camera(
                 uuid,
                 CLEyeCameraColorMode.CLEYE_COLOR,
-                CLEyeCameraResolution.CLEYE_VGA,
+                self.capture_resolution,
                 30  # 30 FPS
             )
             if not success:
@@ -76,14 +161,19 @@ class CLEyeService:
                 
             # Avvia la webcam virtuale se richiesto
             if self._virtual_camera_enabled:
+                width, height = self.upscaler.output_size if self.upscaler else self.capture_size
                 if not self.virtual_camera.start(
-                    width=640,
-                    height=480,
+                    width=width,
+                    height=height,
                     fps=30,
-                    frame_callback=self.get_frame
+                    frame_callback=self._virtual_camera_frame
                 ):
                     logging.error("Impossibile avviare la webcam virtuale")
                     self._virtual_camera_enabled = False
+                else:
+                    # La webcam virtuale pubblica ogni nuovo frame una volta, al ritmo della cattura
+                    self._upscaled_frame = None
+                    self.add_frame_listener(self._on_virtual_camera_frame)
             
             # Avvia il thread di cattura
             self.running = True
@@ -130,12 +220,24 @@ class CLEyeService:
                     continue
                 
                 error_count = 0  # Reset del contatore errori
+                
+                # Etichetta di cambiamento, calcolata fuori dal lock
+                tag = self.change_detector.update(frame, self._frame_sequence + 1)
                     
                 # Aggiorna il frame corrente e notifica
                 with self._frame_lock:
                     self._current_frame = frame
+                    self._frame_sequence += 1
+                    self._frame_tag = tag
                     if self._frame_callback:
                         self._frame_callback(frame)
+                    sequence = self._frame_sequence
+                    
+                for listener in self._frame_listeners:
+                    try:
+                        listener(frame, sequence, tag)
+                    except Exception as e:
+                        logging.error(f"Errore in un ascoltatore dei frame: {e}")
                     
                 # Aggiorna statistiche FPS
                 frame_count += 1
@@ -169,7 +271,7 @@ class CLEyeService:
             success = self.camera.create_camera(
                 uuid,
                 CLEyeCameraColorMode.CLEYE_COLOR,
-                CLEyeCameraResolution.CLEYE_VGA,
+                self.capture_resolution,
                 30
             )
             if not success:
@@ -197,6 +299,49 @@ class CLEyeService:
         with self._frame_lock:
             return self._current_frame.copy() if self._current_frame is not None else None
 
+    def get_latest_frame(self) -> Tuple[Optional[np.ndarray], int]:
+        """
+        Ottiene l'ultimo frame senza copiarlo, insieme al suo numero di sequenza
+        
+        Il frame restituito è condiviso e va trattato in sola lettura: la cattura
+        sostituisce il riferimento ad ogni nuovo frame senza modificare il precedente.
+        
+        Returns:
+            Tuple[Optional[np.ndarray], int]: Il frame (o None) e il numero di sequenza
+        """
+        with self._frame_lock:
+            return self._current_frame, self._frame_sequence
+
+    def get_frame_tag(self) -> FrameTag:
+        """
+        Etichetta di cambiamento dell'ultimo frame
+        
+        content_sequence avanza solo quando il frame cambia in modo
+        significativo: chi la usa come chiave può riutilizzare il proprio
+        ultimo risultato finché resta uguale.
+        """
+        with self._frame_lock:
+            return self._frame_tag
+
+    def get_latest_frame_as(self, pixel_format) -> Tuple[Optional[np.ndarray], int]:
+        """
+        Ottiene l'ultimo frame convertito nel formato richiesto
+        
+        La conversione di un frame in un formato viene eseguita una sola volta
+        e condivisa tra tutti i consumatori che lo chiedono; il frame
+        restituito va trattato in sola lettura.
+        
+        Args:
+            pixel_format: Formato richiesto (PixelFormat o nome, ad esempio 'BGR')
+            
+        Returns:
+            Tuple[Optional[np.ndarray], int]: Il frame (o None) e il numero di sequenza
+        """
+        frame, sequence = self.get_latest_frame()
+        if frame is None:
+            return None, sequence
+        return self._conversions.get(frame, sequence, pixel_format), sequence
+
     def stop(self):
         """Ferma il servizio"""
         self.running = False
@@ -205,6 +350,7 @@ class CLEyeService:
         
         # Ferma la webcam virtuale
         if self._virtual_camera_enabled:
+            self.remove_frame_listener(self._on_virtual_camera_frame)
             self.virtual_camera.stop()
             
         self.cleanup()
@@ -249,6 +395,61 @@ class CLEyeService:
         
         logging.info("Parametri della telecamera configurati")
 
+    def create_effect_chain(self, frame_budget_ms: float = 1000.0 / 30):
+        """
+        Crea una catena di effetti configurata per i frame di questo servizio
+        
+        La catena conosce il formato dei frame (RGBA), quindi gli effetti che
+        dipendono dall'ordine dei canali lo interpretano correttamente, e il
+        bilanciamento del bianco può riportare i guadagni nella telecamera.
+        
+        Args:
+            frame_budget_ms: Tempo disponibile per frame (ms)
+            
+        Returns:
+            VideoEffectChain: Catena con tutti gli effetti disattivati
+        """
+        # Importato qui: la catena serve solo a chi applica effetti
+        from effects.chain import VideoEffectChain
+        chain = VideoEffectChain(frame_budget_ms)
+        chain.set_pixel_format(self.pixel_format)
+        chain.set_hardware_sink(self.apply_white_balance_gains)
+        return chain
+
+    def apply_white_balance_gains(self, gains: Dict[str, float]) -> bool:
+        """
+        Moltiplica i registri WHITEBALANCE_* della telecamera per i guadagni indicati
+
+        Usato come hardware_sink di AutoWhiteBalanceEffect: la correzione
+        stimata in software viene spostata nel sensore.
+
+        Args:
+            gains: Guadagni per 'red', 'green' e 'blue'
+
+        Returns:
+            bool: True se tutti i registri sono stati scritti
+        """
+        if not (self.camera and self.camera._camera):
+            return False
+
+        registers = {
+            'red': CLEyeCameraParameter.CLEYE_WHITEBALANCE_RED,
+            'green': CLEyeCameraParameter.CLEYE_WHITEBALANCE_GREEN,
+            'blue': CLEyeCameraParameter.CLEYE_WHITEBALANCE_BLUE
+        }
+        success = bool(self.camera.set_parameter(CLEyeCameraParameter.CLEYE_AUTO_WHITEBALANCE, 0))
+        for color, param in registers.items():
+            current = self.camera.get_parameter(param)
+            if current < 0:
+                return False
+            value = int(round(min(255, max(0, current * gains.get(color, 1.0)))))
+            if value != current:
+                success &= bool(self.camera.set_parameter(param, value))
+
+        if not success:
+            logging.warning("Impossibile scrivere il bilanciamento del bianco nella telecamera")
+        return success
+
     def get_status(self) -> Dict[str, Any]:
         """
         Ottiene lo stato corrente del servizio
@@ -262,14 +463,17 @@ class CLEyeService:
             'frame_count': self._frame_count,
             'last_error': None,
             'uptime': time.time() - self._start_time if self._start_time else 0,
-            'fps': self._frame_count / (time.time() - self._start_time) if self._start_time else 0
+            'fps': self._frame_count / (time.time() - self._start_time) if self._start_time else 0,
+            'change_detection': self.change_detector.stats,
+            'upscale': self.upscaler.report() if self.upscaler else None,
+            'virtual_camera': self.virtual_camera.stats if self._virtual_camera_enabled else None
         }
         
         if self.camera and self.camera._camera:
             status.update({
                 'connected': True,
-                'resolution': (640, 480),
-                'color_mode': 'RGBA',
+                'resolution': self.capture_size,
+                'color_mode': self.pixel_format.value,
                 'framerate': 30,
                 'parameters': {
                     'gain': self.camera.get_parameter(CLEyeCameraParameter.CLEYE_GAIN),
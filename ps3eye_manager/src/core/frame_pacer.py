@@ -0,0 +1,253 @@
+"""
+Cadenza di uscita comune a tutti i consumatori dei frame (webcam virtuale, stream MJPEG)
+
+Il pacer genera scadenze assolute sull'orologio monotono (inizio + n * periodo),
+quindi gli errori di una singola attesa non si accumulano. A ogni scadenza il
+consumatore prende l'ultimo frame disponibile e il pacer riconcilia i due
+orologi: se dalla scadenza precedente non è arrivato un frame nuovo si
+ripete l'ultimo (o si salta l'invio), se ne sono arrivati più di uno quelli
+intermedi risultano scartati. Una piccola correzione di fase sposta le
+scadenze verso l'arrivo dei frame, così una deriva lenta tra l'orologio
+della telecamera e quello di uscita non produce coppie periodiche di
+duplicati e scarti.
+
+Esempio:
+    pacer = FramePacer(30)
+    while running:
+        pacer.wait()
+        frame, sequence, captured_at = latest()
+        action = pacer.reconcile(sequence)
+        if action != FramePacer.SKIP:
+            send(frame)
+            pacer.sent(captured_at)
+    print(pacer.stats)
+"""
+import time
+import threading
+import numpy as np
+from typing import Any, Dict, Optional, Sequence
+
+# Limiti delle classi degli istogrammi, in frazioni del periodo di uscita
+INTERVAL_EDGES = (0.25, 0.5, 0.75, 0.9, 0.95, 1.05, 1.1, 1.25, 1.5, 2.0, 3.0)
+AGE_EDGES = (0.1, 0.25, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0)
+
+
+class Histogram:
+    """Istogramma a classi fisse con media, massimo e percentili approssimati"""
+
+    def __init__(self, edges: Sequence[float]):
+        """
+        Args:
+            edges: Limiti superiori crescenti delle classi; l'ultima classe è aperta
+        """
+        self.edges = tuple(edges)
+        self.counts = np.zeros(len(self.edges) + 1, np.int64)
+        self.total = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def add(self, value: float):
+        self.counts[np.searchsorted(self.edges, value, side='right')] += 1
+        self.total += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def reset(self):
+        self.counts[:] = 0
+        self.total = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def percentile(self, q: float) -> float:
+        """Limite superiore della classe che contiene il percentile q (0-100)"""
+        if not self.total:
+            return 0.0
+        index = int(np.searchsorted(np.cumsum(self.counts), self.total * q / 100.0))
+        return float(self.edges[index]) if index < len(self.edges) else self.max
+
+    def summary(self) -> Dict[str, Any]:
+        """Conteggi per classe e statistiche riassuntive"""
+        labels = [f"<{edge:g}" for edge in self.edges] + [f">={self.edges[-1]:g}"]
+        return {
+            'mean': self.sum / self.total if self.total else 0.0,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'max': self.max,
+            'samples': self.total,
+            'bins': dict(zip(labels, self.counts.tolist()))
+        }
+
+
+class FramePacer:
+    """
+    Cadenza di uscita a scadenze assolute con riconciliazione degli orologi
+
+    Gli intervalli tra invii e l'età dei frame al momento dell'invio
+    (tempo dalla cattura) vengono raccolti in istogrammi esposti da stats.
+    """
+
+    # Esiti di reconcile()
+    NEW = 'new'
+    DUPLICATE = 'duplicate'
+    SKIP = 'skip'
+
+    def __init__(
+        self,
+        fps: float,
+        duplicate: bool = True,
+        max_lag_frames: float = 2.0,
+        target_age: float = 0.25,
+        phase_gain: float = 0.05,
+        max_phase_step: float = 0.01
+    ):
+        """
+        Args:
+            fps: Frame rate di uscita
+            duplicate: Se True, senza un frame nuovo si ripete l'ultimo (webcam
+                virtuale); se False l'invio viene saltato (stream MJPEG)
+            max_lag_frames: Ritardo, in periodi, oltre cui le scadenze perse
+                non vengono recuperate ma la cadenza riparte da adesso
+            target_age: Età desiderata del frame all'invio, in frazioni di periodo
+            phase_gain: Frazione dell'errore di età corretta a ogni invio
+            max_phase_step: Spostamento massimo delle scadenze per invio, in
+                frazioni di periodo (limita anche la deriva compensabile)
+        """
+        self.fps = fps
+        self.period = 1.0 / fps
+        self.duplicate = duplicate
+        self.max_lag_frames = max_lag_frames
+        self.target_age = target_age
+        self.phase_gain = phase_gain
+        self.max_phase_step = max_phase_step
+        self._lock = threading.Lock()
+        period_ms = self.period * 1000
+        self.intervals = Histogram([round(edge * period_ms, 2) for edge in INTERVAL_EDGES])
+        self.ages = Histogram([round(edge * period_ms, 2) for edge in AGE_EDGES])
+        self.reset()
+
+    def reset(self, now: Optional[float] = None):
+        """Riparte con la prima scadenza adesso e azzera le statistiche"""
+        with self._lock:
+            self._origin = time.monotonic() if now is None else now
+            self._tick = 0
+            self._last_sequence: Optional[int] = None
+            self._last_sent: Optional[float] = None
+            self._counters = {
+                'ticks': 0,
+                'sent': 0,
+                'new': 0,
+                'duplicated': 0,
+                'skipped': 0,
+                'dropped': 0,
+                'late': 0,
+                'resyncs': 0
+            }
+            self._phase_ms = 0.0
+            self.intervals.reset()
+            self.ages.reset()
+
+    @property
+    def next_deadline(self) -> float:
+        """Prossima scadenza sull'orologio monotono"""
+        return self._origin + self._tick * self.period
+
+    def wait(self, stop_event: Optional[threading.Event] = None) -> bool:
+        """
+        Attende la prossima scadenza
+
+        Se si è in ritardo di più di max_lag_frames periodi le scadenze perse
+        vengono saltate (nessuna raffica di invii per recuperare).
+
+        Args:
+            stop_event: Evento che interrompe l'attesa
+
+        Returns:
+            bool: False se l'attesa è stata interrotta da stop_event
+        """
+        deadline = self.next_deadline
+        now = time.monotonic()
+        if now < deadline:
+            if stop_event is not None:
+                if stop_event.wait(deadline - now):
+                    return False
+            else:
+                time.sleep(deadline - now)
+        else:
+            lag = (now - deadline) / self.period
+            with self._lock:
+                if lag > self.max_lag_frames:
+                    self._tick += int(lag)
+                    self._counters['resyncs'] += 1
+                elif lag > 0.5:
+                    self._counters['late'] += 1
+        with self._lock:
+            self._tick += 1
+            self._counters['ticks'] += 1
+        return True
+
+    def reconcile(self, sequence: Optional[int]) -> str:
+        """
+        Decide cosa inviare alla scadenza corrente
+
+        Args:
+            sequence: Numero di sequenza dell'ultimo frame disponibile (None se
+                non ce n'è ancora uno)
+
+        Returns:
+            str: NEW (frame nuovo), DUPLICATE (ripeti l'ultimo) o SKIP (non inviare)
+        """
+        with self._lock:
+            if sequence is None:
+                self._counters['skipped'] += 1
+                return self.SKIP
+            if sequence == self._last_sequence:
+                if self.duplicate:
+                    self._counters['duplicated'] += 1
+                    return self.DUPLICATE
+                self._counters['skipped'] += 1
+                return self.SKIP
+            if self._last_sequence is not None and sequence > self._last_sequence + 1:
+                self._counters['dropped'] += sequence - self._last_sequence - 1
+            self._last_sequence = sequence
+            self._counters['new'] += 1
+            return self.NEW
+
+    def sent(self, captured_at: Optional[float] = None, fresh: bool = True):
+        """
+        Registra un invio
+
+        Args:
+            captured_at: Istante di cattura del frame inviato (time.monotonic()),
+                per l'istogramma dell'età e la correzione di fase
+            fresh: False per un duplicato: l'età viene registrata ma non
+                corregge la fase
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._counters['sent'] += 1
+            if self._last_sent is not None:
+                self.intervals.add((now - self._last_sent) * 1000)
+            self._last_sent = now
+            if captured_at is None:
+                return
+            age = now - captured_at
+            self.ages.add(age * 1000)
+            if fresh and age < self.period:
+                # Correzione di fase: anticipa le scadenze se i frame aspettano
+                # troppo, le ritarda se arrivano appena prima dell'invio
+                error = age - self.target_age * self.period
+                limit = self.max_phase_step * self.period
+                step = max(-limit, min(limit, error * self.phase_gain))
+                self._origin -= step
+                self._phase_ms -= step * 1000
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        """Contatori, correzione di fase accumulata e istogrammi di intervallo ed età"""
+        with self._lock:
+            stats: Dict[str, Any] = self._counters.copy()
+            stats['fps'] = self.fps
+            stats['phase_correction_ms'] = self._phase_ms
+            stats['interval_ms'] = self.intervals.summary()
+            stats['age_ms'] = self.ages.summary()
+            return stats
@@ -0,0 +1,323 @@
+"""
+Server HTTP leggero per lo streaming MJPEG e gli snapshot JPEG della PS3 Eye
+"""
+import logging
+import threading
+import cv2
+import numpy as np
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, Tuple, Dict, Any, NamedTuple
+from urllib.parse import urlparse
+
+from core.pixel_format import PixelFormat, convert
+from core.frame_pacer import FramePacer
+
+# Logger specifico per il server HTTP
+logger = logging.getLogger('ps3eye.http')
+
+MJPEG_BOUNDARY = 'ps3eyeframe'
+
+class EncodedFrame(NamedTuple):
+    """Ultima codifica JPEG con i suoi metadati"""
+    jpeg: Optional[bytes]
+    sequence: int               # Sequenza del frame (del contenuto, se disponibile)
+    version: int                # Numero progressivo della codifica
+    captured_at: Optional[float]  # Istante di cattura (time.monotonic()), se noto
+
+class JpegEncodeCache:
+    """
+    Cache della codifica JPEG dell'ultimo frame
+
+    Ogni frame viene codificato al massimo una volta, indipendentemente dal
+    numero di client: le richieste che arrivano con lo stesso numero di
+    sequenza ricevono i byte già codificati. Se il servizio espone
+    get_latest_frame_as() il frame viene chiesto già in BGR, condividendo la
+    conversione con gli altri consumatori; se espone get_frame_tag() la
+    chiave è la sequenza del contenuto, quindi i frame invariati non vengono
+    né convertiti né ricodificati e lo stream MJPEG non li ritrasmette.
+    """
+
+    def __init__(self, camera_service, quality: int = 80, color_mode: str = 'RGBA'):
+        """
+        Args:
+            camera_service: Servizio che espone get_latest_frame()
+            quality: Qualità JPEG (0-100)
+            color_mode: Ordine dei canali dei frame sorgente ('RGBA', 'BGRA', 'RGB', 'BGR', 'GRAY'),
+                usato solo se il servizio non converte i frame
+        """
+        self.camera_service = camera_service
+        self.quality = quality
+        self.color_mode = color_mode
+        self.pixel_format = PixelFormat.parse(color_mode)
+        self._lock = threading.Lock()
+        self._sequence = None
+        self._jpeg: Optional[bytes] = None
+        self._version = 0
+        self._captured_at: Optional[float] = None
+        self._stats = {
+            'encodes': 0,
+            'hits': 0
+        }
+
+    def get(self) -> Tuple[Optional[bytes], int]:
+        """
+        Restituisce il JPEG dell'ultimo frame disponibile
+
+        Returns:
+            Tuple[Optional[bytes], int]: Byte JPEG (o None) e numero di sequenza
+            (del contenuto, se il servizio rileva i frame invariati)
+        """
+        encoded = self.latest()
+        return encoded.jpeg, encoded.sequence
+
+    def latest(self) -> EncodedFrame:
+        """
+        Come get(), con il numero progressivo della codifica e l'istante di cattura
+
+        Il numero di codifica avanza di uno per ogni JPEG nuovo: uno stream
+        che vede un salto ha perso le codifiche intermedie.
+        """
+        get_tag = getattr(self.camera_service, 'get_frame_tag', None)
+        tag = get_tag() if get_tag is not None else None
+        content_sequence = tag.content_sequence if tag is not None else None
+        if content_sequence is not None:
+            with self._lock:
+                if content_sequence == self._sequence and self._jpeg is not None:
+                    self._stats['hits'] += 1
+                    return EncodedFrame(self._jpeg, content_sequence, self._version, self._captured_at)
+
+        get_as = getattr(self.camera_service, 'get_latest_frame_as', None)
+        if get_as is not None:
+            frame, sequence = get_as(PixelFormat.BGR)
+            source = PixelFormat.BGR
+        else:
+            frame, sequence = self.camera_service.get_latest_frame()
+            source = self.pixel_format
+        if frame is None:
+            return EncodedFrame(None, sequence, self._version, None)
+        if content_sequence is not None:
+            # Il frame letto può essere più recente dell'etichetta: al più
+            # viene codificato un contenuto più nuovo sotto la stessa chiave
+            sequence = content_sequence
+
+        # La codifica avviene sotto lock: le richieste concorrenti per lo
+        # stesso frame attendono e riusano il risultato
+        with self._lock:
+            if sequence == self._sequence and self._jpeg is not None:
+                self._stats['hits'] += 1
+                return EncodedFrame(self._jpeg, sequence, self._version, self._captured_at)
+
+            jpeg = self._encode(frame, source)
+            if jpeg is None:
+                return EncodedFrame(None, sequence, self._version, None)
+
+            self._jpeg = jpeg
+            self._sequence = sequence
+            self._version += 1
+            self._captured_at = getattr(tag, 'captured_at', None) or None
+            self._stats['encodes'] += 1
+            return EncodedFrame(jpeg, sequence, self._version, self._captured_at)
+
+    def _encode(self, frame: np.ndarray, source: PixelFormat) -> Optional[bytes]:
+        """Codifica un frame in JPEG (imencode vuole BGR o scala di grigi)"""
+        try:
+            if frame.ndim == 3 and frame.shape[2] == source.channels:
+                frame = convert(frame, source, PixelFormat.BGR)
+
+            ok, encoded = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+            if not ok:
+                logger.error("Codifica JPEG fallita")
+                return None
+            return encoded.tobytes()
+        except Exception as e:
+            logger.error(f"Errore nella codifica JPEG: {e}")
+            return None
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        """Statistiche della cache"""
+        with self._lock:
+            return self._stats.copy()
+
+
+class _FrameRequestHandler(BaseHTTPRequestHandler):
+    """Gestisce le richieste HTTP di stream e snapshot"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path in ('/', '/stream', '/stream.mjpg'):
+            self._send_stream()
+        elif path in ('/snapshot', '/snapshot.jpg'):
+            self._send_snapshot()
+        else:
+            self.send_error(404, "Risorsa non trovata")
+
+    def _send_snapshot(self):
+        """Invia un singolo frame JPEG"""
+        jpeg, sequence = self.server.frame_server.cache.get()
+        if jpeg is None:
+            self.send_error(503, "Frame non disponibile")
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/jpeg')
+        self.send_header('Content-Length', str(len(jpeg)))
+        self.send_header('Cache-Control', 'no-cache, no-store, must-revalidate')
+        self.send_header('X-Frame-Sequence', str(sequence))
+        self.end_headers()
+        self.wfile.write(jpeg)
+
+    def _send_stream(self):
+        """Invia lo stream multipart/x-mixed-replace finché il client resta connesso"""
+        frame_server = self.server.frame_server
+
+        self.send_response(200)
+        self.send_header('Content-Type', f'multipart/x-mixed-replace; boundary={MJPEG_BOUNDARY}')
+        self.send_header('Cache-Control', 'no-cache, no-store, must-revalidate')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+
+        # Cadenza a scadenze assolute; i frame invariati non vengono ritrasmessi
+        pacer = FramePacer(frame_server.max_fps, duplicate=False)
+        frame_server.add_pacer(pacer)
+        try:
+            while frame_server.running and pacer.wait():
+                encoded = frame_server.cache.latest()
+                version = encoded.version if encoded.jpeg is not None else None
+                if pacer.reconcile(version) == FramePacer.SKIP:
+                    continue
+
+                jpeg = encoded.jpeg
+                header = (
+                    f'--{MJPEG_BOUNDARY}\r\n'
+                    f'Content-Type: image/jpeg\r\n'
+                    f'Content-Length: {len(jpeg)}\r\n'
+                    f'X-Frame-Sequence: {encoded.sequence}\r\n\r\n'
+                ).encode('ascii')
+                self.wfile.write(header)
+                self.wfile.write(jpeg)
+                self.wfile.write(b'\r\n')
+                self.wfile.flush()
+                pacer.sent(encoded.captured_at)
+        except (BrokenPipeError, ConnectionResetError, ConnectionAbortedError):
+            logger.debug(f"Client stream {self.client_address} disconnesso")
+        finally:
+            frame_server.remove_pacer(pacer)
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.client_address[0]} - {format % args}")
+
+
+class MJPEGServer:
+    """Server HTTP per stream MJPEG e snapshot JPEG, affiancato a CameraServer"""
+
+    def __init__(self, camera_service, quality: int = 80, max_fps: int = 30):
+        self.camera_service = camera_service
+        self.cache = JpegEncodeCache(camera_service, quality=quality)
+        self.max_fps = max_fps
+        self._pacers = []
+        self.running = False
+        self._httpd: Optional[ThreadingHTTPServer] = None
+        self._thread = None
+        self._lock = threading.Lock()
+        logger.debug("Server HTTP inizializzato")
+
+    def start(self, host: str = 'localhost', port: int = 8080) -> bool:
+        """
+        Avvia il server HTTP
+
+        Args:
+            host: Host su cui avviare il server
+            port: Porta su cui avviare il server
+
+        Returns:
+            bool: True se il server è stato avviato con successo
+        """
+        with self._lock:
+            if self.running:
+                logger.warning("Il server HTTP è già in esecuzione")
+                return True
+
+            try:
+                self._httpd = ThreadingHTTPServer((host, port), _FrameRequestHandler)
+                self._httpd.daemon_threads = True
+                self._httpd.frame_server = self
+
+                self.running = True
+                self._thread = threading.Thread(target=self._httpd.serve_forever, kwargs={'poll_interval': 0.5})
+                self._thread.daemon = True
+                self._thread.start()
+
+                logger.info(f"Server HTTP avviato su http://{host}:{self._httpd.server_address[1]}")
+                return True
+
+            except Exception as e:
+                logger.error(f"Errore nell'avvio del server HTTP: {e}", exc_info=True)
+                self.running = False
+                if self._httpd:
+                    self._httpd.server_close()
+                    self._httpd = None
+                return False
+
+    def stop(self):
+        """Ferma il server HTTP"""
+        with self._lock:
+            if not self.running:
+                return
+
+            logger.info("Arresto del server HTTP in corso...")
+            self.running = False
+
+            if self._httpd:
+                self._httpd.shutdown()
+                self._httpd.server_close()
+                self._httpd = None
+
+            if self._thread and self._thread.is_alive():
+                self._thread.join(timeout=1.0)
+            self._thread = None
+
+            logger.info("Server HTTP arrestato")
+
+    def add_pacer(self, pacer: FramePacer):
+        """Registra la cadenza di uno stream attivo"""
+        with self._lock:
+            self._pacers.append(pacer)
+
+    def remove_pacer(self, pacer: FramePacer):
+        """Rimuove la cadenza di uno stream terminato"""
+        with self._lock:
+            if pacer in self._pacers:
+                self._pacers.remove(pacer)
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        """
+        Statistiche del server
+
+        Returns:
+            Dict[str, Any]: statistiche della cache JPEG e, per ogni stream
+            attivo, contatori e istogrammi del FramePacer
+        """
+        with self._lock:
+            pacers = list(self._pacers)
+        return {
+            'cache': self.cache.stats,
+            'streams': [pacer.stats for pacer in pacers]
+        }
+
+    @property
+    def address(self) -> Optional[Tuple[str, int]]:
+        """Indirizzo effettivo su cui il server è in ascolto"""
+        return self._httpd.server_address if self._httpd else None
+
+    def cleanup(self):
+        """Esegue la pulizia delle risorse del server"""
+        self.stop()
+
+    def __del__(self):
+        """Cleanup quando l'oggetto viene distrutto"""
+        self.cleanup()
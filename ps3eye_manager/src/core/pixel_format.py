@@ -0,0 +1,183 @@
+"""
+Formati dei pixel e conversioni condivise
+
+Ogni produttore e consumatore di frame dichiara il proprio formato; le
+conversioni vengono decise una volta sola (la più economica, nessuna se i
+formati coincidono) ed eseguite in buffer preallocati. FrameConversionCache
+condivide tra più consumatori la conversione dello stesso frame, così un
+frame non viene mai convertito due volte nello stesso formato.
+"""
+import threading
+from enum import Enum
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+
+
+class PixelFormat(Enum):
+    """Formato e ordine dei canali di un frame uint8"""
+    RGBA = 'RGBA'
+    BGRA = 'BGRA'
+    RGB = 'RGB'
+    BGR = 'BGR'
+    GRAY = 'GRAY'
+
+    @property
+    def channels(self) -> int:
+        return len(self.value) if self is not PixelFormat.GRAY else 1
+
+    @property
+    def has_alpha(self) -> bool:
+        return self.channels == 4
+
+    @property
+    def red_first(self) -> bool:
+        """True se il primo canale colore è il rosso"""
+        return self.value.startswith('R')
+
+    def shape(self, width: int, height: int) -> Tuple[int, ...]:
+        """Forma dell'array numpy di un frame in questo formato"""
+        return (height, width) if self.channels == 1 else (height, width, self.channels)
+
+    @classmethod
+    def parse(cls, value) -> 'PixelFormat':
+        """Accetta un PixelFormat o il suo nome ('RGBA', 'bgr', ...)"""
+        if isinstance(value, cls):
+            return value
+        try:
+            return cls(str(value).upper())
+        except ValueError:
+            raise ValueError(f"Formato dei pixel sconosciuto: {value}") from None
+
+
+ANY_FORMAT: Tuple[PixelFormat, ...] = tuple(PixelFormat)
+
+
+def conversion_code(src: PixelFormat, dst: PixelFormat) -> Optional[int]:
+    """Codice cv2.cvtColor da src a dst (None se i formati coincidono)"""
+    if src is dst:
+        return None
+    import cv2  # Importato qui: i formati servono anche dove OpenCV non è caricato
+    return getattr(cv2, f'COLOR_{src.value}2{dst.value}')
+
+
+def conversion_cost(src: PixelFormat, dst: PixelFormat) -> int:
+    """
+    Costo relativo di una conversione
+
+    0 se i formati coincidono; scambiare rosso e blu a parità di canali costa
+    meno che cambiare il numero di canali; la scala di grigi perde informazione
+    e viene scelta per ultima.
+    """
+    if src is dst:
+        return 0
+    cost = 1
+    if src.channels != dst.channels:
+        cost += 1
+    if dst is PixelFormat.GRAY:
+        cost += 2
+    return cost
+
+
+def best_format(src: PixelFormat, accepted: Iterable[PixelFormat]) -> PixelFormat:
+    """Formato accettato più economico da raggiungere partendo da src"""
+    accepted = tuple(accepted)
+    if not accepted:
+        raise ValueError("Nessun formato accettato")
+    return min(accepted, key=lambda fmt: conversion_cost(src, fmt))
+
+
+def convert(frame: np.ndarray, src: PixelFormat, dst: PixelFormat,
+            out: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Converte un frame da src a dst
+
+    Se i formati coincidono restituisce il frame stesso senza copiarlo;
+    altrimenti scrive in out se fornito (forma di dst) o in un nuovo array.
+    """
+    code = conversion_code(src, dst)
+    if code is None:
+        return frame
+    import cv2
+    return cv2.cvtColor(frame, code, dst=out)
+
+
+class FrameConversionCache:
+    """
+    Conversioni condivise dell'ultimo frame
+
+    Ogni formato richiesto viene calcolato al massimo una volta per numero di
+    sequenza: più consumatori (MJPEG, webcam virtuale, anteprima) che
+    chiedono lo stesso formato ricevono lo stesso array, da trattare in sola
+    lettura. Per ogni formato ruota un anello di buffer preallocati, quindi un
+    array restituito resta valido anche mentre arrivano i RING_SIZE - 1 frame
+    successivi.
+
+    Esempio:
+        conversions = FrameConversionCache(PixelFormat.RGBA)
+        bgr = conversions.get(frame, sequence, PixelFormat.BGR)
+    """
+
+    RING_SIZE = 3
+
+    def __init__(self, source_format=PixelFormat.RGBA):
+        """
+        Args:
+            source_format: Formato dei frame sorgente
+        """
+        self.source_format = PixelFormat.parse(source_format)
+        self._lock = threading.Lock()
+        self._rings: Dict[PixelFormat, list] = {}
+        self._latest: Dict[PixelFormat, Tuple[int, np.ndarray]] = {}
+        self._stats = {
+            'conversions': 0,
+            'hits': 0
+        }
+
+    def get(self, frame: np.ndarray, sequence: int, target) -> np.ndarray:
+        """
+        Restituisce il frame nel formato target
+
+        Args:
+            frame: Frame sorgente (nel formato source_format)
+            sequence: Numero di sequenza del frame
+            target: Formato richiesto
+
+        Returns:
+            np.ndarray: Il frame stesso se i formati coincidono, altrimenti il
+            buffer condiviso con la conversione
+        """
+        target = PixelFormat.parse(target)
+        if target is self.source_format:
+            return frame
+
+        shape = target.shape(frame.shape[1], frame.shape[0])
+        with self._lock:
+            latest = self._latest.get(target)
+            if latest is not None and latest[0] == sequence and latest[1].shape == shape:
+                self._stats['hits'] += 1
+                return latest[1]
+
+            ring = self._rings.get(target)
+            if ring is None or ring[0].shape != shape:
+                ring = [np.empty(shape, np.uint8) for _ in range(self.RING_SIZE)]
+                self._rings[target] = ring
+            # Il buffer meno recente dell'anello diventa il più recente
+            buffer = ring.pop(0)
+            ring.append(buffer)
+            convert(frame, self.source_format, target, out=buffer)
+            self._latest[target] = (sequence, buffer)
+            self._stats['conversions'] += 1
+            return buffer
+
+    def clear(self):
+        """Libera i buffer (ad esempio dopo un cambio di risoluzione)"""
+        with self._lock:
+            self._rings.clear()
+            self._latest.clear()
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """Conversioni eseguite e richieste servite dalla cache"""
+        with self._lock:
+            return self._stats.copy()
@@ -0,0 +1,274 @@
+"""
+Protocollo dei frame in memoria condivisa tra il servizio e il driver della webcam virtuale
+
+Layout (little-endian, versione 1):
+
+    Intestazione (64 byte)
+      0  magic          4s   b'PS3F'
+      4  version        u16
+      6  header_size    u16  dimensione dell'intestazione (64)
+      8  slot_count     u32  numero di slot (3 = triplo buffer)
+     12  width          u32
+     16  height         u32
+     20  pixel_format   u32  vedi FORMAT_CODES
+     24  frame_size     u32  byte di un frame (width * height * canali)
+     28  slot_stride    u32  distanza tra l'inizio di due slot
+     32  latest         u64  (numero di frame << 8) | indice dello slot pubblicato
+     40  riservato fino a 64
+
+    Slot i (a partire da header_size + i * slot_stride)
+      0  seq            u64  contatore del seqlock: dispari durante la scrittura
+      8  frame_number   u64
+     16  timestamp_ns   u64  time.monotonic_ns() della scrittura
+     24  riservato fino a 64
+     64  dati del frame (frame_size byte)
+
+Lo scrittore scrive sempre in uno slot diverso da quello pubblicato: porta
+seq a un valore dispari, copia il frame, riporta seq a un valore pari e solo
+allora pubblica lo slot in latest. Il lettore legge latest, poi seq, copia
+i dati e rilegge seq: se seq era dispari o è cambiato la copia può essere
+incompleta e viene ripetuta. Con tre slot lo scrittore riusa uno slot solo
+due frame dopo averlo pubblicato, quindi un lettore che copia entro un
+periodo di frame non deve quasi mai ripetere.
+
+I campi a 64 bit sono allineati a 8 byte e scritti con un'unica store;
+sulle architetture x86/x64 l'ordine delle store e delle load è garantito
+dall'hardware, quindi non servono barriere esplicite.
+"""
+import os
+import mmap
+import struct
+import time
+import numpy as np
+from typing import Optional, Tuple
+
+from core.pixel_format import PixelFormat
+
+MAGIC = b'PS3F'
+VERSION = 1
+HEADER_SIZE = 64
+SLOT_HEADER_SIZE = 64
+DEFAULT_SLOTS = 3
+
+# Codici dei formati nel campo pixel_format (stabili: letti dal driver)
+FORMAT_CODES = {
+    PixelFormat.RGBA: 1,
+    PixelFormat.BGRA: 2,
+    PixelFormat.RGB: 3,
+    PixelFormat.BGR: 4,
+    PixelFormat.GRAY: 5
+}
+FORMATS_BY_CODE = {code: fmt for fmt, code in FORMAT_CODES.items()}
+
+_HEADER = struct.Struct('<4sHHIIIIII')
+
+# Indici (in parole da 64 bit) dei campi atomici
+_LATEST_WORD = 32 // 8
+_SLOT_SEQ, _SLOT_FRAME, _SLOT_TIME = 0, 1, 2
+
+
+def layout_size(width: int, height: int, pixel_format=PixelFormat.BGR,
+                slots: int = DEFAULT_SLOTS) -> int:
+    """Dimensione totale della memoria condivisa per la geometria indicata"""
+    return HEADER_SIZE + slots * _slot_stride(PixelFormat.parse(pixel_format).channels * width * height)
+
+def _slot_stride(frame_size: int) -> int:
+    # Slot allineati a 64 byte (una linea di cache)
+    return (SLOT_HEADER_SIZE + frame_size + 63) // 64 * 64
+
+
+class SharedFrameBuffer:
+    """
+    Buffer di frame in memoria condivisa con triplo buffer e seqlock
+
+    La memoria è una mappatura con nome (Windows) oppure un file mappato
+    (qualsiasi piattaforma, usato per i test su Linux).
+
+    Esempio:
+        writer = SharedFrameBuffer.create(640, 480, PixelFormat.BGR, name="PS3EyeVirtualCamera_SharedMem")
+        writer.write(frame)
+
+        reader = SharedFrameBuffer.open(path="/tmp/frames.bin")
+        frame, number, timestamp = reader.read()
+    """
+
+    # Tentativi di lettura prima di rinunciare
+    MAX_READ_RETRIES = 1000
+
+    def __init__(self, memory: mmap.mmap, file=None):
+        """Usa create() oppure open()"""
+        self._memory = memory
+        self._file = file
+        magic, version, header_size, slots, width, height, code, frame_size, stride = \
+            _HEADER.unpack_from(memory, 0)
+        if magic != MAGIC:
+            raise ValueError("Memoria condivisa senza intestazione PS3F")
+        if version != VERSION:
+            raise ValueError(f"Versione del protocollo non supportata: {version}")
+        self.width = width
+        self.height = height
+        self.pixel_format = FORMATS_BY_CODE[code]
+        self.slot_count = slots
+        self.frame_size = frame_size
+        self._header_size = header_size
+        self._stride = stride
+
+        # Viste numpy sulla mappatura: campi a 64 bit e dati di ogni slot
+        shape = self.pixel_format.shape(width, height)
+        self._header_words = np.frombuffer(memory, np.uint64, HEADER_SIZE // 8, 0)
+        self._slot_words = []
+        self._slot_frames = []
+        for index in range(slots):
+            offset = header_size + index * stride
+            self._slot_words.append(np.frombuffer(memory, np.uint64, SLOT_HEADER_SIZE // 8, offset))
+            self._slot_frames.append(
+                np.frombuffer(memory, np.uint8, frame_size, offset + SLOT_HEADER_SIZE).reshape(shape))
+        self._frame_number = int(self._header_words[_LATEST_WORD]) >> 8
+        self.read_retries = 0
+
+    @classmethod
+    def create(cls, width: int, height: int, pixel_format=PixelFormat.BGR, name: Optional[str] = None,
+               path: Optional[str] = None, slots: int = DEFAULT_SLOTS) -> 'SharedFrameBuffer':
+        """
+        Crea (o reinizializza) la memoria condivisa e scrive l'intestazione
+
+        Args:
+            width: Larghezza dei frame
+            height: Altezza dei frame
+            pixel_format: Formato dei frame
+            name: Nome della mappatura (solo Windows)
+            path: File da mappare (alternativa a name)
+            slots: Numero di slot (almeno 2)
+        """
+        if slots < 2:
+            raise ValueError("Servono almeno 2 slot")
+        pixel_format = PixelFormat.parse(pixel_format)
+        frame_size = pixel_format.channels * width * height
+        size = layout_size(width, height, pixel_format, slots)
+        memory, file = cls._map(size, name, path, create=True)
+        # Slot azzerati prima dell'intestazione: un lettore vede la magic solo a layout pronto
+        memory[:size] = bytes(size)
+        _HEADER.pack_into(memory, 0, bytes(4), VERSION, HEADER_SIZE, slots, width, height,
+                          FORMAT_CODES[pixel_format], frame_size, _slot_stride(frame_size))
+        memory[0:4] = MAGIC
+        return cls(memory, file)
+
+    @classmethod
+    def open(cls, name: Optional[str] = None, path: Optional[str] = None) -> 'SharedFrameBuffer':
+        """Apre una memoria condivisa già creata da uno scrittore"""
+        memory, file = cls._map(0, name, path, create=False)
+        return cls(memory, file)
+
+    @staticmethod
+    def _map(size: int, name: Optional[str], path: Optional[str], create: bool):
+        if path is not None:
+            file = open(path, 'w+b' if create else 'r+b')
+            if create:
+                file.truncate(size)
+            return mmap.mmap(file.fileno(), size), file
+        if name is None:
+            raise ValueError("Indicare name oppure path")
+        if os.name != 'nt':
+            raise ValueError("Le mappature con nome sono disponibili solo su Windows: usare path")
+        if not size:
+            # Mappatura esistente: la dimensione si ricava dall'intestazione
+            header = mmap.mmap(-1, HEADER_SIZE, name, mmap.ACCESS_READ)
+            try:
+                _, _, header_size, slots, _, _, _, _, stride = _HEADER.unpack_from(header, 0)
+            finally:
+                header.close()
+            size = header_size + slots * stride
+        return mmap.mmap(-1, size, name, mmap.ACCESS_WRITE), None
+
+    @property
+    def frame_number(self) -> int:
+        """Numero dell'ultimo frame pubblicato (0 = nessuno)"""
+        return int(self._header_words[_LATEST_WORD]) >> 8
+
+    def write(self, frame: np.ndarray, timestamp_ns: Optional[int] = None) -> int:
+        """
+        Scrive e pubblica un frame
+
+        Args:
+            frame: Frame nel formato e nella dimensione del buffer
+            timestamp_ns: Istante di cattura (default: time.monotonic_ns())
+
+        Returns:
+            int: Numero del frame pubblicato
+        """
+        return self.publish(lambda view: np.copyto(view, frame), timestamp_ns)
+
+    def publish(self, fill, timestamp_ns: Optional[int] = None) -> int:
+        """
+        Scrive un frame con una funzione che riempie lo slot e lo pubblica
+
+        Permette di convertire direttamente nella memoria condivisa (ad
+        esempio convert(frame, src, dst, out=view)) senza copie intermedie.
+
+        Args:
+            fill: Funzione chiamata con la vista numpy dello slot da riempire
+            timestamp_ns: Istante di cattura (default: time.monotonic_ns())
+        """
+        latest = int(self._header_words[_LATEST_WORD])
+        index = ((latest & 0xFF) + 1) % self.slot_count if latest else 0
+        words = self._slot_words[index]
+
+        words[_SLOT_SEQ] += np.uint64(1)   # Dispari: scrittura in corso
+        fill(self._slot_frames[index])
+        self._frame_number += 1
+        words[_SLOT_FRAME] = self._frame_number
+        words[_SLOT_TIME] = timestamp_ns if timestamp_ns is not None else time.monotonic_ns()
+        words[_SLOT_SEQ] += np.uint64(1)   # Pari: slot consistente
+
+        self._header_words[_LATEST_WORD] = (self._frame_number << 8) | index
+        return self._frame_number
+
+    def read(self, out: Optional[np.ndarray] = None) -> Tuple[Optional[np.ndarray], int, int]:
+        """
+        Copia l'ultimo frame pubblicato
+
+        Args:
+            out: Buffer di destinazione (default: nuovo array)
+
+        Returns:
+            Tuple[Optional[np.ndarray], int, int]: frame (None se non ancora
+            pubblicato), numero del frame e timestamp in nanosecondi
+        """
+        if out is None:
+            out = np.empty(self.pixel_format.shape(self.width, self.height), np.uint8)
+        for _ in range(self.MAX_READ_RETRIES):
+            latest = int(self._header_words[_LATEST_WORD])
+            if not latest:
+                return None, 0, 0
+            words = self._slot_words[latest & 0xFF]
+            seq = int(words[_SLOT_SEQ])
+            if seq & 1:
+                self.read_retries += 1
+                continue
+            np.copyto(out, self._slot_frames[latest & 0xFF])
+            number = int(words[_SLOT_FRAME])
+            timestamp = int(words[_SLOT_TIME])
+            if int(words[_SLOT_SEQ]) == seq:
+                return out, number, timestamp
+            self.read_retries += 1
+        raise TimeoutError("Impossibile leggere un frame consistente")
+
+    def close(self):
+        """Rilascia le viste e chiude la mappatura"""
+        # Le viste numpy vanno rilasciate prima di chiudere la mappatura
+        self._header_words = None
+        self._slot_words = []
+        self._slot_frames = []
+        if self._memory is not None:
+            self._memory.close()
+            self._memory = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __del__(self):
+        """Cleanup quando l'oggetto viene distrutto"""
+        try:
+            self.close()
+        except Exception:
+            pass
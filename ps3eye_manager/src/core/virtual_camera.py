@@ -8,7 +8,6 @@ import logging
 import threading
 import numpy as np
 import cv2
-import mmap
 import ctypes
 from ctypes import wintypes
 import win32api
@@ -17,6 +16,9 @@ import win32security
 from pathlib import Path
 from typing import Optional
 
+from core.pixel_format import PixelFormat, convert
+from core.shared_frame import SharedFrameBuffer
+
 class BITMAPINFOHEADER(ctypes.Structure):
     """Struttura Windows per le informazioni dell'immagine"""
     _fields_ = [
@@ -36,43 +38,60 @@ class BITMAPINFOHEADER(ctypes.Structure):
 class VirtualCamera:
     """Gestisce il driver della webcam virtuale"""
     
+    # Formato dei frame nella memoria condivisa letta dal driver
+    pixel_format = PixelFormat.BGR
+    
     def __init__(self):
         self.running = False
         self.thread = None
         self._frame_callback = None
+        self._source_format = self.pixel_format
         self._lock = threading.Lock()
-        self._shared_memory = None
+        self._frames: Optional[SharedFrameBuffer] = None
         self._map_name = "PS3EyeVirtualCamera_SharedMem"
+        # Notifiche dei nuovi frame: l'ultima sequenza notificata e l'ultima pubblicata
+        self._frame_ready = threading.Condition()
+        self._notified_sequence = 0
+        self._published_sequence = 0
+        self._stats = {
+            'notified': 0,
+            'published': 0,
+            'skipped': 0
+        }
         
-    def start(self, width: int = 640, height: int = 480, fps: int = 30, frame_callback=None) -> bool:
+    def start(self, width: int = 640, height: int = 480, fps: int = 30, frame_callback=None,
+              source_format=PixelFormat.BGR) -> bool:
         """
         Avvia la webcam virtuale
         
         Args:
             width: Larghezza del frame
             height: Altezza del frame
-            fps: Frame rate
-            frame_callback: Callback chiamato quando serve un nuovo frame
+            fps: Frame rate nominale (i frame vengono pubblicati al ritmo di notify_frame)
+            frame_callback: Callback chiamato dopo ogni notifica, nel thread della
+                webcam virtuale; restituisce (frame, numero di sequenza)
+            source_format: Formato dei frame restituiti dal callback
             
         Returns:
             bool: True se l'avvio è riuscito
         """
         try:
             self._frame_callback = frame_callback
-            
-            # Dimensione del buffer condiviso
-            buffer_size = width * height * 3  # BGR 24-bit
+            self._source_format = PixelFormat.parse(source_format)
+            self._notified_sequence = self._published_sequence = 0
             
             try:
                 # Crea/apri la memoria condivisa
                 security_attributes = win32security.SECURITY_ATTRIBUTES()
                 security_attributes.bInheritHandle = True
                 
-                self._shared_memory = mmap.mmap(
-                    -1,  # Crea nuovo mapping
-                    buffer_size,
-                    self._map_name,
-                    mmap.ACCESS_WRITE
+                # Intestazione versionata e triplo buffer con seqlock (vedi
+                # core.shared_frame): il driver non vede mai frame parziali
+                self._frames = SharedFrameBuffer.create(
+                    width,
+                    height,
+                    self.pixel_format,
+                    name=self._map_name
                 )
                 
                 logging.info(f"Memoria condivisa creata: {width}x{height}@{fps}fps")
@@ -94,51 +113,89 @@ class VirtualCamera:
             self.cleanup()
             return False
             
-    def _stream_loop(self):
-        """Loop principale per lo streaming dei frame"""
-        last_frame_time = time.time()
-        frame_interval = 1.0 / 30  # 30 FPS
+    def notify_frame(self, sequence: int):
+        """
+        Segnala che è disponibile un nuovo frame
         
-        while self.running and self._shared_memory:
+        Non blocca: il thread della webcam virtuale si sveglia, chiede il
+        frame al callback e lo pubblica. Se arrivano più notifiche mentre è
+        occupato viene pubblicato solo il frame più recente.
+        
+        Args:
+            sequence: Numero di sequenza del nuovo frame
+        """
+        with self._frame_ready:
+            self._notified_sequence = sequence
+            self._stats['notified'] += 1
+            self._frame_ready.notify()
+
+    def _stream_loop(self):
+        """Pubblica ogni nuovo frame notificato una sola volta"""
+        while self.running and self._frames:
+            with self._frame_ready:
+                while self.running and self._notified_sequence <= self._published_sequence:
+                    self._frame_ready.wait()
+                if not self.running:
+                    break
+            
             try:
-                current_time = time.time()
-                
-                # Rispetta il frame rate
-                if current_time - last_frame_time < frame_interval:
-                    time.sleep(0.001)
+                frame, sequence = self._frame_callback()
+                # Il callback può restituire un frame più recente di quello
+                # notificato: la notifica successiva non lo ripubblicherà
+                if frame is None or sequence <= self._published_sequence:
+                    with self._frame_ready:
+                        self._published_sequence = max(self._published_sequence, self._notified_sequence)
                     continue
-                
-                # Ottieni il frame dal callback
-                if self._frame_callback:
-                    frame = self._frame_callback()
-                    if frame is not None:
-                        # Copia il frame nella memoria condivisa
-                        with self._lock:
-                            self._shared_memory.seek(0)
-                            self._shared_memory.write(frame.tobytes())
-                
-                last_frame_time = current_time
+                self._write_frame(frame)
+                if self._published_sequence:
+                    self._stats['skipped'] += sequence - self._published_sequence - 1
+                self._published_sequence = sequence
+                self._stats['published'] += 1
                 
             except Exception as e:
                 logging.error(f"Errore nello streaming del frame: {e}")
                 time.sleep(0.1)
                 
+    @property
+    def stats(self) -> dict:
+        """Frame notificati, pubblicati e saltati perché già superati"""
+        with self._frame_ready:
+            return self._stats.copy()
+                
+    def _write_frame(self, frame: np.ndarray):
+        """Scrive e pubblica un frame nella memoria condivisa nel formato del driver"""
+        with self._lock:
+            frames = self._frames
+            if frames is None:
+                return
+            if frame.shape[:2] != (frames.height, frames.width):
+                logging.warning(f"Frame {frame.shape[1]}x{frame.shape[0]} diverso dal buffer "
+                                f"{frames.width}x{frames.height}, ignorato")
+                return
+            if self._source_format is self.pixel_format:
+                frames.write(frame)
+            else:
+                # Conversione direttamente nello slot della memoria condivisa
+                frames.publish(lambda view: convert(frame, self._source_format, self.pixel_format, out=view))
+
     def stop(self):
         """Ferma la webcam virtuale"""
-        self.running = False
+        with self._frame_ready:
+            self.running = False
+            self._frame_ready.notify_all()
         if self.thread:
             self.thread.join(timeout=5)
         self.cleanup()
         
     def cleanup(self):
         """Pulisce le risorse"""
-        if self._shared_memory:
+        with self._lock:
+            frames, self._frames = self._frames, None
+        if frames:
             try:
-                self._shared_memory.close()
+                frames.close()
             except Exception as e:
                 logging.error(f"Errore nella chiusura della memoria condivisa: {e}")
-            finally:
-                self._shared_memory = None
             
     def __del__(self):
         """Cleanup quando l'oggetto viene distrutto"""
@@ -0,0 +1,78 @@
+// Layout dei frame in memoria condivisa scritti da core/shared_frame.py (versione 1)
+//
+// Intestazione da 64 byte seguita da slot_count slot; ogni slot ha 64 byte
+// di intestazione e i dati del frame. Lo scrittore protegge ogni slot con un
+// seqlock (seq dispari durante la scrittura) e pubblica lo slot in latest
+// solo a scrittura completata: il lettore copia e ripete se seq è cambiato.
+#pragma once
+
+#include <windows.h>
+#include <stdint.h>
+#include <string.h>
+
+#define PS3EYE_FRAME_MAGIC 0x46335350u  // 'PS3F'
+#define PS3EYE_FRAME_VERSION 1
+
+enum PS3EyePixelFormat : uint32_t {
+    PS3EYE_FORMAT_RGBA = 1,
+    PS3EYE_FORMAT_BGRA = 2,
+    PS3EYE_FORMAT_RGB = 3,
+    PS3EYE_FORMAT_BGR = 4,
+    PS3EYE_FORMAT_GRAY = 5
+};
+
+#pragma pack(push, 1)
+struct PS3EyeFrameHeader {
+    uint32_t magic;
+    uint16_t version;
+    uint16_t header_size;
+    uint32_t slot_count;
+    uint32_t width;
+    uint32_t height;
+    uint32_t pixel_format;
+    uint32_t frame_size;
+    uint32_t slot_stride;
+    volatile uint64_t latest;  // (numero di frame << 8) | indice dello slot
+    uint8_t reserved[24];
+};
+
+struct PS3EyeSlotHeader {
+    volatile uint64_t seq;
+    volatile uint64_t frame_number;
+    volatile uint64_t timestamp_ns;
+    uint8_t reserved[40];
+};
+#pragma pack(pop)
+
+static_assert(sizeof(PS3EyeFrameHeader) == 64, "Intestazione di 64 byte");
+static_assert(sizeof(PS3EyeSlotHeader) == 64, "Intestazione dello slot di 64 byte");
+
+// Copia l'ultimo frame pubblicato in dst (almeno frame_size byte).
+// Restituisce il numero del frame, 0 se non ce ne sono o se il layout non è valido.
+inline uint64_t PS3EyeReadLatestFrame(const uint8_t* base, uint8_t* dst, uint64_t* timestamp_ns)
+{
+    const PS3EyeFrameHeader* header = reinterpret_cast<const PS3EyeFrameHeader*>(base);
+    if (header->magic != PS3EYE_FRAME_MAGIC || header->version != PS3EYE_FRAME_VERSION)
+        return 0;
+
+    for (int attempt = 0; attempt < 1000; ++attempt) {
+        uint64_t latest = header->latest;
+        if (latest == 0)
+            return 0;
+        const uint8_t* slot = base + header->header_size + (latest & 0xFF) * header->slot_stride;
+        const PS3EyeSlotHeader* slot_header = reinterpret_cast<const PS3EyeSlotHeader*>(slot);
+
+        uint64_t seq = slot_header->seq;
+        if (seq & 1)
+            continue;
+        MemoryBarrier();
+        memcpy(dst, slot + sizeof(PS3EyeSlotHeader), header->frame_size);
+        uint64_t frame_number = slot_header->frame_number;
+        if (timestamp_ns)
+            *timestamp_ns = slot_header->timestamp_ns;
+        MemoryBarrier();
+        if (slot_header->seq == seq)
+            return frame_number;
+    }
+    return 0;
+}
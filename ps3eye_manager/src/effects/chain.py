@@ -0,0 +1,481 @@
+"""
+Catena di effetti video: ordine degli stadi, piano di esecuzione e statistiche
+
+Questo modulo non importa OpenCV né il codice degli effetti: gli effetti
+vengono creati dal registro alla prima attivazione, quindi con nessun
+effetto attivo la catena non costa né tempo di avvio né memoria.
+"""
+import time
+import threading
+import numpy as np
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from effects.timing import StageTimer
+from effects.tiling import TiledExecutor, tile_halo
+from effects.registry import EffectRegistry, get_registry
+from core.pixel_format import PixelFormat
+
+class FrameArena:
+    """
+    Coppia di buffer preallocati, dimensionati sullo stream
+    
+    Gli stadi della catena scrivono alternativamente nell'uno e nell'altro
+    (ping-pong), quindi a regime non viene allocato alcun frame.
+    """
+    
+    def __init__(self):
+        self._buffers = [None, None]
+        self.allocations = 0
+    
+    def buffer(self, index: int, like: np.ndarray) -> np.ndarray:
+        """Restituisce il buffer index (0 o 1) con forma e tipo di like"""
+        buffer = self._buffers[index]
+        if buffer is None or buffer.shape != like.shape or buffer.dtype != like.dtype:
+            buffer = np.empty_like(like)
+            self._buffers[index] = buffer
+            self.allocations += 1
+        return buffer
+    
+    def owns(self, frame: np.ndarray) -> Optional[int]:
+        """Indice del buffer dell'arena che coincide con frame, se esiste"""
+        for index, buffer in enumerate(self._buffers):
+            if buffer is not None and frame is buffer:
+                return index
+        return None
+
+@dataclass
+class EffectStage:
+    """
+    Istanza di un effetto nella catena
+    
+    L'effetto (effect) viene creato solo alla prima attivazione; fino ad
+    allora i parametri impostati restano in params e vengono applicati alla
+    creazione.
+    """
+    stage_id: str
+    effect_type: str
+    effect: Optional[Any] = None
+    enabled: bool = False
+    params: Dict[str, Any] = field(default_factory=dict)
+    # Degradazioni impostate dallo scheduler (non modificano i parametri dell'effetto)
+    scale_override: Optional[float] = None
+    skipped: bool = False
+    reuse_interval: int = 1
+    
+    @property
+    def degraded(self) -> bool:
+        return self.scale_override is not None or self.skipped or self.reuse_interval > 1
+
+class VideoEffectChain:
+    """
+    Gestisce una catena di effetti video che possono essere applicati in sequenza
+    
+    La catena è una lista ordinata di stadi: l'ordine è modificabile e lo
+    stesso tipo di effetto può comparire più volte. Per ogni stadio vengono
+    raccolte statistiche mobili dei tempi di esecuzione.
+    """
+    
+    def __init__(self, frame_budget_ms: float = 1000.0 / 30, registry: Optional[EffectRegistry] = None):
+        self.frame_budget_ms = frame_budget_ms
+        self.registry = registry or get_registry()
+        self.stages: List[EffectStage] = []
+        self._timers: Dict[str, StageTimer] = {}
+        self._total_timer = StageTimer()
+        self._plan = []
+        self._plan_key = None
+        self._plan_reuse: Dict[str, int] = {}
+        self._reuse_cache: Dict[str, Tuple[int, np.ndarray]] = {}
+        self._frame_index = 0
+        self._plan_animated = False
+        self._last_output: Optional[Tuple[Any, np.ndarray]] = None
+        self.frames_reused = 0
+        self._arena = FrameArena()
+        self._tiler: Optional[TiledExecutor] = None
+        self.input_format: Optional[PixelFormat] = None
+        self.output_format: Optional[PixelFormat] = None
+        self._plan_format: Optional[PixelFormat] = None
+        # Destinazione delle correzioni riportate nella telecamera (vedi set_hardware_sink)
+        self.hardware_sink: Optional[Callable[[Dict[str, float]], bool]] = None
+        self._lock = threading.RLock()
+        self._create_default_stages()
+    
+    def _create_default_stages(self):
+        """Uno stadio disattivato per ogni tipo registrato, con id uguale al nome del tipo"""
+        self.stages = [EffectStage(name, name) for name in self.registry.names()]
+        self._timers.clear()
+    
+    def _instantiate(self, stage: EffectStage):
+        """Crea l'effetto dello stadio (importandone il codice alla prima richiesta)"""
+        if stage.effect is None:
+            effect = self.registry.create(stage.effect_type)
+            effect.set_params(**stage.params)
+            if hasattr(effect, 'hardware_sink') and effect.hardware_sink is None:
+                effect.hardware_sink = self.hardware_sink
+            stage.effect = effect
+        return stage.effect
+    
+    @property
+    def effects(self) -> Dict[str, Any]:
+        """
+        Effetti della catena indicizzati per id dello stadio, nell'ordine di applicazione
+        
+        Crea gli effetti non ancora istanziati: per conoscere solo gli stadi
+        usare stages.
+        """
+        return {stage.stage_id: self._instantiate(stage) for stage in self.stages}
+    
+    @property
+    def active_effects(self) -> Dict[str, bool]:
+        """Stato di attivazione di ogni stadio, nell'ordine di applicazione"""
+        return {stage.stage_id: stage.enabled for stage in self.stages}
+    
+    def get_stage(self, stage_id: str) -> Optional[EffectStage]:
+        """Restituisce lo stadio con l'id indicato"""
+        for stage in self.stages:
+            if stage.stage_id == stage_id:
+                return stage
+        return None
+    
+    def add_effect(self, effect_type: str, index: Optional[int] = None,
+                   enabled: bool = True, **params) -> str:
+        """
+        Aggiunge un'istanza di un effetto alla catena
+        
+        Args:
+            effect_type: Tipo di effetto (nome nel registro)
+            index: Posizione nella catena (None = in coda)
+            enabled: Se True l'effetto viene attivato subito
+            **params: Parametri iniziali dell'effetto
+            
+        Returns:
+            str: Id del nuovo stadio
+        """
+        if effect_type not in self.registry:
+            raise ValueError(f"Tipo di effetto sconosciuto: {effect_type}")
+        
+        with self._lock:
+            existing = {stage.stage_id for stage in self.stages}
+            stage_id, n = effect_type, 1
+            while stage_id in existing:
+                n += 1
+                stage_id = f"{effect_type}#{n}"
+            
+            stage = EffectStage(stage_id, effect_type, enabled=enabled, params=dict(params))
+            if enabled:
+                self._instantiate(stage)
+            self.stages.insert(len(self.stages) if index is None else index, stage)
+            return stage_id
+    
+    def remove_effect(self, stage_id: str) -> bool:
+        """Rimuove uno stadio dalla catena"""
+        with self._lock:
+            stage = self.get_stage(stage_id)
+            if stage is None:
+                return False
+            self.stages.remove(stage)
+            return True
+    
+    def move_effect(self, stage_id: str, index: int) -> bool:
+        """Sposta uno stadio nella posizione indicata"""
+        with self._lock:
+            stage = self.get_stage(stage_id)
+            if stage is None:
+                return False
+            self.stages.remove(stage)
+            self.stages.insert(max(0, min(index, len(self.stages))), stage)
+            return True
+    
+    def set_order(self, stage_ids: List[str]):
+        """Riordina la catena; gli stadi non elencati restano in coda nell'ordine attuale"""
+        with self._lock:
+            by_id = {stage.stage_id: stage for stage in self.stages}
+            ordered = [by_id[stage_id] for stage_id in stage_ids if stage_id in by_id]
+            self.stages = ordered + [stage for stage in self.stages if stage not in ordered]
+    
+    def toggle_effect(self, effect_name: str, active: bool = True):
+        """Attiva o disattiva un effetto"""
+        stage = self.get_stage(effect_name)
+        if stage is not None:
+            if active:
+                self._instantiate(stage)
+            stage.enabled = active
+    
+    def set_effect_params(self, effect_name: str, **params):
+        """Imposta i parametri per un effetto specifico"""
+        stage = self.get_stage(effect_name)
+        if stage is None:
+            return
+        stage.params.update(params)
+        if stage.effect is not None:
+            stage.effect.set_params(**params)
+    
+    def set_effect_param(self, effect_name: str, param: str, value):
+        """Imposta un singolo parametro di un effetto"""
+        self.set_effect_params(effect_name, **{param: value})
+    
+    def reset_all(self):
+        """Ripristina la catena predefinita: tutti gli effetti disattivati con parametri iniziali"""
+        with self._lock:
+            self._create_default_stages()
+            self._total_timer.reset()
+    
+    def set_tiling(self, enabled: bool, bands: Optional[int] = None):
+        """
+        Attiva o disattiva l'esecuzione a bande degli effetti locali
+        
+        Gli effetti locali (sfocatura, nitidezza, bordi, specchio e gli effetti
+        puntuali) vengono divisi in bande orizzontali elaborate in parallelo
+        sul pool di thread condiviso. Gli altri restano su un solo thread.
+        
+        Args:
+            enabled: Se True usa l'esecuzione a bande
+            bands: Numero di bande (default: numero di core)
+        """
+        with self._lock:
+            self._tiler = TiledExecutor(bands) if enabled else None
+    
+    @property
+    def tiling(self) -> bool:
+        """True se l'esecuzione a bande è attiva"""
+        return self._tiler is not None
+    
+    def set_pixel_format(self, input_format, output_format=None):
+        """
+        Dichiara il formato dei frame in ingresso e quello richiesto in uscita
+        
+        Con il formato noto la catena inserisce solo le conversioni necessarie
+        agli effetti che dipendono dall'ordine dei canali (accepted_formats),
+        ciascuna una volta sola e fusa con gli effetti puntuali adiacenti. Le
+        conversioni interne alla catena non cambiano il numero di canali.
+        
+        Args:
+            input_format: Formato dei frame passati ad apply_effects (None = sconosciuto)
+            output_format: Formato del risultato con effetti attivi (default: quello
+                dell'ultimo effetto); result_format indica quello effettivo
+        """
+        with self._lock:
+            self.input_format = PixelFormat.parse(input_format) if input_format is not None else None
+            self.output_format = PixelFormat.parse(output_format) if output_format is not None else None
+            self._plan_key = None
+    
+    def set_hardware_sink(self, sink: Optional[Callable[[Dict[str, float]], bool]]):
+        """
+        Imposta la funzione che scrive le correzioni nei registri della telecamera
+        
+        Viene passata come hardware_sink agli effetti che la prevedono (ad
+        esempio AutoWhiteBalanceEffect), sia a quelli già creati sia a quelli
+        aggiunti in seguito.
+        
+        Args:
+            sink: Funzione chiamata con i guadagni per colore (None = nessuna)
+        """
+        with self._lock:
+            self.hardware_sink = sink
+            for stage in self.stages:
+                if stage.effect is not None and hasattr(stage.effect, 'hardware_sink'):
+                    stage.effect.hardware_sink = sink
+    
+    @property
+    def result_format(self) -> Optional[PixelFormat]:
+        """Formato del risultato dell'ultimo piano compilato (None se sconosciuto)"""
+        return self._plan_format
+    
+    def _negotiate_formats(self, effects: List[Tuple[str, Any]], channels: int) -> List[Tuple[str, Any]]:
+        """
+        Inserisce le conversioni di formato richieste dagli effetti
+        
+        Ogni effetto riceve in input_format il formato dei frame che gli
+        arrivano; una conversione viene aggiunta solo quando il formato
+        corrente non è tra quelli accettati dall'effetto.
+        """
+        current = self.input_format
+        if current is None or current.channels != channels:
+            # Formato sconosciuto o diverso da quello dichiarato: nessuna conversione
+            self._plan_format = current if current is not None and current.channels == channels else None
+            return effects
+        
+        from effects.fusion import FormatSwap
+        negotiated = []
+        for name, effect in effects:
+            accepted = [fmt for fmt in getattr(effect, 'accepted_formats', ()) if fmt.channels == channels]
+            if accepted and current not in accepted:
+                current = accepted[0]
+                negotiated.append((f'format:{current.value}', FormatSwap(current)))
+            effect.input_format = current
+            negotiated.append((name, effect))
+        if self.output_format is not None and self.output_format is not current \
+                and self.output_format.channels == channels:
+            current = self.output_format
+            negotiated.append((f'format:{current.value}', FormatSwap(current)))
+        self._plan_format = current
+        return negotiated
+    
+    def compile(self, channels: int):
+        """
+        Restituisce il piano di esecuzione per la configurazione corrente
+        
+        Il piano viene ricompilato solo quando cambiano gli stadi attivi, il
+        loro ordine, i loro parametri (tramite la versione di ciascun effetto)
+        o le degradazioni impostate dallo scheduler.
+        """
+        with self._lock:
+            active = [stage for stage in self.stages if stage.enabled and not stage.skipped]
+            for stage in active:
+                self._instantiate(stage)
+            key = (channels, self.input_format, self.output_format, tuple(
+                (stage.stage_id, id(stage.effect), stage.effect.version, stage.scale_override, stage.reuse_interval)
+                for stage in active
+            ))
+            if key != self._plan_key:
+                if active:
+                    # Importato qui: il compilatore usa OpenCV, che serve solo con effetti attivi
+                    from effects.fusion import compile_effects
+                    scales = {stage.stage_id: stage.scale_override for stage in active if stage.scale_override}
+                    effects = self._negotiate_formats([(stage.stage_id, stage.effect) for stage in active], channels)
+                    self._plan = compile_effects(effects, channels, scales)
+                    # Riutilizzo del risultato solo per gli stadi rimasti da soli nel piano
+                    intervals = {stage.stage_id: stage.reuse_interval for stage in active if stage.reuse_interval > 1}
+                    self._plan_reuse = {name: intervals[name] for name, _ in self._plan if name in intervals}
+                    self._plan_animated = any(getattr(stage.effect, 'animated', False) for stage in active)
+                else:
+                    self._plan, self._plan_reuse = [], {}
+                    self._plan_animated = False
+                    fmt = self.input_format
+                    self._plan_format = fmt if fmt is not None and fmt.channels == channels else None
+                self._plan_key = key
+            return self._plan
+    
+    def stage_timer(self, name: str) -> StageTimer:
+        """
+        Timer di un passo del piano (creato alla prima richiesta)
+        
+        Usato anche da chi esegue il piano fuori dalla catena (ad esempio
+        PipelinedEffectProcessor), così le statistiche restano in un posto solo.
+        
+        Args:
+            name: Nome del passo nel piano (id dello stadio o gruppo fuso)
+        """
+        timer = self._timers.get(name)
+        if timer is None:
+            timer = self._timers[name] = StageTimer()
+        return timer
+    
+    def stage_stats(self) -> List[Dict[str, Any]]:
+        """
+        Statistiche dei tempi per ogni stadio, nell'ordine della catena
+        
+        Gli effetti fusi in un unico kernel condividono le statistiche del
+        gruppo, indicato dal campo 'group'.
+        """
+        groups = {}
+        for name, _ in self._plan:
+            for stage_id in name.split('+'):
+                groups[stage_id] = name
+        
+        stats = []
+        for stage in self.stages:
+            group = groups.get(stage.stage_id) if stage.enabled else None
+            timer = self._timers.get(group) if group else None
+            entry = {
+                'stage_id': stage.stage_id,
+                'effect_type': stage.effect_type,
+                'enabled': stage.enabled,
+                'group': group,
+                'scale_override': stage.scale_override,
+                'skipped': stage.skipped,
+                'reuse_interval': stage.reuse_interval
+            }
+            entry.update(timer.summary(self.frame_budget_ms) if timer else StageTimer().summary(self.frame_budget_ms))
+            stats.append(entry)
+        return stats
+    
+    def total_stats(self) -> Dict[str, Any]:
+        """Statistiche del tempo totale della catena per frame e frame invariati riutilizzati"""
+        stats = self._total_timer.summary(self.frame_budget_ms)
+        stats['frames_reused'] = self.frames_reused
+        return stats
+    
+    @property
+    def allocation_count(self) -> int:
+        """Buffer allocati finora dall'arena e dagli effetti (costante dopo il riscaldamento)"""
+        tiler = self._tiler.allocations if self._tiler else 0
+        effects = [stage.effect for stage in self.stages if stage.effect is not None]
+        # Stadi del piano che non sono effetti (gruppi a risoluzione ridotta) hanno buffer propri
+        groups = sum(getattr(step, 'allocations', 0) for _, step in self._plan
+                     if not any(step is effect for effect in effects))
+        return (self._arena.allocations + tiler + groups + len(self._reuse_cache) +
+                sum(effect.allocations for effect in effects))
+    
+    def _store_reuse(self, name: str, result: np.ndarray):
+        """Conserva il risultato di uno stadio riutilizzabile"""
+        cached = self._reuse_cache.get(name)
+        if cached is None or cached[1].shape != result.shape or cached[1].dtype != result.dtype:
+            cached = (self._frame_index, result.copy())
+        else:
+            np.copyto(cached[1], result)
+            cached = (self._frame_index, cached[1])
+        self._reuse_cache[name] = cached
+    
+    def apply_effects(self, frame: np.ndarray, unchanged: bool = False) -> np.ndarray:
+        """
+        Applica tutti gli effetti attivi al frame
+        
+        Il risultato è un buffer dell'arena della catena: resta valido fino
+        alla chiamata successiva, chi deve conservarlo ne faccia una copia.
+        
+        Args:
+            frame: Frame da elaborare
+            unchanged: True se il frame non è cambiato in modo significativo
+                rispetto al precedente (FrameTag.changed falso): con lo stesso
+                piano e nessun effetto animato viene restituito il risultato
+                precedente senza rielaborarlo
+        """
+        plan = self.compile(1 if frame.ndim == 2 else frame.shape[2])
+        last = self._last_output
+        if (unchanged and last is not None and last[0] is plan and not self._plan_animated
+                and last[1].shape == frame.shape and last[1].dtype == frame.dtype):
+            self.frames_reused += 1
+            return last[1]
+        result = self._run_plan(plan, frame)
+        self._last_output = (plan, result)
+        return result
+    
+    def _run_plan(self, plan: List[Tuple[str, Any]], frame: np.ndarray) -> np.ndarray:
+        """Esegue il piano sul frame attraverso l'arena"""
+        reuse = self._plan_reuse
+        self._frame_index += 1
+        
+        # Non scrivere mai nel buffer da cui si sta leggendo
+        index = 1 if self._arena.owns(frame) == 0 else 0
+        if not plan:
+            result = self._arena.buffer(index, frame)
+            if result is not frame:
+                np.copyto(result, frame)
+            return result
+        
+        # Gli stadi non modificano mai il frame in ingresso: la copia iniziale non serve
+        result = frame
+        tiler = self._tiler
+        frame_start = time.perf_counter()
+        for name, stage in plan:
+            start = time.perf_counter()
+            dst = self._arena.buffer(index, frame)
+            cached = self._reuse_cache.get(name) if name in reuse else None
+            if (cached is not None and cached[1].shape == frame.shape and
+                    self._frame_index - cached[0] < reuse[name]):
+                # Stadio degradato: si riusa il risultato dell'ultimo calcolo
+                np.copyto(dst, cached[1])
+                result = dst
+            else:
+                halo = tile_halo(stage) if tiler else None
+                if halo is not None:
+                    result = tiler.apply(stage, halo, result, dst)
+                else:
+                    result = stage.apply(result, dst)
+                if name in reuse:
+                    self._store_reuse(name, result)
+            self.stage_timer(name).add((time.perf_counter() - start) * 1000.0)
+            index ^= 1
+        self._total_timer.add((time.perf_counter() - frame_start) * 1000.0)
+        return result
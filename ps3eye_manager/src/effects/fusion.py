@@ -0,0 +1,213 @@
+"""
+Compilatore della catena di effetti: fonde gli effetti puntuali adiacenti in un unico kernel
+e raggruppa gli stadi consecutivi con la stessa scala di elaborazione
+"""
+import cv2
+import numpy as np
+from typing import Dict, List, Optional, Sequence, Tuple
+
+class PointwiseKernel:
+    """
+    Trasformazione puntuale per canale: out[c] = luts[c][in[perm[c]]]
+
+    Due kernel si compongono in modo esatto (saturazione compresa) in un
+    nuovo kernel, quindi una sequenza di effetti puntuali costa una sola
+    passata sul frame.
+    """
+
+    def __init__(self, perm: Sequence[int], luts: np.ndarray):
+        self.perm = np.asarray(perm, dtype=np.intp)
+        self.luts = np.ascontiguousarray(luts, dtype=np.uint8)
+        channels = len(self.perm)
+        self._identity_perm = bool(np.array_equal(self.perm, np.arange(channels)))
+        self._identity_lut = bool(np.array_equal(self.luts, np.tile(np.arange(256, dtype=np.uint8), (channels, 1))))
+        # Tabella nel formato richiesto da cv2.LUT: 1x256 con un canale per canale del frame
+        self._cv_lut = np.ascontiguousarray(self.luts.T).reshape(1, 256, channels)
+        self._mix_pairs = [int(v) for c, p in enumerate(self.perm) for v in (p, c)]
+
+    @classmethod
+    def identity(cls, channels: int) -> 'PointwiseKernel':
+        return cls(np.arange(channels), np.tile(np.arange(256, dtype=np.uint8), (channels, 1)))
+
+    def then(self, other: 'PointwiseKernel') -> 'PointwiseKernel':
+        """Restituisce il kernel equivalente ad applicare self e poi other"""
+        perm = self.perm[other.perm]
+        luts = np.stack([other.luts[c][self.luts[other.perm[c]]] for c in range(len(other.perm))])
+        return PointwiseKernel(perm, luts)
+
+    def apply(self, frame: np.ndarray, dst: Optional[np.ndarray] = None) -> np.ndarray:
+        """Applica il kernel con una sola passata sul frame"""
+        result = dst if dst is not None else np.empty_like(frame)
+        if self._identity_perm:
+            if self._identity_lut:
+                np.copyto(result, frame)
+                return result
+            return cv2.LUT(frame, self._cv_lut if frame.ndim == 3 else self._cv_lut[..., 0], dst=result)
+
+        cv2.mixChannels([frame], [result], self._mix_pairs)
+        if not self._identity_lut:
+            cv2.LUT(result, self._cv_lut, dst=result)
+        return result
+
+
+class FusedStage:
+    """Gruppo di effetti puntuali adiacenti compilato in un unico kernel"""
+
+    def __init__(self, names: List[str], kernel: PointwiseKernel):
+        self.names = names
+        self.kernel = kernel
+
+    def tile_halo(self) -> int:
+        return 0
+
+    def apply(self, frame: np.ndarray, dst: Optional[np.ndarray] = None) -> np.ndarray:
+        return self.kernel.apply(frame, dst)
+
+
+class FormatSwap:
+    """
+    Conversione tra formati con gli stessi canali in ordine diverso (RGB(A) <-> BGR(A))
+
+    È una permutazione dei canali: la catena la inserisce come effetto
+    puntuale, quindi viene fusa con gli effetti puntuali adiacenti e spesso
+    non costa alcuna passata in più sul frame.
+    """
+
+    fusible = True
+
+    def __init__(self, target):
+        self.target = target
+        self._kernels: Dict[int, PointwiseKernel] = {}
+
+    def pointwise_kernel(self, channels: int) -> PointwiseKernel:
+        kernel = self._kernels.get(channels)
+        if kernel is None:
+            perm = np.arange(channels)
+            if channels >= 3:
+                perm[[0, 2]] = perm[[2, 0]]
+            kernel = self._kernels[channels] = PointwiseKernel(perm, PointwiseKernel.identity(channels).luts)
+        return kernel
+
+    def tile_halo(self) -> int:
+        return 0
+
+    def apply(self, frame: np.ndarray, dst: Optional[np.ndarray] = None) -> np.ndarray:
+        return self.pointwise_kernel(frame_channels(frame)).apply(frame, dst)
+
+
+class ScaledStage:
+    """
+    Gruppo di stadi consecutivi eseguiti a risoluzione ridotta
+
+    Il frame viene ridotto una sola volta per tutto il gruppo, gli stadi
+    lavorano sulla copia ridotta e il risultato viene riportato alla
+    risoluzione piena nel buffer di destinazione.
+    """
+
+    def __init__(self, names: List[str], steps: List[Tuple[str, object]], scale: float):
+        self.names = names
+        self.steps = steps
+        self.scale = scale
+        self._buffers: List[Optional[np.ndarray]] = [None, None, None]
+        self.allocations = 0
+
+    def _buffer(self, index: int, shape: Tuple[int, ...], dtype) -> np.ndarray:
+        buffer = self._buffers[index]
+        if buffer is None or buffer.shape != shape or buffer.dtype != dtype:
+            buffer = np.empty(shape, dtype)
+            self._buffers[index] = buffer
+            self.allocations += 1
+        return buffer
+
+    def apply(self, frame: np.ndarray, dst: Optional[np.ndarray] = None) -> np.ndarray:
+        height, width = frame.shape[:2]
+        small_size = (max(1, int(round(width * self.scale))), max(1, int(round(height * self.scale))))
+        shape = (small_size[1], small_size[0]) + frame.shape[2:]
+
+        result = cv2.resize(frame, small_size, dst=self._buffer(0, shape, frame.dtype),
+                            interpolation=cv2.INTER_AREA)
+        index = 1
+        for _, stage in self.steps:
+            result = stage.apply(result, self._buffer(index, shape, frame.dtype))
+            index = 2 if index == 1 else 1
+
+        dst = dst if dst is not None else np.empty_like(frame)
+        return cv2.resize(result, (width, height), dst=dst, interpolation=cv2.INTER_LINEAR)
+
+
+def frame_channels(frame: np.ndarray) -> int:
+    """Numero di canali di un frame"""
+    return 1 if frame.ndim == 2 else frame.shape[2]
+
+def effect_scale(effect, override: Optional[float] = None) -> float:
+    """Scala di elaborazione di un effetto (1.0 = risoluzione piena)"""
+    if not getattr(effect, 'scalable', True):
+        return 1.0
+    params = getattr(effect, 'params', None)
+    scale = float(getattr(params, 'processing_scale', 1.0))
+    if override is not None:
+        scale = min(scale, override)
+    return scale if 0.0 < scale < 1.0 else 1.0
+
+def compile_effects(effects: List[Tuple[str, object]], channels: int,
+                    scales: Optional[Dict[str, float]] = None) -> List[Tuple[str, object]]:
+    """
+    Compila una sequenza di effetti attivi in un piano di esecuzione
+
+    Gli effetti con attributo fusible=True devono esporre
+    pointwise_kernel(channels); quelli adiacenti vengono fusi in un FusedStage.
+    Gli altri restano stadi separati. Gli effetti consecutivi con la stessa
+    processing_scale minore di 1 vengono raccolti in uno ScaledStage che
+    riduce il frame una sola volta (gli effetti puntuali restano sempre a
+    risoluzione piena: ridurli non farebbe risparmiare nulla).
+
+    Args:
+        effects: Coppie (nome, effetto) nell'ordine di applicazione
+        channels: Numero di canali dei frame
+        scales: Scale che sostituiscono processing_scale, per nome (opzionale)
+
+    Returns:
+        List[Tuple[str, object]]: Stadi del piano nell'ordine di esecuzione
+    """
+    scales = scales or {}
+    plan: List[Tuple[str, object]] = []
+
+    # Sequenze consecutive con la stessa scala
+    runs: List[Tuple[float, List[Tuple[str, object]]]] = []
+    for name, effect in effects:
+        scale = 1.0 if getattr(effect, 'fusible', False) else effect_scale(effect, scales.get(name))
+        if runs and runs[-1][0] == scale:
+            runs[-1][1].append((name, effect))
+        else:
+            runs.append((scale, [(name, effect)]))
+
+    for scale, run in runs:
+        if scale == 1.0:
+            plan.extend(_fuse_pointwise(run, channels))
+        else:
+            names = [name for name, _ in run]
+            plan.append(('+'.join(names), ScaledStage(names, _fuse_pointwise(run, channels), scale)))
+    return plan
+
+def _fuse_pointwise(effects: List[Tuple[str, object]], channels: int) -> List[Tuple[str, object]]:
+    """Fonde gli effetti puntuali adiacenti di una sequenza"""
+    plan: List[Tuple[str, object]] = []
+    group_names: List[str] = []
+    group_kernel: Optional[PointwiseKernel] = None
+
+    def flush():
+        nonlocal group_names, group_kernel
+        if group_kernel is not None:
+            plan.append(('+'.join(group_names), FusedStage(group_names, group_kernel)))
+        group_names, group_kernel = [], None
+
+    for name, effect in effects:
+        if getattr(effect, 'fusible', False):
+            kernel = effect.pointwise_kernel(channels)
+            group_kernel = kernel if group_kernel is None else group_kernel.then(kernel)
+            group_names.append(name)
+        else:
+            flush()
+            plan.append((name, effect))
+    flush()
+    return plan
@@ -0,0 +1,389 @@
+"""
+Elaborazione a pipeline della catena di effetti
+
+Il piano compilato della catena viene diviso in gruppi di stadi contigui,
+ognuno eseguito da un proprio thread; i thread comunicano con code limitate.
+Mentre un thread elabora il frame N, il precedente elabora già il frame N+1:
+il throughput è limitato dal gruppo più lento invece che dalla catena intera,
+al costo di una piccola latenza aggiuntiva che viene misurata.
+"""
+import time
+import queue
+import logging
+import threading
+import numpy as np
+from typing import Callable, List, Optional, Tuple, Dict, Any
+
+from effects.fusion import frame_channels
+from effects.timing import StageTimer
+from effects.chain import VideoEffectChain, FrameArena
+
+logger = logging.getLogger('ps3eye.effects')
+
+# Segnale di arresto per i thread della pipeline
+_STOP = object()
+
+class _FrameRing:
+    """Anello di buffer di uscita di un gruppo, riutilizzati a rotazione"""
+
+    def __init__(self, size: int):
+        self._buffers: List[Optional[np.ndarray]] = [None] * size
+        self._index = 0
+        self.allocations = 0
+
+    def next(self, like: np.ndarray) -> np.ndarray:
+        buffer = self._buffers[self._index]
+        if buffer is None or buffer.shape != like.shape or buffer.dtype != like.dtype:
+            buffer = np.empty_like(like)
+            self._buffers[self._index] = buffer
+            self.allocations += 1
+        self._index = (self._index + 1) % len(self._buffers)
+        return buffer
+
+
+class _BufferPool:
+    """
+    Buffer dei frame in ingresso
+
+    A differenza dell'anello, un buffer torna disponibile solo quando viene
+    rilasciato (frame elaborato dal primo gruppo o scartato), quindi lo
+    scarto dei frame in attesa non può sovrascrivere un frame in uso.
+    """
+
+    def __init__(self):
+        self._free: List[np.ndarray] = []
+        self._lock = threading.Lock()
+        self.allocations = 0
+
+    def acquire(self, like: np.ndarray) -> np.ndarray:
+        with self._lock:
+            while self._free:
+                buffer = self._free.pop()
+                if buffer.shape == like.shape and buffer.dtype == like.dtype:
+                    return buffer
+            self.allocations += 1
+        return np.empty_like(like)
+
+    def release(self, buffer: np.ndarray):
+        with self._lock:
+            self._free.append(buffer)
+
+
+class _PipelineWorker:
+    """Thread che esegue un gruppo di stadi contigui del piano"""
+
+    def __init__(self, index: int, ring_size: int):
+        self.index = index
+        self.steps: List[Tuple[str, object]] = []
+        self.input: Optional[queue.Queue] = None
+        self.output: Optional[Callable] = None
+        self.ring = _FrameRing(ring_size)
+        self.arena = FrameArena()
+        self.busy = StageTimer()
+        self.thread: Optional[threading.Thread] = None
+
+    def run_steps(self, frame: np.ndarray, stage_timer: Callable[[str], StageTimer]) -> np.ndarray:
+        """Esegue gli stadi del gruppo; l'ultimo scrive nel buffer dell'anello"""
+        out = self.ring.next(frame)
+        if not self.steps:
+            np.copyto(out, frame)
+            return out
+
+        result = frame
+        index = 0
+        last = len(self.steps) - 1
+        for position, (name, stage) in enumerate(self.steps):
+            if position == last:
+                dst = out
+            else:
+                dst = self.arena.buffer(index, frame)
+                index ^= 1
+            start = time.perf_counter()
+            result = stage.apply(result, dst)
+            stage_timer(name).add((time.perf_counter() - start) * 1000.0)
+        return result
+
+
+class PipelinedEffectProcessor:
+    """
+    Esegue una VideoEffectChain come pipeline di thread
+
+    I frame vengono consegnati a frame_callback(frame, sequence) nell'ordine
+    di sequenza. Il frame consegnato appartiene a un anello di buffer del
+    processore e resta valido finché il callback non restituisce il
+    controllo: chi deve conservarlo ne faccia una copia.
+
+    Con drop_when_behind, se la pipeline non riesce a tenere il passo il
+    frame più vecchio in attesa di ingresso viene scartato a favore del
+    nuovo; altrimenti submit() attende che si liberi posto.
+
+    Esempio:
+        processor = PipelinedEffectProcessor(chain, workers=4)
+        processor.start(frame_callback=on_frame)
+        processor.submit(frame, sequence)
+    """
+
+    def __init__(
+        self,
+        chain: VideoEffectChain,
+        workers: int = 4,
+        queue_size: int = 2,
+        drop_when_behind: bool = True
+    ):
+        """
+        Args:
+            chain: Catena di effetti da eseguire
+            workers: Numero massimo di gruppi di stadi (thread)
+            queue_size: Frame accodati al massimo tra due gruppi
+            drop_when_behind: Se True scarta i frame in ingresso quando la pipeline è in ritardo
+        """
+        self.chain = chain
+        self.max_workers = max(1, workers)
+        self.queue_size = max(1, queue_size)
+        self.drop_when_behind = drop_when_behind
+        self.frame_callback: Optional[Callable[[np.ndarray, int], None]] = None
+
+        # Un buffer di uscita può essere in coda, in elaborazione nel gruppo
+        # successivo o in scrittura: l'anello deve coprire tutti i casi
+        ring_size = self.queue_size + 2
+        self._workers = [_PipelineWorker(i, ring_size) for i in range(self.max_workers)]
+        self._input_pool = _BufferPool()
+        self._queues: List[queue.Queue] = []
+        self._active = 1  # Gruppi usati dal piano corrente (i thread oltre restano inattivi)
+        self._plan = None
+        self._plan_channels = None
+        self._running = False
+        self._submit_lock = threading.Lock()
+        self._in_flight = 0
+        self._idle = threading.Condition()
+        self._submit_times: Dict[int, float] = {}
+        self._last_sequence: Optional[int] = None
+        self._sequence = 0
+        self._latency = StageTimer()
+        self._started_at = 0.0
+        self._stats = {
+            'frames_submitted': 0,
+            'frames_processed': 0,
+            'frames_dropped': 0,
+            'frames_out_of_order': 0
+        }
+
+    def start(self, frame_callback: Callable[[np.ndarray, int], None]) -> bool:
+        """
+        Avvia i thread della pipeline
+
+        Args:
+            frame_callback: Funzione chiamata con (frame, sequenza) per ogni frame elaborato
+
+        Returns:
+            bool: True se la pipeline è stata avviata
+        """
+        if self._running:
+            return True
+
+        self.frame_callback = frame_callback
+        self._queues = [queue.Queue(maxsize=self.queue_size) for _ in self._workers]
+        self._plan = None  # I gruppi vengono ricalcolati al primo frame
+        for i, worker in enumerate(self._workers):
+            worker.input = self._queues[i]
+            worker.output = self._queues[i + 1].put if i + 1 < len(self._workers) else self._deliver
+            worker.thread = threading.Thread(
+                target=self._worker_loop, args=(worker,), name=f'ps3eye-pipeline-{i}', daemon=True
+            )
+
+        self._running = True
+        self._started_at = time.perf_counter()
+        for worker in self._workers:
+            worker.thread.start()
+        logger.info(f"Pipeline effetti avviata con al più {len(self._workers)} thread")
+        return True
+
+    def stop(self):
+        """Ferma la pipeline dopo aver completato i frame in elaborazione"""
+        if not self._running:
+            return
+        self._running = False
+        self._queues[0].put(_STOP)
+        for worker in self._workers:
+            if worker.thread:
+                worker.thread.join(timeout=2.0)
+                worker.thread = None
+        logger.info("Pipeline effetti fermata")
+
+    def cleanup(self):
+        """Pulisce le risorse"""
+        self.stop()
+
+    def __del__(self):
+        self.cleanup()
+
+    def submit(self, frame: np.ndarray, sequence: Optional[int] = None) -> bool:
+        """
+        Inserisce un frame nella pipeline
+
+        Il frame viene copiato: il chiamante può riutilizzare subito il proprio buffer.
+
+        Args:
+            frame: Frame da elaborare
+            sequence: Numero di sequenza (default: contatore interno)
+
+        Returns:
+            bool: False se la pipeline non è attiva o il frame è stato scartato
+        """
+        if not self._running:
+            return False
+
+        with self._submit_lock:
+            if sequence is None:
+                self._sequence += 1
+                sequence = self._sequence
+            self._stats['frames_submitted'] += 1
+
+            # Una modifica della catena cambia la divisione in gruppi: prima di
+            # applicarla si attende che i frame in volo abbiano finito, così
+            # nessun effetto viene mai eseguito da due thread insieme. Se i frame
+            # non finiscono in tempo questo frame usa ancora i gruppi precedenti
+            # e la nuova divisione viene ritentata al frame successivo
+            channels = frame_channels(frame)
+            plan = self.chain.compile(channels)
+            if plan is not self._plan or channels != self._plan_channels:
+                if self._wait_idle():
+                    self._partition(plan)
+                    self._plan_channels = channels
+                else:
+                    logger.warning("Pipeline non inattiva: nuova divisione in gruppi rimandata")
+
+            # In ritardo: il frame più vecchio in attesa lascia il posto al nuovo
+            # (senza drop_when_behind put() attende che si liberi posto)
+            first = self._queues[0]
+            if self.drop_when_behind and first.full():
+                try:
+                    buffer, dropped = first.get_nowait()
+                    self._input_pool.release(buffer)
+                    self._frame_done(dropped, delivered=False)
+                except queue.Empty:
+                    pass
+
+            buffer = self._input_pool.acquire(frame)
+            np.copyto(buffer, frame)
+            with self._idle:
+                self._in_flight += 1
+                self._submit_times[sequence] = time.perf_counter()
+            first.put((buffer, sequence))
+            return True
+
+    def _wait_idle(self, timeout: float = 2.0) -> bool:
+        """Attende che non ci siano frame in volo; False allo scadere del timeout"""
+        with self._idle:
+            return self._idle.wait_for(lambda: self._in_flight == 0, timeout=timeout)
+
+    def _partition(self, plan: List[Tuple[str, object]]):
+        """
+        Divide il piano in gruppi contigui di costo simile
+
+        Il costo di ogni stadio è il tempo medio misurato finora (1 ms se non
+        ancora misurato); i gruppi sono al più quanti i thread e quanti gli
+        stadi, così nessun gruppo vuoto aggiunge una copia del frame. L'ultimo
+        gruppo usato consegna direttamente i frame.
+        """
+        timers = [self.chain.stage_timer(name) for name, _ in plan]
+        costs = [max(timer.mean_ms, 0.01) if timer.count else 1.0 for timer in timers]
+        active = max(1, min(len(self._workers), len(plan)))
+        groups: List[List[Tuple[str, object]]] = [[] for _ in range(active)]
+        remaining = sum(costs)
+        group = 0
+        accumulated = 0.0
+        for i, step in enumerate(plan):
+            groups[group].append(step)
+            accumulated += costs[i]
+            remaining -= costs[i]
+            groups_left = active - group - 1
+            steps_left = len(plan) - i - 1
+            target = (accumulated + remaining) / (groups_left + 1)
+            if groups_left > 0 and steps_left > 0 and (accumulated >= target or steps_left <= groups_left):
+                group += 1
+                accumulated = 0.0
+
+        for worker in self._workers:
+            worker.steps = groups[worker.index] if worker.index < active else []
+            worker.output = self._queues[worker.index + 1].put if worker.index + 1 < active else self._deliver
+        self._active = active
+        self._plan = plan
+        logger.debug("Gruppi della pipeline: " + " | ".join(
+            ','.join(name for name, _ in steps) or '-' for steps in groups
+        ))
+
+    def _worker_loop(self, worker: _PipelineWorker):
+        """Ciclo di un thread della pipeline"""
+        while True:
+            item = worker.input.get()
+            if item is _STOP:
+                if worker.index + 1 < len(self._queues):
+                    self._queues[worker.index + 1].put(_STOP)
+                return
+
+            frame, sequence = item
+            start = time.perf_counter()
+            try:
+                result = worker.run_steps(frame, self.chain.stage_timer)
+            except Exception as e:
+                logger.error(f"Errore nel gruppo {worker.index} della pipeline: {e}")
+                self._frame_done(sequence, delivered=False)
+                continue
+            finally:
+                if worker.index == 0:
+                    self._input_pool.release(frame)
+            worker.busy.add((time.perf_counter() - start) * 1000.0)
+            worker.output((result, sequence))
+
+    def _deliver(self, item: Tuple[np.ndarray, int]):
+        """Consegna un frame elaborato rispettando l'ordine di sequenza"""
+        frame, sequence = item
+        if self._last_sequence is not None and sequence <= self._last_sequence:
+            self._stats['frames_out_of_order'] += 1
+            self._frame_done(sequence, delivered=False)
+            return
+
+        self._last_sequence = sequence
+        if self.frame_callback:
+            try:
+                self.frame_callback(frame, sequence)
+            except Exception as e:
+                logger.error(f"Errore nel callback della pipeline: {e}")
+        self._frame_done(sequence, delivered=True)
+
+    def _frame_done(self, sequence: int, delivered: bool):
+        with self._idle:
+            submitted = self._submit_times.pop(sequence, None)
+            if delivered:
+                self._stats['frames_processed'] += 1
+                if submitted is not None:
+                    self._latency.add((time.perf_counter() - submitted) * 1000.0)
+            else:
+                self._stats['frames_dropped'] += 1
+            self._in_flight -= 1
+            self._idle.notify_all()
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        """
+        Statistiche della pipeline
+
+        Returns:
+            Dict[str, Any]: Contatori dei frame, fps di uscita, latenza
+            (ingresso -> consegna, media e p95 in ms) e tempo medio di
+            occupazione di ogni gruppo con i relativi stadi
+        """
+        elapsed = time.perf_counter() - self._started_at if self._started_at else 0.0
+        stats: Dict[str, Any] = self._stats.copy()
+        stats['fps'] = stats['frames_processed'] / elapsed if elapsed > 0 else 0.0
+        stats['latency_ms'] = self._latency.mean_ms
+        stats['latency_p95_ms'] = self._latency.p95_ms
+        stats['groups'] = [
+            {
+                'stages': [name for name, _ in worker.steps],
+                'busy_ms': worker.busy.mean_ms
+            }
+            for worker in self._workers[:self._active]
+        ]
+        return stats
@@ -0,0 +1,244 @@
+"""
+Registro degli effetti video con caricamento lazy
+
+Il registro conosce gli effetti tramite metadati leggeri (nome, etichetta,
+modulo, classe e parametri) senza importarne il codice: il modulo
+dell'effetto, e con esso OpenCV, viene importato solo alla prima
+attivazione. Oltre agli effetti integrati vengono scoperti:
+  - entry point del gruppo 'ps3eye_manager.effects', che devono puntare a un
+    manifest (dict o lista di dict) in un modulo leggero;
+  - file *.json nella directory dei plugin (~/PS3EyeManager/plugins/effects),
+    con il modulo Python indicato come percorso relativo al manifest.
+
+Formato di un manifest:
+    {
+        "name": "vignette",
+        "label": "Vignettatura",
+        "module": "vignette.py",
+        "class": "VignetteEffect",
+        "params": [
+            {"name": "intensity", "label": "Intensità", "kind": "float",
+             "default": 1.0, "minimum": 0.0, "maximum": 2.0, "step": 0.01}
+        ]
+    }
+"""
+import sys
+import json
+import logging
+import importlib
+import importlib.util
+import threading
+from pathlib import Path
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger('ps3eye.effects')
+
+ENTRY_POINT_GROUP = 'ps3eye_manager.effects'
+
+def default_plugin_dir() -> Path:
+    """Directory predefinita dei plugin degli effetti"""
+    return Path.home() / "PS3EyeManager" / "plugins" / "effects"
+
+@dataclass
+class ParamSpec:
+    """Descrizione di un parametro di un effetto, usata per generare i controlli"""
+    name: str
+    label: str
+    kind: str = 'float'          # 'float', 'int', 'bool' o 'choice'
+    default: Any = None
+    minimum: float = 0.0
+    maximum: float = 1.0
+    step: float = 0.01
+    choices: List[Tuple[str, Any]] = field(default_factory=list)  # (etichetta, valore) per 'choice'
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'ParamSpec':
+        data = dict(data)
+        data['choices'] = [tuple(choice) for choice in data.get('choices', [])]
+        return cls(**data)
+
+@dataclass
+class EffectInfo:
+    """Metadati di un effetto registrato"""
+    name: str
+    label: str
+    module: str                  # Modulo importabile o percorso di un file .py
+    class_name: str
+    params: List[ParamSpec] = field(default_factory=list)
+    source: str = 'builtin'      # 'builtin', 'entry_point' o 'plugin_dir'
+
+    @classmethod
+    def from_manifest(cls, data: Dict[str, Any], source: str, base_dir: Optional[Path] = None) -> 'EffectInfo':
+        module = data['module']
+        if base_dir is not None and module.endswith('.py'):
+            module = str((base_dir / module).resolve())
+        return cls(
+            name=data['name'],
+            label=data.get('label', data['name']),
+            module=module,
+            class_name=data['class'],
+            params=[ParamSpec.from_dict(p) for p in data.get('params', [])],
+            source=source
+        )
+
+
+_INTENSITY = ParamSpec('intensity', "Intensità", 'float', 1.0, 0.0, 2.0, 0.01)
+_KERNEL = ParamSpec('kernel_size', "Dimensione kernel", 'int', 3, 3, 15, 2)
+_THRESHOLD = ParamSpec('threshold', "Soglia", 'int', 127, 0, 255, 1)
+_SCALE = ParamSpec('processing_scale', "Risoluzione di elaborazione", 'choice', 1.0,
+                   choices=[("100%", 1.0), ("50%", 0.5), ("25%", 0.25)])
+
+# Effetti integrati, nell'ordine predefinito della catena
+BUILTIN_EFFECTS = [
+    EffectInfo('white_balance', "Bilanciamento del Bianco", 'effects.video_effects', 'AutoWhiteBalanceEffect', [
+        ParamSpec('intensity', "Intensità", 'float', 1.0, 0.0, 1.0, 0.01),
+        ParamSpec('method', "Metodo", 'choice', 'gray_world',
+                  choices=[("Gray world", 'gray_world'), ("White patch", 'white_patch')]),
+        ParamSpec('update_interval', "Intervallo di stima (frame)", 'int', 4, 1, 30, 1),
+        ParamSpec('hardware_writeback', "Scrivi nei registri della telecamera", 'bool', False),
+    ]),
+    EffectInfo('denoise', "Riduzione Rumore", 'effects.video_effects', 'TemporalDenoiseEffect', [_INTENSITY]),
+    EffectInfo('blur', "Sfocatura", 'effects.video_effects', 'BlurEffect', [_INTENSITY, _KERNEL, _SCALE]),
+    EffectInfo('sharpen', "Nitidezza", 'effects.video_effects', 'SharpenEffect', [_INTENSITY]),
+    EffectInfo('edge', "Bordi", 'effects.video_effects', 'EdgeDetectionEffect', [_INTENSITY, _THRESHOLD, _SCALE]),
+    EffectInfo('cartoon', "Cartone", 'effects.video_effects', 'CartoonEffect', [_INTENSITY, _KERNEL, _SCALE]),
+    EffectInfo('night_vision', "Visione Notturna", 'effects.video_effects', 'NightVisionEffect', [_INTENSITY]),
+    EffectInfo('mirror', "Specchio", 'effects.video_effects', 'MirrorEffect'),
+    EffectInfo('rotate', "Rotazione", 'effects.video_effects', 'RotateEffect',
+               [ParamSpec('intensity', "Angolo (giri)", 'float', 1.0, 0.0, 1.0, 1 / 360)]),
+    EffectInfo('brightness', "Luminosità", 'effects.video_effects', 'BrightnessEffect', [_INTENSITY]),
+    EffectInfo('invert', "Negativo", 'effects.video_effects', 'InvertEffect'),
+    EffectInfo('channel_swap', "Scambio Rosso/Blu", 'effects.video_effects', 'ChannelSwapEffect'),
+]
+
+
+def _entry_points(group: str):
+    from importlib import metadata
+    entry_points = metadata.entry_points()
+    if hasattr(entry_points, 'select'):
+        return entry_points.select(group=group)
+    return entry_points.get(group, [])  # Python < 3.10
+
+
+class EffectRegistry:
+    """
+    Registro degli effetti disponibili
+
+    La scoperta legge solo i metadati; load_class() importa il codice
+    dell'effetto la prima volta che serve.
+    """
+
+    def __init__(self, plugin_dirs: Optional[List[Path]] = None, entry_points: bool = True):
+        """
+        Args:
+            plugin_dirs: Directory con i manifest JSON dei plugin (default: directory utente)
+            entry_points: Se True scopre anche gli effetti dichiarati come entry point
+        """
+        self.plugin_dirs = [Path(d) for d in plugin_dirs] if plugin_dirs is not None else [default_plugin_dir()]
+        self.use_entry_points = entry_points
+        self._effects: Dict[str, EffectInfo] = {}
+        self._classes: Dict[str, type] = {}
+        self._discovered = False
+        self._lock = threading.RLock()
+
+    def register(self, info: EffectInfo, replace: bool = False):
+        """Registra un effetto"""
+        with self._lock:
+            if info.name in self._effects and not replace:
+                logger.warning(f"Effetto '{info.name}' già registrato, ignorato ({info.source})")
+                return
+            self._effects[info.name] = info
+            self._classes.pop(info.name, None)
+
+    def discover(self):
+        """Scopre gli effetti integrati, gli entry point e i plugin (una sola volta)"""
+        with self._lock:
+            if self._discovered:
+                return
+            self._discovered = True
+            for info in BUILTIN_EFFECTS:
+                self.register(info)
+            if self.use_entry_points:
+                self._discover_entry_points()
+            for directory in self.plugin_dirs:
+                self._discover_directory(directory)
+
+    def _discover_entry_points(self):
+        try:
+            entry_points = list(_entry_points(ENTRY_POINT_GROUP))
+        except Exception as e:
+            logger.error(f"Errore nella lettura degli entry point degli effetti: {e}")
+            return
+        for entry_point in entry_points:
+            try:
+                manifest = entry_point.load()
+                for data in (manifest if isinstance(manifest, list) else [manifest]):
+                    self.register(EffectInfo.from_manifest(data, 'entry_point'))
+            except Exception as e:
+                logger.error(f"Entry point dell'effetto '{entry_point.name}' non valido: {e}")
+
+    def _discover_directory(self, directory: Path):
+        if not directory.is_dir():
+            return
+        for path in sorted(directory.glob('*.json')):
+            try:
+                manifest = json.loads(path.read_text(encoding='utf-8'))
+                for data in (manifest if isinstance(manifest, list) else [manifest]):
+                    self.register(EffectInfo.from_manifest(data, 'plugin_dir', path.parent))
+            except Exception as e:
+                logger.error(f"Manifest del plugin {path} non valido: {e}")
+
+    def names(self) -> List[str]:
+        """Nomi degli effetti registrati, nell'ordine di registrazione"""
+        self.discover()
+        return list(self._effects)
+
+    def info(self, name: str) -> EffectInfo:
+        """Metadati di un effetto"""
+        self.discover()
+        try:
+            return self._effects[name]
+        except KeyError:
+            raise ValueError(f"Tipo di effetto sconosciuto: {name}") from None
+
+    def __contains__(self, name: str) -> bool:
+        self.discover()
+        return name in self._effects
+
+    def is_loaded(self, name: str) -> bool:
+        """True se il codice dell'effetto è già stato importato"""
+        return name in self._classes
+
+    def load_class(self, name: str) -> type:
+        """Importa (alla prima richiesta) e restituisce la classe dell'effetto"""
+        with self._lock:
+            cls = self._classes.get(name)
+            if cls is not None:
+                return cls
+            info = self.info(name)
+            if info.module.endswith('.py'):
+                spec = importlib.util.spec_from_file_location(f"ps3eye_effect_plugin_{name}", info.module)
+                module = importlib.util.module_from_spec(spec)
+                sys.modules[spec.name] = module
+                spec.loader.exec_module(module)
+            else:
+                module = importlib.import_module(info.module)
+            cls = getattr(module, info.class_name)
+            self._classes[name] = cls
+            logger.debug(f"Effetto '{name}' caricato da {info.module}")
+            return cls
+
+    def create(self, name: str):
+        """Crea una nuova istanza dell'effetto"""
+        return self.load_class(name)()
+
+
+_registry: Optional[EffectRegistry] = None
+
+def get_registry() -> EffectRegistry:
+    """Registro globale degli effetti"""
+    global _registry
+    if _registry is None:
+        _registry = EffectRegistry()
+    return _registry
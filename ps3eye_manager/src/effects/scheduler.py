@@ -0,0 +1,216 @@
+"""
+Scheduler della catena di effetti basato sul budget per frame
+
+Quando la catena impiega più del tempo disponibile per frame, lo scheduler
+ne riduce la qualità un passo alla volta invece di rallentare lo stream:
+  1. riduce la risoluzione di elaborazione degli stadi più costosi (1/2, poi 1/4);
+  2. salta gli stadi opzionali;
+  3. riusa per alcuni frame il risultato degli stadi riutilizzabili.
+Quando torna margine le degradazioni vengono annullate in ordine inverso.
+"""
+import time
+import logging
+import numpy as np
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from effects.fusion import effect_scale
+from effects.chain import VideoEffectChain, EffectStage
+
+logger = logging.getLogger('ps3eye.effects')
+
+@dataclass
+class Degradation:
+    """Degradazione applicata a uno stadio"""
+    stage_id: str
+    kind: str        # 'scale', 'skip' o 'reuse'
+    value: Any
+    previous: Any
+    cost_before: float = 0.0          # Tempo medio per frame prima della degradazione
+    saving: Optional[float] = None    # Risparmio misurato dopo l'assestamento
+    frames: int = 0                   # Frame elaborati da quando è attiva
+
+    def describe(self) -> str:
+        if self.kind == 'scale':
+            return f"{self.stage_id}: scala {self.value:g}"
+        if self.kind == 'skip':
+            return f"{self.stage_id}: saltato"
+        return f"{self.stage_id}: riuso ogni {self.value} frame"
+
+
+class FrameBudgetScheduler:
+    """
+    Applica la catena di effetti rispettando un budget di tempo per frame
+
+    Esempio:
+        scheduler = FrameBudgetScheduler(chain, budget_ms=33.3)
+        output = scheduler.apply(frame)
+        print(scheduler.report()['degradations'])
+    """
+
+    # Scale provate in ordine prima di passare alle degradazioni successive
+    SCALE_STEPS = (0.5, 0.25)
+    REUSE_INTERVAL = 2
+    # Frame dopo una degradazione prima di misurarne il risparmio
+    SETTLE_FRAMES = 10
+
+    def __init__(
+        self,
+        chain: VideoEffectChain,
+        budget_ms: Optional[float] = None,
+        headroom: float = 0.7,
+        degrade_after: int = 5,
+        recover_after: int = 60
+    ):
+        """
+        Args:
+            chain: Catena di effetti da controllare
+            budget_ms: Tempo disponibile per frame (default: frame_budget_ms della catena)
+            headroom: Frazione del budget sotto cui una degradazione viene annullata
+            degrade_after: Frame consecutivi oltre il budget prima di degradare
+            recover_after: Frame consecutivi con margine prima di recuperare
+        """
+        self.chain = chain
+        self.budget_ms = budget_ms if budget_ms is not None else chain.frame_budget_ms
+        self.headroom = headroom
+        self.degrade_after = degrade_after
+        self.recover_after = recover_after
+        self.enabled = True
+        self._applied: List[Degradation] = []
+        self._frame_ms: Optional[float] = None
+        self._over = 0
+        self._under = 0
+
+    def apply(self, frame: np.ndarray, unchanged: bool = False) -> np.ndarray:
+        """
+        Applica la catena al frame e aggiorna le degradazioni
+        
+        I frame invariati per cui la catena riusa il risultato precedente
+        (vedi VideoEffectChain.apply_effects) non entrano nella misura del tempo.
+        """
+        reused = self.chain.frames_reused
+        start = time.perf_counter()
+        result = self.chain.apply_effects(frame, unchanged)
+        if self.chain.frames_reused == reused:
+            self._update((time.perf_counter() - start) * 1000.0)
+        return result
+
+    def reset(self):
+        """Annulla tutte le degradazioni"""
+        while self._applied:
+            self._revert()
+        self._over = self._under = 0
+
+    @property
+    def level(self) -> int:
+        """Numero di degradazioni attive"""
+        return len(self._applied)
+
+    def report(self) -> Dict[str, Any]:
+        """
+        Stato dello scheduler
+
+        Returns:
+            Dict[str, Any]: budget, tempo medio per frame, livello e descrizione
+            delle degradazioni attive
+        """
+        return {
+            'budget_ms': self.budget_ms,
+            'frame_ms': self._frame_ms or 0.0,
+            'level': self.level,
+            'degradations': [d.describe() for d in self._applied]
+        }
+
+    def _update(self, elapsed_ms: float):
+        # Media mobile esponenziale: un singolo frame lento non deve degradare
+        self._frame_ms = elapsed_ms if self._frame_ms is None else 0.8 * self._frame_ms + 0.2 * elapsed_ms
+        if not self.enabled:
+            return
+
+        if self._applied:
+            last = self._applied[-1]
+            last.frames += 1
+            if last.saving is None and last.frames >= self.SETTLE_FRAMES:
+                last.saving = max(0.0, last.cost_before - self._frame_ms)
+
+        if self._frame_ms > self.budget_ms:
+            self._over += 1
+            self._under = 0
+        elif self._applied and self._frame_ms < self.budget_ms * self.headroom:
+            self._under += 1
+            self._over = 0
+        else:
+            self._over = self._under = 0
+
+        # Dopo una degradazione si attende che la media si assesti prima di decidere ancora
+        settled = not self._applied or self._applied[-1].frames >= self.SETTLE_FRAMES
+        if self._over >= self.degrade_after and settled:
+            self._over = 0
+            degradation = self._next_degradation()
+            if degradation is not None:
+                degradation.cost_before = self._frame_ms
+                self._apply(degradation)
+                logger.info(f"Budget superato ({self._frame_ms:.1f} ms): {degradation.describe()}")
+        elif self._under >= self.recover_after:
+            self._under = 0
+            # Recupera solo se il costo stimato senza l'ultima degradazione rientra nel budget
+            last = self._applied[-1]
+            if last.saving is not None and self._frame_ms + last.saving < self.budget_ms:
+                degradation = self._revert()
+                logger.info(f"Margine recuperato ({self._frame_ms:.1f} ms): annullato {degradation.describe()}")
+
+    def _stage_costs(self) -> Dict[str, float]:
+        """Costo medio stimato di ogni stadio attivo (i gruppi sono divisi tra i membri)"""
+        costs = {}
+        for stats in self.chain.stage_stats():
+            if stats['enabled'] and stats['group']:
+                members = stats['group'].split('+')
+                costs[stats['stage_id']] = stats['mean_ms'] / len(members)
+        return costs
+
+    def _next_degradation(self) -> Optional[Degradation]:
+        """Sceglie la prossima degradazione: lo stadio più costoso tra i candidati del passo corrente"""
+        costs = self._stage_costs()
+        stages = [s for s in self.chain.stages
+                  if s.enabled and not s.skipped and s.effect is not None and s.stage_id in costs]
+
+        def most_expensive(candidates: List[EffectStage]) -> Optional[EffectStage]:
+            return max(candidates, key=lambda s: costs[s.stage_id]) if candidates else None
+
+        for target in self.SCALE_STEPS:
+            stage = most_expensive([
+                s for s in stages
+                if getattr(s.effect, 'scalable', False) and not getattr(s.effect, 'fusible', False)
+                and effect_scale(s.effect, s.scale_override) > target
+            ])
+            if stage is not None:
+                return Degradation(stage.stage_id, 'scale', target, stage.scale_override)
+
+        stage = most_expensive([s for s in stages if getattr(s.effect, 'optional', False)])
+        if stage is not None:
+            return Degradation(stage.stage_id, 'skip', True, stage.skipped)
+
+        stage = most_expensive([s for s in stages if getattr(s.effect, 'reusable', False) and s.reuse_interval == 1])
+        if stage is not None:
+            return Degradation(stage.stage_id, 'reuse', self.REUSE_INTERVAL, stage.reuse_interval)
+        return None
+
+    def _set(self, stage_id: str, kind: str, value: Any):
+        stage = self.chain.get_stage(stage_id)
+        if stage is None:
+            return
+        if kind == 'scale':
+            stage.scale_override = value
+        elif kind == 'skip':
+            stage.skipped = value
+        else:
+            stage.reuse_interval = value
+
+    def _apply(self, degradation: Degradation):
+        self._set(degradation.stage_id, degradation.kind, degradation.value)
+        self._applied.append(degradation)
+
+    def _revert(self) -> Degradation:
+        degradation = self._applied.pop()
+        self._set(degradation.stage_id, degradation.kind, degradation.previous)
+        return degradation
@@ -0,0 +1,120 @@
+"""
+Esecuzione a bande degli effetti locali su un pool di thread condiviso
+
+Il frame viene diviso in bande orizzontali; ogni banda viene elaborata
+insieme a un alone (halo) di righe sopra e sotto pari al raggio del kernel
+dell'effetto, poi solo le righe proprie della banda vengono copiate nel
+frame di uscita. OpenCV rilascia il GIL, quindi le bande scalano sui core.
+"""
+import os
+import threading
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+_pool: Optional[ThreadPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+# Banda in elaborazione nel thread corrente (usata per separare i buffer di lavoro)
+_band_context = threading.local()
+
+def shared_pool() -> ThreadPoolExecutor:
+    """Restituisce il pool di thread condiviso, creato al primo utilizzo"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=os.cpu_count() or 1, thread_name_prefix='ps3eye-tile')
+        return _pool
+
+def current_band() -> Optional[int]:
+    """Indice della banda elaborata dal thread corrente (None fuori dall'esecuzione a bande)"""
+    return getattr(_band_context, 'band', None)
+
+def tile_halo(stage) -> Optional[int]:
+    """
+    Righe di alone necessarie a uno stadio per l'esecuzione a bande
+
+    Returns:
+        Optional[int]: Raggio verticale del kernel, None se lo stadio non è locale
+    """
+    method = getattr(stage, 'tile_halo', None)
+    return method() if method is not None else None
+
+
+class TiledExecutor:
+    """
+    Esegue gli stadi locali a bande orizzontali sul pool condiviso
+
+    Gli stadi devono esporre tile_halo(): un risultato intero indica il
+    numero di righe di contesto necessarie sopra e sotto ogni banda.
+    """
+
+    def __init__(self, bands: Optional[int] = None, min_band_rows: int = 32):
+        """
+        Args:
+            bands: Numero di bande (default: numero di core)
+            min_band_rows: Altezza minima di una banda; frame più bassi usano meno bande
+        """
+        self.bands = bands or os.cpu_count() or 1
+        self.min_band_rows = min_band_rows
+        self._scratch: Dict[tuple, np.ndarray] = {}
+        self.allocations = 0
+
+    def _band_buffer(self, band: int, shape: Tuple[int, ...], dtype) -> np.ndarray:
+        """Buffer persistente per il risultato di una banda con il suo alone"""
+        # Stadi con aloni diversi condividono i buffer solo se la forma coincide
+        key = (band, shape, np.dtype(dtype))
+        buffer = self._scratch.get(key)
+        if buffer is None:
+            buffer = np.empty(shape, dtype)
+            self._scratch[key] = buffer
+            self.allocations += 1
+        return buffer
+
+    def split(self, height: int) -> List[Tuple[int, int]]:
+        """Intervalli di righe [inizio, fine) delle bande"""
+        count = max(1, min(self.bands, height // self.min_band_rows))
+        edges = [height * i // count for i in range(count + 1)]
+        return list(zip(edges[:-1], edges[1:]))
+
+    def _run_band(self, stage, halo: int, band: int, frame: np.ndarray, dst: np.ndarray, y0: int, y1: int):
+        _band_context.band = band
+        try:
+            if halo == 0:
+                stage.apply(frame[y0:y1], dst[y0:y1])
+                return
+            top = max(0, y0 - halo)
+            bottom = min(frame.shape[0], y1 + halo)
+            source = frame[top:bottom]
+            result = stage.apply(source, self._band_buffer(band, source.shape, source.dtype))
+            dst[y0:y1] = result[y0 - top:y1 - top]
+        finally:
+            _band_context.band = None
+
+    def apply(self, stage, halo: int, frame: np.ndarray, dst: np.ndarray) -> np.ndarray:
+        """
+        Applica uno stadio locale a bande
+
+        Args:
+            stage: Stadio con metodo apply(frame, dst)
+            halo: Righe di contesto sopra e sotto ogni banda
+            frame: Frame in ingresso
+            dst: Buffer di uscita (distinto da frame)
+
+        Returns:
+            np.ndarray: dst
+        """
+        bands = self.split(frame.shape[0])
+        if len(bands) == 1:
+            return stage.apply(frame, dst)
+
+        pool = shared_pool()
+        futures = [
+            pool.submit(self._run_band, stage, halo, index, frame, dst, y0, y1)
+            for index, (y0, y1) in enumerate(bands[1:], start=1)
+        ]
+        # La prima banda viene elaborata dal thread chiamante
+        self._run_band(stage, halo, 0, frame, dst, *bands[0])
+        for future in futures:
+            future.result()
+        return dst
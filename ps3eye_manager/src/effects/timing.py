@@ -0,0 +1,48 @@
+"""
+Statistiche mobili dei tempi di esecuzione degli stadi della catena di effetti
+"""
+import numpy as np
+from collections import deque
+from typing import Dict, Any
+
+class StageTimer:
+    """Finestra mobile dei tempi di esecuzione di uno stadio (in millisecondi)"""
+
+    def __init__(self, window: int = 120):
+        self._samples = deque(maxlen=window)
+        self.count = 0
+
+    def add(self, elapsed_ms: float):
+        """Registra la durata di un'esecuzione"""
+        self._samples.append(elapsed_ms)
+        self.count += 1
+
+    def reset(self):
+        self._samples.clear()
+        self.count = 0
+
+    @property
+    def mean_ms(self) -> float:
+        return float(np.mean(self._samples)) if self._samples else 0.0
+
+    @property
+    def p95_ms(self) -> float:
+        return float(np.percentile(self._samples, 95)) if self._samples else 0.0
+
+    def summary(self, budget_ms: float) -> Dict[str, Any]:
+        """
+        Riassunto delle statistiche
+
+        Args:
+            budget_ms: Tempo disponibile per frame, usato per la quota di budget
+
+        Returns:
+            Dict[str, Any]: mean_ms, p95_ms, budget_share (0-1) e numero di campioni
+        """
+        mean = self.mean_ms
+        return {
+            'mean_ms': mean,
+            'p95_ms': self.p95_ms,
+            'budget_share': mean / budget_ms if budget_ms > 0 else 0.0,
+            'samples': self.count
+        }
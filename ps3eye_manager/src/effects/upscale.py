@@ -0,0 +1,458 @@
+"""
+Ingrandimento dei frame su CPU con algoritmi selezionabili
+
+La cattura VGA viene esposta ai consumatori (webcam virtuale) a 720p o
+1080p. L'ingrandimento cambia la dimensione del frame, quindi non è uno
+stadio della catena di effetti ma lo stadio finale dopo di essa.
+
+Metodi disponibili, dal più economico al più fedele:
+  - 'linear': interpolazione bilineare;
+  - 'lanczos': Lanczos su 8x8 pixel;
+  - 'edge': nitidezza adattiva ai bordi alla risoluzione della sorgente,
+    poi interpolazione bicubica;
+  - 'dnn': modelli di super-risoluzione di OpenCV (dnn_superres), se il
+    modulo contrib è installato e viene indicato un modello.
+
+Se il rapporto d'aspetto della sorgente è diverso da quello di uscita (4:3
+verso 16:9) il parametro fit decide come adattarlo:
+  - 'letterbox': immagine intera centrata, con bande nere ai lati o sopra e sotto;
+  - 'crop': ritaglio centrale della sorgente che riempie l'uscita;
+  - 'stretch': deformazione fino alla dimensione di uscita.
+
+I metodi a interpolazione vengono eseguiti a bande orizzontali sul pool di
+thread condiviso. Ogni banda parte da righe sorgente allineate al rapporto
+di scala e include un alone di righe pari al raggio del filtro, quindi il
+risultato è identico a quello dell'ingrandimento in un'unica passata.
+"""
+import os
+import time
+import logging
+import numpy as np
+import cv2
+from dataclasses import dataclass
+from math import gcd
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from effects.tiling import shared_pool
+from effects.timing import StageTimer
+
+logger = logging.getLogger('ps3eye.effects')
+
+@dataclass(frozen=True)
+class UpscaleMethod:
+    """Descrizione di un metodo di ingrandimento"""
+    name: str
+    label: str
+    quality: int            # Ordine di qualità (più alto = migliore)
+    ns_per_pixel: float     # Costo nominale per pixel di uscita a 3 canali su un core
+    halo: int               # Raggio verticale del filtro in righe sorgente (0 = non a bande)
+    interpolation: int = cv2.INTER_LINEAR
+
+
+# Costi nominali misurati su cv2.resize da VGA a 720p/1080p, usati finché
+# non ci sono tempi misurati o una calibrazione
+UPSCALE_METHODS: Dict[str, UpscaleMethod] = {
+    'linear': UpscaleMethod('linear', "Bilineare", 0, 2.0, 1, cv2.INTER_LINEAR),
+    'lanczos': UpscaleMethod('lanczos', "Lanczos", 2, 27.0, 4, cv2.INTER_LANCZOS4),
+    'edge': UpscaleMethod('edge', "Bordi (bicubica + nitidezza adattiva)", 1, 5.5, 2, cv2.INTER_CUBIC),
+    'dnn': UpscaleMethod('dnn', "Super-risoluzione (modello DNN)", 3, 300.0, 0)
+}
+
+# Modi di adattamento del rapporto d'aspetto
+FIT_MODES = ('letterbox', 'crop', 'stretch')
+
+# Risoluzioni di uscita proposte ai consumatori
+OUTPUT_SIZES: Dict[str, Tuple[int, int]] = {
+    '480p': (640, 480),
+    '720p': (1280, 720),
+    '1080p': (1920, 1080)
+}
+
+def dnn_available() -> bool:
+    """True se OpenCV include il modulo dnn_superres"""
+    return hasattr(cv2, 'dnn_superres')
+
+
+class Upscaler:
+    """
+    Ingrandisce i frame alla risoluzione di uscita con il metodo scelto
+
+    Con method='auto' il metodo viene scelto a ogni frame come il più
+    fedele il cui costo stimato rientra in budget_ms.
+
+    Esempio:
+        upscaler = Upscaler((1280, 720), method='lanczos')
+        output = upscaler.upscale(frame)
+        print(upscaler.estimate_ms('edge', frame.shape))
+    """
+
+    # Esecuzioni misurate di un metodo prima che sostituiscano il costo nominale
+    MIN_SAMPLES = 10
+
+    def __init__(
+        self,
+        output_size: Tuple[int, int] = (1280, 720),
+        method: str = 'lanczos',
+        budget_ms: Optional[float] = None,
+        bands: Optional[int] = None,
+        min_band_rows: int = 32,
+        model_path: Optional[str] = None,
+        sharpen_amount: float = 0.6,
+        sharpen_threshold: int = 4,
+        fit: str = 'letterbox'
+    ):
+        """
+        Args:
+            output_size: Dimensione (larghezza, altezza) dei frame in uscita
+            method: Nome del metodo (vedi UPSCALE_METHODS) o 'auto'
+            budget_ms: Tempo disponibile per l'ingrandimento, usato da 'auto'
+            bands: Numero di bande (default: numero di core)
+            min_band_rows: Altezza minima di una banda in righe di uscita
+            model_path: Modello dnn_superres (ad esempio 'ESPCN_x2.pb'); il nome
+                del file indica algoritmo e fattore di scala
+            sharpen_amount: Intensità della nitidezza del metodo 'edge'
+            sharpen_threshold: Dettaglio (0-255) sotto cui il metodo 'edge'
+                non aumenta la nitidezza, per non amplificare il rumore
+            fit: Adattamento del rapporto d'aspetto (vedi FIT_MODES)
+        """
+        if method != 'auto' and method not in UPSCALE_METHODS:
+            raise ValueError(f"Metodo di ingrandimento sconosciuto: {method}")
+        if fit not in FIT_MODES:
+            raise ValueError(f"Adattamento sconosciuto: {fit}")
+        self.output_size = tuple(output_size)
+        self.method = method
+        self.budget_ms = budget_ms
+        self.bands = bands or os.cpu_count() or 1
+        self.min_band_rows = min_band_rows
+        self.sharpen_amount = sharpen_amount
+        self.sharpen_threshold = sharpen_threshold
+        self.fit = fit
+        self.timers: Dict[str, StageTimer] = {name: StageTimer() for name in UPSCALE_METHODS}
+        self._calibrated: Dict[Tuple[str, tuple], float] = {}
+        self._buffers: Dict[tuple, np.ndarray] = {}
+        self._geometry: Optional[tuple] = None
+        self._model = None
+        self.model_path = None
+        self.allocations = 0
+        self.last_method: Optional[str] = None
+        if model_path:
+            self.load_model(model_path)
+
+    def _buffer(self, key: str, shape: Tuple[int, ...]) -> np.ndarray:
+        """Buffer di lavoro persistente, riallocato solo quando cambia la geometria"""
+        buffer = self._buffers.get(key)
+        if buffer is None or buffer.shape != shape:
+            # Azzerato: le bande del letterbox restano nere senza riscriverle a ogni frame
+            buffer = self._buffers[key] = np.zeros(shape, np.uint8)
+            self.allocations += 1
+        return buffer
+
+    def set_output_size(self, width: int, height: int):
+        """Cambia la risoluzione di uscita"""
+        self.output_size = (width, height)
+        self._buffers.clear()
+
+    def set_method(self, method: str):
+        """Cambia il metodo di ingrandimento (vedi UPSCALE_METHODS) o 'auto'"""
+        if method != 'auto' and method not in UPSCALE_METHODS:
+            raise ValueError(f"Metodo di ingrandimento sconosciuto: {method}")
+        self.method = method
+
+    def set_fit(self, fit: str):
+        """Cambia l'adattamento del rapporto d'aspetto (vedi FIT_MODES)"""
+        if fit not in FIT_MODES:
+            raise ValueError(f"Adattamento sconosciuto: {fit}")
+        self.fit = fit
+        # Il buffer di uscita viene riallocato: le bande del letterbox ripartono nere
+        self._buffers.clear()
+
+    def load_model(self, model_path: str) -> bool:
+        """
+        Carica un modello dnn_superres
+
+        Il nome del file segue la convenzione dei modelli di OpenCV
+        (<ALGORITMO>_x<SCALA>.pb, ad esempio 'FSRCNN_x2.pb').
+
+        Returns:
+            bool: True se il modello è stato caricato
+        """
+        if not dnn_available():
+            logger.warning("Modulo dnn_superres non disponibile in questa build di OpenCV")
+            return False
+        try:
+            algorithm, scale = Path(model_path).stem.lower().split('_x')
+            model = cv2.dnn_superres.DnnSuperResImpl_create()
+            model.readModel(str(model_path))
+            model.setModel(algorithm, int(scale))
+        except Exception as e:
+            logger.error(f"Errore nel caricamento del modello {model_path}: {e}")
+            return False
+        self._model = model
+        self.model_path = str(model_path)
+        return True
+
+    def available_methods(self) -> List[str]:
+        """Metodi utilizzabili ('dnn' solo con un modello caricato)"""
+        return [name for name in UPSCALE_METHODS if name != 'dnn' or self._model is not None]
+
+    def estimate_ms(self, method: str, frame_shape: Tuple[int, ...]) -> float:
+        """
+        Costo stimato di un ingrandimento in millisecondi
+
+        Usa in ordine: il tempo medio misurato (dopo MIN_SAMPLES esecuzioni
+        con la geometria corrente), la calibrazione, il costo nominale diviso
+        per le bande eseguite in parallelo.
+
+        Args:
+            method: Nome del metodo
+            frame_shape: Forma dei frame sorgente
+        """
+        geometry = (tuple(frame_shape), self.output_size)
+        timer = self.timers[method]
+        if self._geometry == geometry and timer.count >= self.MIN_SAMPLES:
+            return timer.mean_ms
+        calibrated = self._calibrated.get((method, geometry))
+        if calibrated is not None:
+            return calibrated
+
+        info = UPSCALE_METHODS[method]
+        width, height = self.output_size
+        channels = 1 if len(frame_shape) == 2 else frame_shape[2]
+        cost = info.ns_per_pixel * width * height * max(channels, 1) / 3 / 1e6
+        if info.halo:
+            cost /= min(len(self._bands(frame_shape[0], height, info.halo)), os.cpu_count() or 1)
+        return cost
+
+    def select_method(self, budget_ms: float, frame_shape: Tuple[int, ...]) -> str:
+        """
+        Metodo più fedele il cui costo stimato rientra nel budget
+
+        Se nessun metodo rientra restituisce il più economico.
+        """
+        methods = sorted(self.available_methods(), key=lambda name: UPSCALE_METHODS[name].quality, reverse=True)
+        for name in methods:
+            if self.estimate_ms(name, frame_shape) <= budget_ms:
+                return name
+        return min(methods, key=lambda name: self.estimate_ms(name, frame_shape))
+
+    def calibrate(self, frame_shape: Tuple[int, ...] = (480, 640, 3), runs: int = 3) -> Dict[str, float]:
+        """
+        Misura il costo di ogni metodo disponibile su un frame sintetico
+
+        Returns:
+            Dict[str, float]: Tempo medio in millisecondi per metodo
+        """
+        rng = np.random.default_rng(0)
+        frame = rng.integers(0, 256, frame_shape, dtype=np.uint8)
+        geometry = (tuple(frame_shape), self.output_size)
+        results = {}
+        for name in self.available_methods():
+            self._run(name, frame)  # Preallocazione dei buffer
+            start = time.perf_counter()
+            for _ in range(runs):
+                self._run(name, frame)
+            results[name] = (time.perf_counter() - start) * 1000 / runs
+            self._calibrated[(name, geometry)] = results[name]
+        return results
+
+    def upscale(self, frame: np.ndarray) -> np.ndarray:
+        """
+        Ingrandisce un frame alla risoluzione di uscita
+
+        Il risultato è un buffer interno riscritto alla chiamata successiva:
+        il consumatore deve copiarlo o consumarlo prima.
+
+        Args:
+            frame: Frame sorgente (1, 3 o 4 canali)
+
+        Returns:
+            np.ndarray: Frame di dimensione output_size
+        """
+        geometry = (frame.shape, self.output_size)
+        if geometry != self._geometry:
+            # Le misure fatte con un'altra geometria non valgono più
+            for timer in self.timers.values():
+                timer.reset()
+            self._geometry = geometry
+
+        method = self.method
+        if method == 'auto':
+            budget = self.budget_ms if self.budget_ms is not None else float('inf')
+            method = self.select_method(budget, frame.shape)
+        elif method not in self.available_methods():
+            method = 'lanczos'
+        if method != self.last_method:
+            logger.debug(f"Ingrandimento {frame.shape[1]}x{frame.shape[0]} -> "
+                         f"{self.output_size[0]}x{self.output_size[1]} con il metodo {method}")
+            self.last_method = method
+
+        start = time.perf_counter()
+        result = self._run(method, frame)
+        self.timers[method].add((time.perf_counter() - start) * 1000)
+        return result
+
+    def _run(self, method: str, frame: np.ndarray) -> np.ndarray:
+        width, height = self.output_size
+        output = self._buffer('output', (height, width) + frame.shape[2:])
+        frame, dst = self._fit_regions(frame, output)
+        if frame.shape[:2] == dst.shape[:2]:
+            np.copyto(dst, frame)
+            return output
+        if dst.shape[0] < frame.shape[0]:
+            # Riduzione: nessun alone utile, una sola passata
+            cv2.resize(frame, dst.shape[1::-1], dst=dst, interpolation=cv2.INTER_AREA)
+            return output
+
+        if method == 'dnn':
+            self._run_dnn(frame, dst)
+            return output
+        if method == 'edge':
+            frame = self._enhance_edges(frame)
+        info = UPSCALE_METHODS[method]
+        self._resize_tiled(frame, dst, info.interpolation, info.halo)
+        return output
+
+    def _fit_regions(self, frame: np.ndarray, output: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Regione della sorgente da ingrandire e regione dell'uscita da riempire
+
+        Le regioni sono viste (senza copie): con 'crop' la sorgente viene
+        ritagliata al centro, con 'letterbox' l'uscita viene ristretta alla
+        zona centrale con il rapporto d'aspetto della sorgente.
+        """
+        src_height, src_width = frame.shape[:2]
+        height, width = output.shape[:2]
+        if self.fit == 'stretch' or src_width * height == src_height * width:
+            return frame, output
+        wider = src_width * height > src_height * width
+        if self.fit == 'crop':
+            if wider:
+                cropped = src_height * width // height
+                left = (src_width - cropped) // 2
+                return frame[:, left:left + cropped], output
+            cropped = src_width * height // width
+            top = (src_height - cropped) // 2
+            return frame[top:top + cropped], output
+        if wider:
+            inner = int(round(src_height * width / src_width))
+            top = (height - inner) // 2
+            return frame, output[top:top + inner]
+        inner = int(round(src_width * height / src_height))
+        left = (width - inner) // 2
+        return frame, output[:, left:left + inner]
+
+    def _bands(self, src_height: int, dst_height: int, halo: int) -> List[Tuple[int, int, int, int]]:
+        """
+        Bande di uscita con le righe sorgente corrispondenti
+
+        I confini cadono su multipli del rapporto di scala ridotto, così ogni
+        banda ha lo stesso rapporto tra righe sorgente e righe di uscita
+        dell'intero frame e le stesse coordinate di campionamento.
+
+        Returns:
+            List[Tuple[int, int, int, int]]: (riga sorgente iniziale, finale,
+            riga di uscita iniziale, finale) di ogni banda, alone escluso
+        """
+        units = gcd(src_height, dst_height)
+        unit_src = src_height // units
+        unit_dst = dst_height // units
+        count = max(1, min(self.bands, dst_height // self.min_band_rows, units))
+        # Con un alone più alto delle bande non conviene dividere
+        if halo and units // count * unit_src < halo:
+            count = 1
+        edges = [units * i // count for i in range(count + 1)]
+        return [(a * unit_src, b * unit_src, a * unit_dst, b * unit_dst) for a, b in zip(edges[:-1], edges[1:])]
+
+    def _resize_tiled(self, frame: np.ndarray, dst: np.ndarray, interpolation: int, halo: int) -> np.ndarray:
+        src_height = frame.shape[0]
+        height, width = dst.shape[:2]
+        bands = self._bands(src_height, height, halo)
+        if len(bands) == 1:
+            return cv2.resize(frame, (width, height), dst=dst, interpolation=interpolation)
+
+        # Alone arrotondato a un multiplo delle righe sorgente di un'unità di scala
+        unit_src = src_height // gcd(src_height, height)
+        halo = -(-halo // unit_src) * unit_src
+        pool = shared_pool()
+        futures = [
+            pool.submit(self._resize_band, index, frame, dst, interpolation, halo, *band)
+            for index, band in enumerate(bands[1:], start=1)
+        ]
+        # La prima banda viene elaborata dal thread chiamante
+        self._resize_band(0, frame, dst, interpolation, halo, *bands[0])
+        for future in futures:
+            future.result()
+        return dst
+
+    def _resize_band(self, index: int, frame: np.ndarray, dst: np.ndarray, interpolation: int, halo: int,
+                     s0: int, s1: int, d0: int, d1: int):
+        top = max(0, s0 - halo)
+        bottom = min(frame.shape[0], s1 + halo)
+        ratio = dst.shape[0] / frame.shape[0]
+        band_rows = int(round((bottom - top) * ratio))
+        buffer = self._buffer(f'band{index}', (band_rows,) + dst.shape[1:])
+        cv2.resize(frame[top:bottom], (dst.shape[1], band_rows), dst=buffer, interpolation=interpolation)
+        offset = int(round((s0 - top) * ratio))
+        dst[d0:d1] = buffer[offset:offset + d1 - d0]
+
+    def _enhance_edges(self, frame: np.ndarray) -> np.ndarray:
+        """
+        Nitidezza adattiva ai bordi alla risoluzione della sorgente
+
+        Maschera di contrasto con soglia (coring): il dettaglio sotto
+        sharpen_threshold viene ignorato, quindi il rumore delle zone
+        uniformi non viene amplificato mentre i bordi vengono rinforzati
+        prima che l'interpolazione bicubica li ammorbidisca.
+        """
+        shape = frame.shape
+        blur = cv2.GaussianBlur(frame, (0, 0), 1.0, dst=self._buffer('blur', shape))
+        positive = cv2.subtract(frame, blur, dst=self._buffer('positive', shape))
+        negative = cv2.subtract(blur, frame, dst=self._buffer('negative', shape))
+        threshold = (self.sharpen_threshold,) * 4
+        cv2.subtract(positive, threshold, dst=positive)
+        cv2.subtract(negative, threshold, dst=negative)
+        enhanced = self._buffer('enhanced', shape)
+        cv2.addWeighted(frame, 1.0, positive, self.sharpen_amount, 0, dst=enhanced)
+        cv2.addWeighted(enhanced, 1.0, negative, -self.sharpen_amount, 0, dst=enhanced)
+        return enhanced
+
+    def _run_dnn(self, frame: np.ndarray, dst: np.ndarray) -> np.ndarray:
+        """Super-risoluzione con il modello, poi adattamento alla dimensione di uscita"""
+        channels = 1 if frame.ndim == 2 else frame.shape[2]
+        # I modelli lavorano su BGR a 3 canali
+        if channels == 4:
+            source = cv2.cvtColor(frame, cv2.COLOR_BGRA2BGR, dst=self._buffer('dnn_in', frame.shape[:2] + (3,)))
+        elif channels == 1:
+            source = cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR, dst=self._buffer('dnn_in', frame.shape + (3,)))
+        else:
+            source = frame
+        result = self._model.upsample(source)
+
+        height, width = dst.shape[:2]
+        if result.shape[:2] != (height, width):
+            interpolation = cv2.INTER_AREA if result.shape[0] > height else cv2.INTER_CUBIC
+            result = cv2.resize(result, (width, height), interpolation=interpolation)
+        if channels == 4:
+            return cv2.cvtColor(result, cv2.COLOR_BGR2BGRA, dst=dst)
+        if channels == 1:
+            return cv2.cvtColor(result, cv2.COLOR_BGR2GRAY, dst=dst)
+        np.copyto(dst, result)
+        return dst
+
+    def report(self) -> Dict[str, Any]:
+        """
+        Stato dell'ingrandimento
+
+        Returns:
+            Dict[str, Any]: dimensione di uscita, metodo richiesto e usato,
+            tempi misurati per metodo
+        """
+        budget = self.budget_ms if self.budget_ms is not None else 0.0
+        return {
+            'output_size': self.output_size,
+            'method': self.method,
+            'last_method': self.last_method,
+            'model': self.model_path,
+            'timings': {name: timer.summary(budget) for name, timer in self.timers.items() if timer.count}
+        }
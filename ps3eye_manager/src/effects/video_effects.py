@@ -1,9 +1,18 @@
 import cv2
+import time
+import threading
 import numpy as np
-from typing import Callable, Dict, Optional
+from typing import Any, Callable, Dict, Optional, Tuple
 from dataclasses import dataclass
 from abc import ABC, abstractmethod
 
+from effects.fusion import PointwiseKernel, frame_channels
+from effects.tiling import current_band
+from core.pixel_format import PixelFormat
+
+# Formati con i canali colore in ordine BGR, quello assunto dalle conversioni in grigio di OpenCV
+_BGR_ORDER = (PixelFormat.BGRA, PixelFormat.BGR, PixelFormat.GRAY)
+
 @dataclass
 class EffectParams:
     """Parametri configurabili per gli effetti video"""
@@ -11,146 +20,655 @@ class EffectParams:
     kernel_size: int = 3
     threshold: int = 127
     color: tuple = (0, 0, 0)
+    processing_scale: float = 1.0  # Risoluzione di elaborazione (0.5 = metà, 0.25 = un quarto)
 
 class VideoEffect(ABC):
     """Classe base per gli effetti video"""
     
+    # Gli effetti puntuali possono essere fusi con quelli adiacenti
+    fusible = False
+    
+    # Degradazioni consentite allo scheduler quando il budget per frame è superato
+    scalable = True    # Può essere elaborato a risoluzione ridotta
+    optional = False   # Può essere saltato
+    reusable = False   # Il risultato può essere riutilizzato per alcuni frame
+    
+    # Un effetto animato cambia il risultato anche su frame identici: la catena
+    # non riusa l'uscita precedente per i frame invariati
+    animated = False
+    
+    # Geometria del frame da cui dipendono i dati precalcolati: 'channels' e/o 'size'
+    precompute_depends_on: Tuple[str, ...] = ()
+    
+    # Formati accettati (vuoto = qualsiasi ordine dei canali) e formato dei
+    # frame ricevuti, impostato dalla catena quando il formato in ingresso è noto
+    accepted_formats: Tuple[PixelFormat, ...] = ()
+    input_format: Optional[PixelFormat] = None
+    
     def __init__(self):
         self.params = EffectParams()
+        self.version = 0  # Incrementato ad ogni modifica effettiva dei parametri
+        self.allocations = 0  # Buffer di lavoro allocati (costante a regime)
+        self.precompute_count = 0  # Ricalcoli dei dati derivati (solo a parametri cambiati)
+        self._buffers: Dict[str, np.ndarray] = {}
+        self._precompute_cache: Optional[Tuple[tuple, Any]] = None
     
     @abstractmethod
-    def apply(self, frame: np.ndarray) -> np.ndarray:
-        """Applica l'effetto al frame"""
+    def apply(self, frame: np.ndarray, dst: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Applica l'effetto al frame
+        
+        Args:
+            frame: Frame in ingresso, mai modificato
+            dst: Buffer di destinazione con la stessa forma del frame (opzionale)
+            
+        Returns:
+            np.ndarray: Il frame elaborato (dst se fornito)
+        """
         pass
     
+    def precompute(self, frame: np.ndarray) -> Any:
+        """
+        Calcola i dati derivati dai parametri (kernel, matrici, LUT, ...)
+        
+        Le sottoclassi lo ridefiniscono per spostare fuori dal ciclo per frame
+        tutto ciò che non dipende dai pixel. Viene chiamato solo quando cambia
+        la versione dei parametri o la geometria dichiarata in
+        precompute_depends_on.
+        
+        Args:
+            frame: Frame corrente (usato solo per la geometria)
+        """
+        return None
+    
+    def _precomputed(self, frame: np.ndarray) -> Any:
+        """Restituisce i dati di precompute(), ricalcolandoli solo se necessario"""
+        key = (self.version,)
+        if 'channels' in self.precompute_depends_on:
+            key += (frame_channels(frame),)
+        if 'size' in self.precompute_depends_on:
+            key += (frame.shape[:2],)
+        # Chiave e dati in un'unica tupla: le bande parallele leggono sempre una coppia coerente
+        cache = self._precompute_cache
+        if cache is None or cache[0] != key:
+            cache = (key, self.precompute(frame))
+            self._precompute_cache = cache
+            self.precompute_count += 1
+        return cache[1]
+    
+    def tile_halo(self) -> Optional[int]:
+        """
+        Righe di contesto necessarie sopra e sotto una banda del frame
+        
+        Returns:
+            Optional[int]: Raggio verticale del kernel, None se l'effetto non può
+            essere eseguito a bande (non locale o con stato)
+        """
+        return None
+    
+    def _scratch(self, key: str, shape: Tuple[int, ...], dtype=np.uint8) -> np.ndarray:
+        """Buffer di lavoro persistente, riallocato solo quando cambia la geometria"""
+        band = current_band()
+        if band is not None:
+            # Ogni banda ha i propri buffer: le bande vengono elaborate in parallelo
+            key = (key, band)
+        buffer = self._buffers.get(key)
+        if buffer is None or buffer.shape != shape or buffer.dtype != dtype:
+            buffer = np.empty(shape, dtype)
+            self._buffers[key] = buffer
+            self.allocations += 1
+        return buffer
+    
+    @staticmethod
+    def _output(frame: np.ndarray, dst: Optional[np.ndarray]) -> np.ndarray:
+        return dst if dst is not None else np.empty_like(frame)
+    
     def set_params(self, **kwargs):
         """Imposta i parametri dell'effetto"""
         for key, value in kwargs.items():
-            if hasattr(self.params, key):
+            if hasattr(self.params, key) and getattr(self.params, key) != value:
                 setattr(self.params, key, value)
+                self.version += 1
+
+class PointwiseEffect(VideoEffect):
+    """
+    Classe base per gli effetti puntuali (ogni pixel dipende solo da sé stesso)
+    
+    Le sottoclassi descrivono l'effetto come PointwiseKernel; la catena fonde
+    gli effetti puntuali adiacenti in un'unica passata sul frame.
+    """
+    
+    fusible = True
+    precompute_depends_on = ('channels',)
+    
+    @abstractmethod
+    def pointwise_kernel(self, channels: int) -> PointwiseKernel:
+        """Restituisce il kernel dell'effetto per frame con il numero di canali indicato"""
+        pass
+    
+    def tile_halo(self) -> Optional[int]:
+        return 0
+    
+    def precompute(self, frame: np.ndarray) -> PointwiseKernel:
+        return self.pointwise_kernel(frame_channels(frame))
+    
+    def apply(self, frame: np.ndarray, dst: Optional[np.ndarray] = None) -> np.ndarray:
+        return self._precomputed(frame).apply(frame, dst)
+
+def _color_channels(channels: int) -> int:
+    """Canali colore di un frame (il quarto canale è l'alpha e non viene toccato)"""
+    return 3 if channels == 4 else channels
+
+class BrightnessEffect(PointwiseEffect):
+    """Guadagno di luminosità (intensity = fattore moltiplicativo)"""
+    
+    def pointwise_kernel(self, channels: int) -> PointwiseKernel:
+        luts = PointwiseKernel.identity(channels).luts
+        luts[:_color_channels(channels)] = np.clip(np.arange(256) * self.params.intensity, 0, 255).astype(np.uint8)
+        return PointwiseKernel(np.arange(channels), luts)
+
+class InvertEffect(PointwiseEffect):
+    """Negativo dei colori"""
+    
+    def pointwise_kernel(self, channels: int) -> PointwiseKernel:
+        luts = PointwiseKernel.identity(channels).luts
+        luts[:_color_channels(channels)] = np.arange(255, -1, -1, dtype=np.uint8)
+        return PointwiseKernel(np.arange(channels), luts)
+
+class ChannelSwapEffect(PointwiseEffect):
+    """Scambia i canali rosso e blu (RGB <-> BGR)"""
+    
+    def pointwise_kernel(self, channels: int) -> PointwiseKernel:
+        perm = np.arange(channels)
+        if channels >= 3:
+            perm[[0, 2]] = perm[[2, 0]]
+        return PointwiseKernel(perm, PointwiseKernel.identity(channels).luts)
+
+def _to_gray(frame: np.ndarray, dst: np.ndarray) -> np.ndarray:
+    """Converte un frame a 1, 3 o 4 canali in scala di grigi dentro dst"""
+    channels = frame_channels(frame)
+    if channels == 1:
+        np.copyto(dst, frame.reshape(dst.shape))
+        return dst
+    code = cv2.COLOR_BGRA2GRAY if channels == 4 else cv2.COLOR_BGR2GRAY
+    return cv2.cvtColor(frame, code, dst=dst)
+
+def _from_gray(gray: np.ndarray, dst: np.ndarray) -> np.ndarray:
+    """Espande un'immagine in scala di grigi al numero di canali di dst"""
+    channels = frame_channels(dst)
+    if channels == 1:
+        np.copyto(dst, gray.reshape(dst.shape))
+        return dst
+    code = cv2.COLOR_GRAY2BGRA if channels == 4 else cv2.COLOR_GRAY2BGR
+    return cv2.cvtColor(gray, code, dst=dst)
 
 class BlurEffect(VideoEffect):
     """Effetto di sfocatura"""
     
-    def apply(self, frame: np.ndarray) -> np.ndarray:
+    def _kernel_size(self) -> int:
         k = self.params.kernel_size
-        if k % 2 == 0:
-            k += 1  # Il kernel deve essere dispari
-        return cv2.GaussianBlur(frame, (k, k), self.params.intensity)
+        return k + 1 if k % 2 == 0 else k  # Il kernel deve essere dispari
+    
+    def tile_halo(self) -> Optional[int]:
+        return self._kernel_size() // 2
+    
+    def precompute(self, frame: np.ndarray) -> Tuple[Tuple[int, int], float]:
+        k = self._kernel_size()
+        return (k, k), float(self.params.intensity)
+    
+    def apply(self, frame: np.ndarray, dst: Optional[np.ndarray] = None) -> np.ndarray:
+        ksize, sigma = self._precomputed(frame)
+        return cv2.GaussianBlur(frame, ksize, sigma, dst=self._output(frame, dst))
 
 class SharpenEffect(VideoEffect):
     """Effetto di nitidezza"""
     
-    def apply(self, frame: np.ndarray) -> np.ndarray:
-        kernel = np.array([
+    optional = True
+    
+    def tile_halo(self) -> Optional[int]:
+        return 1
+    
+    def precompute(self, frame: np.ndarray) -> np.ndarray:
+        return np.array([
             [-1, -1, -1],
             [-1,  9, -1],
             [-1, -1, -1]
         ]) * self.params.intensity
-        return cv2.filter2D(frame, -1, kernel)
+    
+    def apply(self, frame: np.ndarray, dst: Optional[np.ndarray] = None) -> np.ndarray:
+        return cv2.filter2D(frame, -1, self._precomputed(frame), dst=self._output(frame, dst))
 
 class EdgeDetectionEffect(VideoEffect):
-    """Effetto di rilevamento dei bordi"""
+    """
+    Effetto di rilevamento dei bordi
+    
+    Non viene eseguito a bande: l'isteresi di Canny segue i bordi deboli
+    collegati a uno forte per tutto il frame, quindi nessun alone finito
+    rende il risultato a bande identico a quello in un'unica passata.
+    """
     
-    def apply(self, frame: np.ndarray) -> np.ndarray:
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        edges = cv2.Canny(gray, self.params.threshold, self.params.threshold * 2)
-        return cv2.cvtColor(edges, cv2.COLOR_GRAY2BGR)
+    accepted_formats = _BGR_ORDER
+    
+    def apply(self, frame: np.ndarray, dst: Optional[np.ndarray] = None) -> np.ndarray:
+        size = frame.shape[:2]
+        gray = _to_gray(frame, self._scratch('gray', size))
+        edges = cv2.Canny(gray, self.params.threshold, self.params.threshold * 2,
+                          edges=self._scratch('edges', size))
+        return _from_gray(edges, self._output(frame, dst))
 
 class CartoonEffect(VideoEffect):
-    """Effetto cartone animato"""
+    """
+    Effetto cartone animato
+    
+    La palette viene stimata con k-means su un sottocampione del frame solo
+    ogni refit_interval frame o quando la scena cambia; tra un aggiornamento e
+    l'altro ogni frame viene quantizzato con una LUT 3D precalcolata
+    (colore ridotto a 5 bit per canale -> colore della palette più vicino).
+    Dopo la prima stima gli aggiornamenti avvengono in un thread separato e
+    la nuova LUT sostituisce la precedente quando è pronta.
+    """
+    
+    refit_interval = 60        # Frame tra due stime della palette
+    scene_change_threshold = 12.0  # Differenza media (0-255) oltre la quale la palette viene ristimata
+    max_samples = 4096         # Pixel usati per la stima della palette
+    lut_bits = 5               # Bit per canale della LUT 3D
+    reusable = True
+    accepted_formats = _BGR_ORDER
+    
+    def __init__(self):
+        super().__init__()
+        self._palette_lut: Optional[np.ndarray] = None
+        self._palette_key = None
+        self._palette_thumb: Optional[np.ndarray] = None
+        self._frames_since_fit = 0
+        self._fit_thread: Optional[threading.Thread] = None
+        grid = (np.arange(1 << self.lut_bits, dtype=np.float32) + 0.5) * (1 << (8 - self.lut_bits))
+        self._lut_grid = np.stack(np.meshgrid(grid, grid, grid, indexing='ij'), -1).reshape(-1, 3)
+    
+    def _num_colors(self) -> int:
+        return max(2, int(256 * self.params.intensity))
     
-    def apply(self, frame: np.ndarray) -> np.ndarray:
-        # Riduce i colori
-        num_colors = int(256 * self.params.intensity)
-        if num_colors < 2:
-            num_colors = 2
+    def _needs_refit(self, gray: np.ndarray) -> Tuple[bool, np.ndarray]:
+        """Decide se ristimare la palette (intervallo scaduto, parametri o scena cambiati)"""
+        thumb = cv2.resize(gray, (32, 24), dst=self._scratch('thumb', (24, 32)), interpolation=cv2.INTER_AREA)
+        if self._palette_lut is None or self._palette_key != self._num_colors():
+            return True, thumb
+        if self._frames_since_fit >= self.refit_interval:
+            return True, thumb
+        score = cv2.absdiff(thumb, self._palette_thumb, dst=self._scratch('thumb_diff', (24, 32))).mean()
+        return score > self.scene_change_threshold, thumb
+    
+    def _sample(self, color: np.ndarray) -> np.ndarray:
+        """Sottocampiona il frame per la stima della palette"""
+        step = max(1, int(np.sqrt(color.shape[0] * color.shape[1] / self.max_samples)))
+        return np.float32(color[::step, ::step]).reshape((-1, 3))
+    
+    def _fit_palette(self, data: np.ndarray, num_colors: int):
+        """Stima la palette sui campioni e ricostruisce la LUT 3D"""
+        num_colors = min(num_colors, len(data))
         
-        # Quantizza i colori
-        data = np.float32(frame).reshape((-1, 3))
-        criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 20, 0.001)
-        _, labels, centers = cv2.kmeans(data, num_colors, None, criteria, 10, cv2.KMEANS_RANDOM_CENTERS)
+        criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 10, 1.0)
+        _, _, centers = cv2.kmeans(data, num_colors, None, criteria, 1, cv2.KMEANS_RANDOM_CENTERS)
+        
+        # Colore della palette più vicino per ogni cella della LUT: |g|^2 - 2 g.c + |c|^2
+        distances = (centers ** 2).sum(axis=1)[None, :] - 2.0 * (self._lut_grid @ centers.T)
+        nearest = distances.argmin(axis=1)
+        self._palette_lut = np.clip(centers, 0, 255).astype(np.uint8)[nearest]
+    
+    def _quantize(self, color: np.ndarray) -> np.ndarray:
+        """Quantizza i colori attraverso la LUT 3D"""
+        shift = 8 - self.lut_bits
+        size = color.shape[:2]
+        index = self._scratch('index', size, np.uint16)
+        part = self._scratch('index_part', size, np.uint16)
+        np.right_shift(color[..., 0], shift, out=index)
+        np.left_shift(index, 2 * self.lut_bits, out=index)
+        np.right_shift(color[..., 1], shift, out=part)
+        np.left_shift(part, self.lut_bits, out=part)
+        np.bitwise_or(index, part, out=index)
+        np.right_shift(color[..., 2], shift, out=part)
+        np.bitwise_or(index, part, out=index)
+        return np.take(self._palette_lut, index, axis=0, out=self._scratch('quantized', size + (3,)), mode='clip')
+    
+    def apply(self, frame: np.ndarray, dst: Optional[np.ndarray] = None) -> np.ndarray:
+        size = frame.shape[:2]
+        if frame.ndim == 2:
+            color = cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR, dst=self._scratch('color', size + (3,)))
+        else:
+            color = frame[..., :3]
+        gray = _to_gray(frame, self._scratch('gray', size))
+        
+        refit, thumb = self._needs_refit(gray)
+        if refit and not (self._fit_thread and self._fit_thread.is_alive()):
+            num_colors = self._num_colors()
+            data = self._sample(color)
+            if self._palette_lut is None or self._palette_key != num_colors:
+                # Prima stima o numero di colori cambiato: la palette serve subito
+                self._fit_palette(data, num_colors)
+            else:
+                # Non daemon: un thread interrotto dentro OpenCV alla chiusura dell'interprete lo fa abortire
+                self._fit_thread = threading.Thread(target=self._fit_palette, args=(data, num_colors))
+                self._fit_thread.start()
+            self._palette_key = num_colors
+            self._palette_thumb = thumb.copy()
+            self._frames_since_fit = 0
+        self._frames_since_fit += 1
         
-        # Ricostruisce l'immagine
-        centers = np.uint8(centers)
-        quantized = centers[labels.flatten()]
-        quantized = quantized.reshape(frame.shape)
+        # Quantizza i colori
+        quantized = self._quantize(color)
         
         # Aggiunge bordi
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        k = self.params.kernel_size
+        if k % 2 == 0:
+            k += 1  # Il blocco della soglia adattiva deve essere dispari
         edges = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_MEAN_C, 
-                                    cv2.THRESH_BINARY, self.params.kernel_size, 2)
-        edges = cv2.cvtColor(edges, cv2.COLOR_GRAY2BGR)
+                                    cv2.THRESH_BINARY, max(3, k), 2,
+                                    dst=self._scratch('edges', size))
+        edges = cv2.cvtColor(edges, cv2.COLOR_GRAY2BGR, dst=self._scratch('edges_color', size + (3,)))
+        
+        dst = self._output(frame, dst)
+        channels = frame_channels(frame)
+        if channels == 3:
+            return cv2.bitwise_and(quantized, edges, dst=dst)
         
-        return cv2.bitwise_and(quantized, edges)
+        cv2.bitwise_and(quantized, edges, dst=quantized)
+        if channels == 4:
+            # Copia i colori e conserva il canale alpha del frame originale
+            cv2.mixChannels([quantized, frame], [dst], [0, 0, 1, 1, 2, 2, 6, 3])
+            return dst
+        return cv2.cvtColor(quantized, cv2.COLOR_BGR2GRAY, dst=dst)
 
 class NightVisionEffect(VideoEffect):
-    """Effetto visione notturna"""
+    """
+    Effetto visione notturna
+    
+    Il rumore viene generato una sola volta per risoluzione in un banco di
+    texture, separate in parte positiva e negativa (uint8); ad ogni frame si
+    sceglie una texture con uno scostamento casuale e la si applica con somma
+    e sottrazione saturate, senza generare numeri casuali per pixel.
+    """
+    
+    noise_sigma = 2.0    # Deviazione standard del rumore (livelli di grigio)
+    noise_textures = 4   # Texture nel banco
+    noise_margin = 32    # Righe/colonne extra per gli scostamenti casuali
     
-    def apply(self, frame: np.ndarray) -> np.ndarray:
+    precompute_depends_on = ('size',)
+    accepted_formats = _BGR_ORDER
+    animated = True  # Il rumore cambia ad ogni frame anche a scena ferma
+    
+    def __init__(self):
+        super().__init__()
+        self._rng = np.random.default_rng()
+    
+    def precompute(self, frame: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Genera il banco di texture di rumore per la risoluzione del frame"""
+        height, width = frame.shape[:2]
+        shape = (self.noise_textures, height + self.noise_margin, width + self.noise_margin)
+        noise = np.rint(self._rng.standard_normal(shape, dtype=np.float32) * self.noise_sigma)
+        positive = np.clip(noise, 0, 255).astype(np.uint8)
+        negative = np.clip(-noise, 0, 255).astype(np.uint8)
+        self.allocations += 2
+        return positive, negative
+    
+    def apply(self, frame: np.ndarray, dst: Optional[np.ndarray] = None) -> np.ndarray:
+        size = frame.shape[:2]
+        height, width = size
+        
         # Converti in scala di grigi e aumenta la luminosità
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        gray = cv2.multiply(gray, self.params.intensity)
+        gray = _to_gray(frame, self._scratch('gray', size))
+        boosted = cv2.convertScaleAbs(gray, dst=self._scratch('boosted', size), alpha=self.params.intensity)
         
         # Applica un leggero blur per ridurre il rumore
-        gray = cv2.GaussianBlur(gray, (5, 5), 0)
+        gray = cv2.GaussianBlur(boosted, (5, 5), 0, dst=gray)
+        
+        # Aggiungi il rumore del banco (somma e sottrazione saturate)
+        positive, negative = self._precomputed(frame)
+        texture = int(self._rng.integers(self.noise_textures))
+        dy = int(self._rng.integers(self.noise_margin + 1))
+        dx = int(self._rng.integers(self.noise_margin + 1))
+        cv2.add(gray, positive[texture, dy:dy + height, dx:dx + width], dst=gray)
+        cv2.subtract(gray, negative[texture, dy:dy + height, dx:dx + width], dst=gray)
         
         # Crea l'effetto verde della visione notturna
-        result = np.zeros_like(frame)
-        result[:, :, 1] = gray  # Canal verde
+        result = self._output(frame, dst)
+        if frame_channels(frame) == 1:
+            np.copyto(result, gray.reshape(result.shape))
+            return result
+        result.fill(0)
+        result[:, :, 1] = gray  # Canale verde
+        if frame_channels(frame) == 4:
+            result[:, :, 3] = 255  # Alpha opaco
+        return result
+
+class TemporalDenoiseEffect(VideoEffect):
+    """
+    Riduzione temporale del rumore
+    
+    Mantiene una media mobile esponenziale dei frame in un accumulatore
+    persistente, aggiornato sul posto ad ogni frame. Dove il frame si discosta
+    dalla media più di motion_threshold (movimento) l'accumulatore riparte
+    dal frame corrente, così le parti in movimento non lasciano scie.
+    
+    intensity regola la forza: 0 = nessun filtro, 1 = media su circa 5 frame.
+    
+    L'effetto ha uno stato per pixel, quindi non viene mai elaborato a
+    risoluzione ridotta.
+    """
+    
+    motion_threshold = 20  # Differenza (0-255) oltre la quale un pixel è in movimento
+    optional = True
+    scalable = False
+    
+    def __init__(self):
+        super().__init__()
+        self._state_shape = None
+    
+    def reset(self):
+        """Azzera la media accumulata (ripartirà dal prossimo frame)"""
+        self._state_shape = None
+    
+    def precompute(self, frame: np.ndarray) -> float:
+        # Peso del nuovo frame nella media
+        return 1.0 / (1.0 + 4.0 * max(0.0, self.params.intensity))
+    
+    def apply(self, frame: np.ndarray, dst: Optional[np.ndarray] = None) -> np.ndarray:
+        size = frame.shape[:2]
+        result = self._output(frame, dst)
+        accumulator = self._scratch('accumulator', frame.shape, np.float32)
+        
+        if self._state_shape != frame.shape:
+            # Primo frame o cambio di risoluzione: la media parte dal frame
+            accumulator[...] = frame
+            self._state_shape = frame.shape
+            np.copyto(result, frame)
+            return result
         
-        # Aggiungi un po' di rumore casuale
-        noise = np.random.normal(0, 2, gray.shape).astype(np.uint8)
-        result[:, :, 1] = cv2.add(result[:, :, 1], noise)
+        # Media esponenziale su tutto il frame, scritta direttamente nel risultato
+        alpha = self._precomputed(frame)
+        cv2.accumulateWeighted(frame, accumulator, alpha)
+        cv2.convertScaleAbs(accumulator, dst=result)
         
+        # Maschera di movimento: la nuova media dista dal frame (1 - alpha) volte
+        # quanto l'uscita precedente, quindi la soglia viene scalata di conseguenza
+        diff = cv2.absdiff(frame, result, dst=self._scratch('diff', frame.shape))
+        diff_gray = diff if frame.ndim == 2 else _to_gray(diff, self._scratch('diff_gray', size))
+        moving = cv2.threshold(diff_gray, self.motion_threshold * (1.0 - alpha), 255, cv2.THRESH_BINARY,
+                               dst=self._scratch('moving', size))[1]
+        
+        # Sulle zone in movimento media e risultato ripartono dal frame corrente
+        cv2.accumulateWeighted(frame, accumulator, 1.0, mask=moving)
+        cv2.copyTo(frame, moving, dst=result)
         return result
 
+@dataclass
+class WhiteBalanceParams(EffectParams):
+    """Parametri del bilanciamento del bianco automatico"""
+    method: str = 'gray_world'        # 'gray_world' o 'white_patch'
+    update_interval: int = 4          # Frame tra due stime dei guadagni
+    hardware_writeback: bool = False  # Riporta i guadagni nei registri WHITEBALANCE_* della telecamera
+
+class AutoWhiteBalanceEffect(VideoEffect):
+    """
+    Bilanciamento del bianco automatico
+
+    Ogni update_interval frame stima i guadagni per canale su una miniatura
+    del frame (gray world: medie dei canali uguali; white patch: i pixel più
+    chiari diventano neutri), li smorza nel tempo per evitare sfarfallii e li
+    applica con una LUT per canale in una sola passata sul frame.
+
+    intensity regola la forza della correzione (0 = nessuna, 1 = completa).
+    Con hardware_writeback e un hardware_sink impostato, i guadagni stabili
+    vengono riportati nei registri della telecamera e la correzione software
+    riparte da zero.
+    """
+
+    channel_order = 'RGB'          # Ordine dei canali se la catena non indica input_format (frame RGBA della telecamera)
+    thumb_size = (80, 60)          # Miniatura su cui vengono stimati i guadagni
+    smoothing = 0.25               # Peso di una nuova stima nei guadagni correnti
+    gain_limits = (0.5, 2.0)
+    saturation_level = 250         # Pixel saturati esclusi dalla media gray world
+    white_patch_percentile = 0.99  # Livello dei pixel "bianchi" per il white patch
+    stable_tolerance = 0.02        # Scarto massimo tra stima e guadagni per considerarli stabili
+    writeback_interval = 2.0       # Secondi minimi tra due scritture nei registri
+    optional = True
+    scalable = False
+
+    def __init__(self):
+        super().__init__()
+        self.params = WhiteBalanceParams()
+        # Chiamato con {'red': g, 'green': g, 'blue': g}; restituisce True se i registri sono stati scritti
+        self.hardware_sink: Optional[Callable[[Dict[str, float]], bool]] = None
+        self.estimate_count = 0
+        self.writeback_count = 0
+        self._gains = np.ones(3, np.float64)
+        self._lut_key = None
+        self._frames_since_estimate = 0
+        self._last_writeback = 0.0
+
+    def reset(self):
+        """Riporta i guadagni a 1 (la stima riparte dal prossimo frame)"""
+        self._gains[:] = 1.0
+        self._lut_key = None
+        self._frames_since_estimate = 0
+
+    @property
+    def gains(self) -> Dict[str, float]:
+        """Guadagni correnti per colore ('red', 'green', 'blue')"""
+        fmt = self.input_format
+        order = fmt.value[:3] if fmt is not None and fmt.channels >= 3 else self.channel_order
+        return {
+            name: float(self._gains[order.index(name[0].upper())])
+            for name in ('red', 'green', 'blue')
+        }
+
+    def apply(self, frame: np.ndarray, dst: Optional[np.ndarray] = None) -> np.ndarray:
+        result = self._output(frame, dst)
+        channels = frame_channels(frame)
+        if channels < 3:
+            np.copyto(result, frame)
+            return result
+
+        self._frames_since_estimate += 1
+        if self._lut_key is None or self._frames_since_estimate >= max(1, int(self.params.update_interval)):
+            self._frames_since_estimate = 0
+            self._estimate(frame, channels)
+
+        return cv2.LUT(frame, self._lut(channels), dst=result)
+
+    def _estimate(self, frame: np.ndarray, channels: int):
+        """Stima i guadagni sulla miniatura e li smorza nel tempo"""
+        width, height = self.thumb_size
+        thumb = cv2.resize(frame, self.thumb_size, dst=self._scratch('thumb', (height, width, channels)),
+                           interpolation=cv2.INTER_NEAREST)
+
+        if self.params.method == 'white_patch':
+            # Livello del percentile alto di ogni canale dall'istogramma
+            hist = self._scratch('hist', (256, 1), np.float32)
+            cumulative = self._scratch('cumulative', (256,), np.float32)
+            target = self.white_patch_percentile * width * height
+            levels = []
+            for c in range(3):
+                cv2.calcHist([thumb], [c], None, [256], [0, 256], hist=hist)
+                np.cumsum(hist[:, 0], out=cumulative)
+                levels.append(float(np.searchsorted(cumulative, target)))
+            reference = max(levels)
+        else:
+            # Media dei canali sui pixel non saturati
+            upper = (self.saturation_level - 1,) * 3 + (255,) * (channels - 3)
+            mask = cv2.inRange(thumb, (0,) * channels, upper, dst=self._scratch('mask', (height, width)))
+            if cv2.countNonZero(mask) == 0:
+                return
+            levels = cv2.mean(thumb, mask=mask)[:3]
+            reference = sum(levels) / 3.0
+
+        low, high = self.gain_limits
+        estimate = [min(high, max(low, reference / max(level, 1.0))) for level in levels]
+        stable = True
+        for c in range(3):
+            stable &= abs(estimate[c] - self._gains[c]) < self.stable_tolerance
+            self._gains[c] += self.smoothing * (estimate[c] - self._gains[c])
+        self.estimate_count += 1
+
+        if stable and self.params.hardware_writeback and self.hardware_sink is not None:
+            self._write_back()
+
+    def _write_back(self):
+        """Riporta i guadagni stabili nei registri della telecamera"""
+        if max(abs(g - 1.0) for g in self._gains) < self.stable_tolerance:
+            return
+        now = time.monotonic()
+        if now - self._last_writeback < self.writeback_interval:
+            return
+        self._last_writeback = now
+        try:
+            written = self.hardware_sink(self.gains)
+        except Exception:
+            written = False
+        if written:
+            # I frame successivi arrivano già corretti dal sensore
+            self.writeback_count += 1
+            self._gains[:] = 1.0
+
+    def _lut(self, channels: int) -> np.ndarray:
+        """LUT per canale dei guadagni correnti, ricostruita solo quando cambiano"""
+        strength = min(1.0, max(0.0, self.params.intensity))
+        gains = tuple(round(1.0 + strength * (g - 1.0), 3) for g in self._gains)
+        lut = self._scratch('lut', (1, 256, channels))
+        if self._lut_key != (gains, channels):
+            ramp = np.arange(256, dtype=np.float32)
+            for c in range(channels):
+                if c < 3:
+                    lut[0, :, c] = np.clip(ramp * gains[c] + 0.5, 0, 255)
+                else:
+                    lut[0, :, c] = ramp  # Alpha invariato
+            self._lut_key = (gains, channels)
+        return lut
+
 class MirrorEffect(VideoEffect):
     """Effetto specchio"""
     
-    def apply(self, frame: np.ndarray) -> np.ndarray:
-        return cv2.flip(frame, 1)
+    scalable = False
+    
+    def tile_halo(self) -> Optional[int]:
+        return 0  # Il flip orizzontale lavora riga per riga
+    
+    def apply(self, frame: np.ndarray, dst: Optional[np.ndarray] = None) -> np.ndarray:
+        return cv2.flip(frame, 1, dst=self._output(frame, dst))
 
 class RotateEffect(VideoEffect):
     """Effetto rotazione"""
     
-    def apply(self, frame: np.ndarray) -> np.ndarray:
+    precompute_depends_on = ('size',)
+    
+    def precompute(self, frame: np.ndarray) -> Tuple[np.ndarray, Tuple[int, int]]:
         angle = self.params.intensity * 360
-        center = tuple(np.array(frame.shape[1::-1]) / 2)
-        rot_mat = cv2.getRotationMatrix2D(center, angle, 1.0)
-        return cv2.warpAffine(frame, rot_mat, frame.shape[1::-1], flags=cv2.INTER_LINEAR)
-
-class VideoEffectChain:
-    """
-    Gestisce una catena di effetti video che possono essere applicati in sequenza
-    """
+        dsize = frame.shape[1::-1]
+        center = (dsize[0] / 2, dsize[1] / 2)
+        return cv2.getRotationMatrix2D(center, angle, 1.0), dsize
     
-    def __init__(self):
-        self.effects: Dict[str, VideoEffect] = {
-            'blur': BlurEffect(),
-            'sharpen': SharpenEffect(),
-            'edge': EdgeDetectionEffect(),
-            'cartoon': CartoonEffect(),
-            'night_vision': NightVisionEffect(),
-            'mirror': MirrorEffect(),
-            'rotate': RotateEffect()
-        }
-        self.active_effects: Dict[str, bool] = {name: False for name in self.effects}
-    
-    def toggle_effect(self, effect_name: str, active: bool = True):
-        """Attiva o disattiva un effetto"""
-        if effect_name in self.active_effects:
-            self.active_effects[effect_name] = active
-    
-    def set_effect_params(self, effect_name: str, **params):
-        """Imposta i parametri per un effetto specifico"""
-        if effect_name in self.effects:
-            self.effects[effect_name].set_params(**params)
-    
-    def apply_effects(self, frame: np.ndarray) -> np.ndarray:
-        """Applica tutti gli effetti attivi al frame"""
-        result = frame.copy()
-        for name, active in self.active_effects.items():
-            if active:
-                result = self.effects[name].apply(result)
-        return result
+    def apply(self, frame: np.ndarray, dst: Optional[np.ndarray] = None) -> np.ndarray:
+        matrix, dsize = self._precomputed(frame)
+        return cv2.warpAffine(frame, matrix, dsize, dst=self._output(frame, dst), flags=cv2.INTER_LINEAR)
+
+# Compatibilità: la catena vive in effects.chain, gli effetti in questo modulo
+from effects.chain import FrameArena, EffectStage, VideoEffectChain  # noqa: E402
@@ -4,13 +4,16 @@ Widget per il controllo degli effetti video
 from PyQt5.QtWidgets import (
     QWidget, QVBoxLayout, QHBoxLayout, QLabel,
     QCheckBox, QSlider, QSpinBox, QGroupBox,
-    QPushButton, QColorDialog
+    QPushButton, QColorDialog, QListWidget, QListWidgetItem,
+    QComboBox, QTableWidget, QTableWidgetItem, QHeaderView
 )
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QTimer
 from PyQt5.QtGui import QColor
 import logging
+from typing import Any, Dict
 
-from effects.video_effects import VideoEffectChain
+from effects.chain import VideoEffectChain
+from effects.registry import ParamSpec
 
 class EffectsControlWidget(QWidget):
     """Widget per il controllo degli effetti video"""
@@ -19,156 +22,21 @@ class EffectsControlWidget(QWidget):
         super().__init__(parent)
         self.effect_chain = effect_chain
         self._setup_ui()
+        
+        # Aggiornamento periodico della tabella dei tempi
+        self.stats_timer = QTimer(self)
+        self.stats_timer.timeout.connect(self._update_stats)
+        self.stats_timer.start(500)
     
     def _setup_ui(self):
         layout = QVBoxLayout()
         
-        # Crea un gruppo per ogni effetto
-        effects_data = {
-            'blur': {
-                'name': 'Sfocatura',
-                'params': ['intensity', 'kernel_size']
-            },
-            'sharpen': {
-                'name': 'Nitidezza',
-                'params': ['intensity']
-            },
-            'edge': {
-                'name': 'Bordi',
-                'params': ['intensity', 'threshold']
-            },
-            'cartoon': {
-                'name': 'Cartone',
-                'params': ['intensity', 'kernel_size']
-            },
-            'night_vision': {
-                'name': 'Visione Notturna',
-                'params': ['intensity', 'gain']
-            },
-            'mirror': {
-                'name': 'Specchio',
-                'params': ['horizontal', 'vertical']
-            },
-            'rotate': {
-                'name': 'Rotazione',
-                'params': ['angle']
-            },
-            'denoise': {
-                'name': 'Riduzione Rumore',
-                'params': ['intensity', 'kernel_size']
-            },
-            'hdr': {
-                'name': 'HDR',
-                'params': ['intensity']
-            },
-            'beauty': {
-                'name': 'Bellezza',
-                'params': ['intensity', 'smoothing']
-            }
-        }
-        
-        for effect_id, effect_info in effects_data.items():
-            group = QGroupBox(effect_info['name'])
-            effect_layout = QVBoxLayout()
-            
-            # Checkbox per attivare/disattivare l'effetto
-            enable = QCheckBox("Attiva")
-            enable.toggled.connect(lambda v, eid=effect_id: self.effect_chain.toggle_effect(eid, v))
-            effect_layout.addWidget(enable)
-            
-            # Parametri specifici per ogni effetto
-            for param in effect_info['params']:
-                if param == 'intensity':
-                    # Slider per l'intensità (0-200%)
-                    intensity = QSlider(Qt.Horizontal)
-                    intensity.setRange(0, 200)
-                    intensity.setValue(100)
-                    intensity.valueChanged.connect(
-                        lambda v, eid=effect_id: self.effect_chain.set_effect_param(
-                            eid, 'intensity', v/100.0
-                        )
-                    )
-                    effect_layout.addWidget(QLabel("Intensità:"))
-                    effect_layout.addWidget(intensity)
-                
-                elif param == 'kernel_size':
-                    # SpinBox per la dimensione del kernel (3-15, solo dispari)
-                    kernel = QSpinBox()
-                    kernel.setRange(3, 15)
-                    kernel.setSingleStep(2)
-                    kernel.setValue(3)
-                    kernel.valueChanged.connect(
-                        lambda v, eid=effect_id: self.effect_chain.set_effect_param(
-                            eid, 'kernel_size', v
-                        )
-                    )
-                    effect_layout.addWidget(QLabel("Dimensione kernel:"))
-                    effect_layout.addWidget(kernel)
-                
-                elif param == 'threshold':
-                    # Slider per la soglia (0-255)
-                    threshold = QSlider(Qt.Horizontal)
-                    threshold.setRange(0, 255)
-                    threshold.setValue(127)
-                    threshold.valueChanged.connect(
-                        lambda v, eid=effect_id: self.effect_chain.set_effect_param(
-                            eid, 'threshold', v
-                        )
-                    )
-                    effect_layout.addWidget(QLabel("Soglia:"))
-                    effect_layout.addWidget(threshold)
-                
-                elif param == 'gain':
-                    # Slider per il guadagno (1-10)
-                    gain = QSlider(Qt.Horizontal)
-                    gain.setRange(10, 100)
-                    gain.setValue(20)
-                    gain.valueChanged.connect(
-                        lambda v, eid=effect_id: self.effect_chain.set_effect_param(
-                            eid, 'gain', v/10.0
-                        )
-                    )
-                    effect_layout.addWidget(QLabel("Guadagno:"))
-                    effect_layout.addWidget(gain)
-                
-                elif param in ['horizontal', 'vertical']:
-                    # Checkbox per flip orizzontale/verticale
-                    flip = QCheckBox("Flip " + param)
-                    flip.toggled.connect(
-                        lambda v, eid=effect_id, p=param: self.effect_chain.set_effect_param(
-                            eid, p, v
-                        )
-                    )
-                    effect_layout.addWidget(flip)
-                
-                elif param == 'angle':
-                    # Slider per l'angolo di rotazione (-180 a 180)
-                    angle = QSlider(Qt.Horizontal)
-                    angle.setRange(-180, 180)
-                    angle.setValue(0)
-                    angle.valueChanged.connect(
-                        lambda v, eid=effect_id: self.effect_chain.set_effect_param(
-                            eid, 'angle', v
-                        )
-                    )
-                    effect_layout.addWidget(QLabel("Angolo:"))
-                    effect_layout.addWidget(angle)
-                
-                elif param == 'smoothing':
-                    # Slider per lo smoothing (0-100)
-                    smoothing = QSlider(Qt.Horizontal)
-                    smoothing.setRange(0, 100)
-                    smoothing.setValue(50)
-                    smoothing.valueChanged.connect(
-                        lambda v, eid=effect_id: self.effect_chain.set_effect_param(
-                            eid, 'smoothing', v/100.0
-                        )
-                    )
-                    effect_layout.addWidget(QLabel("Smoothing:"))
-                    effect_layout.addWidget(smoothing)
-            
-            group.setLayout(effect_layout)
-            layout.addWidget(group)
+        # Un gruppo di controlli per ogni stadio della catena, ricostruiti quando cambia la struttura
+        self.stages_layout = QVBoxLayout()
+        self._stage_checks: Dict[str, QCheckBox] = {}
+        layout.addLayout(self.stages_layout)
+        
+        layout.addWidget(self._create_pipeline_group())
         
         # Pulsanti di preset
         presets_group = QGroupBox("Preset")
@@ -197,37 +65,245 @@ class EffectsControlWidget(QWidget):
         
         layout.addStretch()
         self.setLayout(layout)
+        self._refresh()
+    
+    def _refresh(self, select: str = None):
+        """Ricostruisce i controlli degli stadi e la lista della pipeline dallo stato della catena"""
+        self._rebuild_stage_groups()
+        self._refresh_stage_list(select)
+    
+    def _rebuild_stage_groups(self):
+        """Crea un gruppo per ogni stadio, con i controlli generati dai metadati del suo tipo"""
+        while self.stages_layout.count():
+            widget = self.stages_layout.takeAt(0).widget()
+            if widget is not None:
+                widget.deleteLater()
+        self._stage_checks = {}
+        
+        registry = self.effect_chain.registry
+        for stage in self.effect_chain.stages:
+            info = registry.info(stage.effect_type)
+            # Le istanze aggiuntive (es. blur#2) mostrano anche l'id dello stadio
+            title = info.label if stage.stage_id == stage.effect_type else f"{info.label} ({stage.stage_id})"
+            group = QGroupBox(title)
+            effect_layout = QVBoxLayout()
+            
+            # Checkbox per attivare/disattivare lo stadio
+            enable = QCheckBox("Attiva")
+            enable.setChecked(stage.enabled)
+            enable.toggled.connect(lambda v, sid=stage.stage_id: self._set_stage_enabled(sid, v))
+            effect_layout.addWidget(enable)
+            self._stage_checks[stage.stage_id] = enable
+            
+            # Parametri specifici dell'effetto, inizializzati con i valori dello stadio
+            for spec in info.params:
+                self._add_param_control(effect_layout, stage.stage_id, spec,
+                                        stage.params.get(spec.name, spec.default))
+            
+            group.setLayout(effect_layout)
+            self.stages_layout.addWidget(group)
+    
+    def _set_stage_enabled(self, stage_id: str, enabled: bool):
+        """Attiva o disattiva uno stadio da una qualsiasi delle due viste"""
+        self.effect_chain.toggle_effect(stage_id, enabled)
+        self._sync_enabled()
+    
+    def _sync_enabled(self):
+        """Allinea le checkbox dei gruppi e della lista allo stato della catena"""
+        enabled = self.effect_chain.active_effects
+        for stage_id, check in self._stage_checks.items():
+            check.blockSignals(True)
+            check.setChecked(enabled.get(stage_id, False))
+            check.blockSignals(False)
+        
+        self.stage_list.blockSignals(True)
+        for row in range(self.stage_list.count()):
+            item = self.stage_list.item(row)
+            item.setCheckState(Qt.Checked if enabled.get(item.data(Qt.UserRole)) else Qt.Unchecked)
+        self.stage_list.blockSignals(False)
+    
+    def _add_param_control(self, layout: QVBoxLayout, stage_id: str, spec: ParamSpec, value: Any):
+        """Crea il controllo di un parametro di uno stadio a partire dai suoi metadati"""
+        def setter(value, sid=stage_id, name=spec.name):
+            self.effect_chain.set_effect_param(sid, name, value)
+        
+        if spec.kind == 'bool':
+            check = QCheckBox(spec.label)
+            check.setChecked(bool(value))
+            check.toggled.connect(setter)
+            layout.addWidget(check)
+            return
+        
+        if spec.kind == 'choice':
+            # Menu a tendina con valori predefiniti
+            combo = QComboBox()
+            for label, choice in spec.choices:
+                combo.addItem(label, choice)
+            index = combo.findData(value)
+            if index >= 0:
+                combo.setCurrentIndex(index)
+            combo.currentIndexChanged.connect(lambda i, c=combo: setter(c.itemData(i)))
+            control = combo
+        
+        elif spec.kind == 'int':
+            # SpinBox per i valori interi (es. dimensione del kernel, solo dispari con passo 2)
+            spin = QSpinBox()
+            spin.setRange(int(spec.minimum), int(spec.maximum))
+            spin.setSingleStep(int(spec.step) or 1)
+            if value is not None:
+                spin.setValue(int(value))
+            spin.valueChanged.connect(setter)
+            control = spin
+        
+        else:
+            # Slider per i valori reali: ogni passo dello slider vale spec.step
+            slider = QSlider(Qt.Horizontal)
+            slider.setRange(round(spec.minimum / spec.step), round(spec.maximum / spec.step))
+            if value is not None:
+                slider.setValue(round(value / spec.step))
+            slider.valueChanged.connect(lambda v, step=spec.step: setter(v * step))
+            control = slider
+        
+        layout.addWidget(QLabel(spec.label + ":"))
+        layout.addWidget(control)
+    
+    def _create_pipeline_group(self) -> QGroupBox:
+        """Crea il gruppo per l'ordine della catena e i tempi per stadio"""
+        group = QGroupBox("Pipeline")
+        pipeline_layout = QVBoxLayout()
+        
+        # Lista ordinata degli stadi, con checkbox di attivazione
+        self.stage_list = QListWidget()
+        self.stage_list.itemChanged.connect(self._on_stage_item_changed)
+        pipeline_layout.addWidget(self.stage_list)
+        
+        buttons_layout = QHBoxLayout()
+        up_btn = QPushButton("Su")
+        up_btn.clicked.connect(lambda: self._move_selected_stage(-1))
+        buttons_layout.addWidget(up_btn)
+        down_btn = QPushButton("Giù")
+        down_btn.clicked.connect(lambda: self._move_selected_stage(1))
+        buttons_layout.addWidget(down_btn)
+        remove_btn = QPushButton("Rimuovi")
+        remove_btn.clicked.connect(self._remove_selected_stage)
+        buttons_layout.addWidget(remove_btn)
+        pipeline_layout.addLayout(buttons_layout)
+        
+        add_layout = QHBoxLayout()
+        self.effect_type_combo = QComboBox()
+        self.effect_type_combo.addItems(self.effect_chain.registry.names())
+        add_layout.addWidget(self.effect_type_combo)
+        add_btn = QPushButton("Aggiungi")
+        add_btn.clicked.connect(self._add_stage)
+        add_layout.addWidget(add_btn)
+        pipeline_layout.addLayout(add_layout)
+        
+        # Tempi per stadio
+        self.stats_table = QTableWidget(0, 5)
+        self.stats_table.setHorizontalHeaderLabels(["Stadio", "Media (ms)", "p95 (ms)", "Budget %", "Degradazione"])
+        self.stats_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.stats_table.verticalHeader().setVisible(False)
+        self.stats_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        pipeline_layout.addWidget(self.stats_table)
+        
+        group.setLayout(pipeline_layout)
+        return group
+    
+    def _refresh_stage_list(self, select: str = None):
+        """Ricostruisce la lista degli stadi dalla catena"""
+        self.stage_list.blockSignals(True)
+        self.stage_list.clear()
+        for stage in self.effect_chain.stages:
+            item = QListWidgetItem(stage.stage_id)
+            item.setData(Qt.UserRole, stage.stage_id)
+            item.setFlags(item.flags() | Qt.ItemIsUserCheckable)
+            item.setCheckState(Qt.Checked if stage.enabled else Qt.Unchecked)
+            self.stage_list.addItem(item)
+            if stage.stage_id == select:
+                self.stage_list.setCurrentItem(item)
+        self.stage_list.blockSignals(False)
+    
+    def _selected_stage(self):
+        item = self.stage_list.currentItem()
+        return item.data(Qt.UserRole) if item else None
+    
+    def _on_stage_item_changed(self, item: QListWidgetItem):
+        self._set_stage_enabled(item.data(Qt.UserRole), item.checkState() == Qt.Checked)
+    
+    def _move_selected_stage(self, offset: int):
+        stage_id = self._selected_stage()
+        if stage_id is None:
+            return
+        index = self.stage_list.currentRow() + offset
+        if self.effect_chain.move_effect(stage_id, index):
+            self._refresh(select=stage_id)
+    
+    def _remove_selected_stage(self):
+        stage_id = self._selected_stage()
+        if stage_id is not None and self.effect_chain.remove_effect(stage_id):
+            self._refresh()
+    
+    def _add_stage(self):
+        stage_id = self.effect_chain.add_effect(self.effect_type_combo.currentText())
+        self._refresh(select=stage_id)
+    
+    def _update_stats(self):
+        """Aggiorna la tabella dei tempi per stadio"""
+        rows = [s for s in self.effect_chain.stage_stats() if s['enabled']]
+        total = self.effect_chain.total_stats()
+        rows.append({'stage_id': 'Totale', **total})
+        
+        self.stats_table.setRowCount(len(rows))
+        for row, stats in enumerate(rows):
+            values = [
+                stats['stage_id'],
+                f"{stats['mean_ms']:.2f}",
+                f"{stats['p95_ms']:.2f}",
+                f"{stats['budget_share'] * 100:.1f}",
+                self._degradation_text(stats)
+            ]
+            for column, value in enumerate(values):
+                self.stats_table.setItem(row, column, QTableWidgetItem(value))
+    
+    @staticmethod
+    def _degradation_text(stats: dict) -> str:
+        """Descrizione delle degradazioni applicate dallo scheduler a uno stadio"""
+        parts = []
+        if stats.get('skipped'):
+            parts.append("saltato")
+        if stats.get('scale_override'):
+            parts.append(f"scala {stats['scale_override']:g}")
+        if stats.get('reuse_interval', 1) > 1:
+            parts.append(f"riuso x{stats['reuse_interval']}")
+        return ", ".join(parts)
+    
+    def _apply_preset(self, intensities: Dict[str, float]):
+        """Ripristina la catena, imposta le intensità indicate e aggiorna i controlli"""
+        self.effect_chain.reset_all()
+        for stage_id, intensity in intensities.items():
+            self.effect_chain.set_effect_param(stage_id, 'intensity', intensity)
+        self._refresh()
     
     def _preset_natural(self):
         """Preset per colori naturali"""
-        self.effect_chain.reset_all()
-        self.effect_chain.set_effect_param('sharpen', 'intensity', 0.3)
-        self.effect_chain.set_effect_param('denoise', 'intensity', 0.2)
+        self._apply_preset({'sharpen': 0.3, 'denoise': 0.2})
     
     def _preset_vivid(self):
         """Preset per colori vividi"""
-        self.effect_chain.reset_all()
-        self.effect_chain.set_effect_param('sharpen', 'intensity', 0.6)
-        self.effect_chain.set_effect_param('hdr', 'intensity', 0.4)
+        self._apply_preset({'sharpen': 0.6})
     
     def _preset_bw(self):
         """Preset per bianco e nero"""
-        self.effect_chain.reset_all()
-        self.effect_chain.set_effect_param('edge', 'intensity', 0.5)
-        self.effect_chain.set_effect_param('denoise', 'intensity', 0.3)
+        self._apply_preset({'edge': 0.5, 'denoise': 0.3})
     
     def _preset_vintage(self):
         """Preset per effetto vintage"""
-        self.effect_chain.reset_all()
-        self.effect_chain.set_effect_param('cartoon', 'intensity', 0.3)
-        self.effect_chain.set_effect_param('blur', 'intensity', 0.2)
+        self._apply_preset({'cartoon': 0.3, 'blur': 0.2})
     
     def _preset_night(self):
         """Preset per visione notturna"""
-        self.effect_chain.reset_all()
-        self.effect_chain.set_effect_param('night_vision', 'intensity', 0.7)
-        self.effect_chain.set_effect_param('denoise', 'intensity', 0.4)
+        self._apply_preset({'night_vision': 0.7, 'denoise': 0.4})
     
     def _reset_effects(self):
         """Resetta tutti gli effetti"""
-        self.effect_chain.reset_all()
+        self._apply_preset({})
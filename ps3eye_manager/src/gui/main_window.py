@@ -17,6 +17,8 @@ from PyQt5.QtGui import QImage, QPixmap, QIcon
 from PyQt5.QtCore import Qt, QTimer, QSize, pyqtSlot
 
 from core.camera_service import CLEyeService
+from core.http_server import MJPEGServer
+from config.settings_v3 import settings
 from gui.settings_panel import SettingsPanel
 
 class MainWindow(QMainWindow):
@@ -27,6 +29,8 @@ class MainWindow(QMainWindow):
         
         # Inizializza il servizio telecamera
         self.camera_service = CLEyeService()
+        self._apply_virtual_camera_settings()
+        self.http_server: Optional[MJPEGServer] = None
         
         # Setup UI
         self.setWindowTitle("PS3 Eye Manager")
@@ -103,6 +107,43 @@ class MainWindow(QMainWindow):
             self.settings_panel.update_from_camera(self.camera_service.camera)
         else:
             QMessageBox.critical(self, "Errore", "Impossibile avviare la telecamera")
+        
+        # Stream MJPEG e snapshot via HTTP, se abilitati nelle impostazioni
+        self._start_http_server()
+            
+    def _apply_virtual_camera_settings(self):
+        """Imposta risoluzione e ingrandimento della webcam virtuale dalle impostazioni"""
+        config = settings.virtual_camera
+        try:
+            self.camera_service.set_output_resolution(
+                int(config.get("width", 640)),
+                int(config.get("height", 480)),
+                config.get("upscale_method", "lanczos"),
+                config.get("upscale_fit", "letterbox")
+            )
+        except ValueError as e:
+            logging.error(f"Impostazioni della webcam virtuale non valide: {e}")
+            
+    def _start_http_server(self):
+        """Avvia il server HTTP MJPEG secondo le impostazioni (sezione http)"""
+        config = settings.http
+        if not config.get("enabled", False):
+            return
+        server = MJPEGServer(
+            self.camera_service,
+            quality=int(config.get("jpeg_quality", 80)),
+            max_fps=int(config.get("max_fps", 30))
+        )
+        if server.start(config.get("host", "localhost"), int(config.get("port", 8080))):
+            self.http_server = server
+        else:
+            self.status_bar.showMessage("Impossibile avviare il server HTTP", 3000)
+            
+    def _stop_http_server(self):
+        """Ferma il server HTTP MJPEG, se avviato"""
+        if self.http_server is not None:
+            self.http_server.stop()
+            self.http_server = None
             
     def _update_frame(self, frame: np.ndarray):
         """Callback per l'aggiornamento del frame"""
@@ -224,6 +265,7 @@ class MainWindow(QMainWindow):
     def closeEvent(self, event):
         """Gestisce la chiusura della finestra"""
         try:
+            self._stop_http_server()
             if self.camera_service:
                 self.camera_service.stop()
         except Exception as e:
@@ -59,6 +59,8 @@ def setup_logging(log_dir: str = None, debug: bool = False) -> None:
     loggers = {
         'camera': logging.getLogger('ps3eye.camera'),
         'server': logging.getLogger('ps3eye.server'),
+        'http': logging.getLogger('ps3eye.http'),
+        'effects': logging.getLogger('ps3eye.effects'),
         'ui': logging.getLogger('ps3eye.ui'),
         'driver': logging.getLogger('ps3eye.driver'),
     }
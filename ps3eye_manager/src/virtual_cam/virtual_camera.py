@@ -2,19 +2,30 @@ import pyvirtualcam
 import numpy as np
 import cv2
 import logging
-from typing import Optional, Tuple
-from threading import Thread, Event
-from queue import Queue
+from typing import Dict, Optional, Tuple
+from threading import Thread, Event, Lock
 import time
 
+from core.pixel_format import PixelFormat, convert
+from core.frame_pacer import FramePacer
+
 logger = logging.getLogger(__name__)
 
 class VirtualCamera:
     """
     Gestisce l'integrazione con una webcam virtuale usando pyvirtualcam.
     Permette di utilizzare la PS3 Eye come una webcam standard di Windows.
+    
+    send_frame converte il frame in uno dei tre buffer preallocati (triplo
+    buffer) e lo scambia con quello in attesa: il produttore non si blocca
+    mai. Il thread di streaming invia a ogni scadenza del FramePacer il
+    frame più recente, ripetendo l'ultimo se non ne è arrivato uno nuovo;
+    i frame sostituiti prima dell'invio risultano scartati in stats.
     """
     
+    # Formato richiesto da pyvirtualcam (PixelFormat.RGB, il default di Camera)
+    pixel_format = PixelFormat.RGB
+    
     def __init__(self, width: int = 640, height: int = 480, fps: int = 30,
                  device: Optional[str] = None):
         """
@@ -35,7 +46,20 @@ class VirtualCamera:
         self._running = False
         self._thread: Optional[Thread] = None
         self._stop_event = Event()
-        self._frame_queue = Queue(maxsize=2)  # Buffer minimo per evitare lag
+        
+        # Triplo buffer: il produttore scrive in _back, il thread di streaming
+        # invia _front, _pending contiene l'ultimo frame completo non ancora inviato
+        shape = self.pixel_format.shape(width, height)
+        self._slots = [np.zeros(shape, np.uint8) for _ in range(3)]
+        self._back, self._pending, self._front = 0, 1, 2
+        self._has_pending = False
+        self._swap_lock = Lock()
+        # Numero progressivo e istante di arrivo del frame in ogni buffer
+        self._slot_info = [(None, None)] * 3
+        self._produced = 0
+        self.pacer = FramePacer(fps)
+        # Buffer intermedi della conversione, per geometria del frame sorgente
+        self._buffers: Dict[str, np.ndarray] = {}
         
         # Statistiche
         self._stats = {
@@ -66,6 +90,8 @@ class VirtualCamera:
             self._stop_event.clear()
             self._stats['start_time'] = time.time()
             self._stats['frames_sent'] = 0
+            self._has_pending = False
+            self._slot_info = [(None, None)] * 3
             
             # Avvia il thread di streaming
             self._thread = Thread(target=self._stream_thread, daemon=True)
@@ -96,77 +122,104 @@ class VirtualCamera:
         logger.info(f"Streaming terminato: {self._stats['frames_sent']} frames in {duration:.1f}s "
                    f"(media: {avg_fps:.1f} fps)")
     
-    def send_frame(self, frame: np.ndarray):
+    def send_frame(self, frame: np.ndarray, source_format=PixelFormat.RGBA):
         """
         Invia un frame alla webcam virtuale
         
+        Non blocca e, a regime, non alloca memoria: il frame viene convertito
+        e ridimensionato in buffer preallocati.
+        
         Args:
-            frame: Frame da inviare (RGB o RGBA)
+            frame: Frame da inviare
+            source_format: Formato del frame (default RGBA, quello della PS3 Eye);
+                con un array di un solo canale il frame è trattato come GRAY
         """
         if not self._running:
             return
         
         try:
-            # Assicurati che il frame sia nel formato corretto
-            if frame.shape[:2] != (self.height, self.width):
-                frame = cv2.resize(frame, (self.width, self.height))
-            
-            # Converti in RGB se necessario
-            if frame.shape[2] == 4:  # RGBA
-                frame = cv2.cvtColor(frame, cv2.COLOR_RGBA2RGB)
-            elif frame.shape[2] == 1:  # Grayscale
-                frame = cv2.cvtColor(frame, cv2.COLOR_GRAY2RGB)
+            source = PixelFormat.parse(source_format)
+            if frame.ndim == 2 or frame.shape[2] == 1:
+                source = PixelFormat.GRAY
+                frame = frame.reshape(frame.shape[:2])
             
-            # Normalizza i valori
-            if frame.dtype != np.uint8:
-                frame = (frame * 255).astype(np.uint8)
+            # Il buffer _back appartiene solo al produttore: nessun lock durante la conversione
+            self._convert_into(frame, source, self._slots[self._back])
             
-            # Metti il frame nella coda
-            try:
-                self._frame_queue.put_nowait(frame)
-            except Queue.Full:
-                # Se la coda è piena, rimuovi il frame più vecchio
-                try:
-                    self._frame_queue.get_nowait()
-                except Queue.Empty:
-                    pass
-                self._frame_queue.put_nowait(frame)
+            self._produced += 1
+            self._slot_info[self._back] = (self._produced, time.monotonic())
+            with self._swap_lock:
+                self._back, self._pending = self._pending, self._back
+                self._has_pending = True
             
         except Exception as e:
             logger.error(f"Errore nell'invio del frame: {e}")
     
+    def _buffer(self, key: str, shape: Tuple[int, ...]) -> np.ndarray:
+        """Buffer di lavoro persistente, riallocato solo quando cambia la geometria"""
+        buffer = self._buffers.get(key)
+        if buffer is None or buffer.shape != shape:
+            buffer = self._buffers[key] = np.empty(shape, np.uint8)
+        return buffer
+    
+    def _convert_into(self, frame: np.ndarray, source: PixelFormat, dst: np.ndarray):
+        """Porta il frame a uint8, alla dimensione e nel formato della webcam virtuale, in dst"""
+        # Normalizza i valori (frame float in 0-1)
+        if frame.dtype != np.uint8:
+            frame = cv2.convertScaleAbs(frame, dst=self._buffer('normalized', frame.shape), alpha=255)
+        
+        size = (self.width, self.height)
+        if frame.shape[:2] == (self.height, self.width):
+            if source is self.pixel_format:
+                np.copyto(dst, frame)
+            else:
+                convert(frame, source, self.pixel_format, out=dst)
+        elif frame.shape[0] * frame.shape[1] < self.width * self.height:
+            # Ingrandimento: conversione alla risoluzione (minore) della sorgente
+            if source is not self.pixel_format:
+                frame = convert(frame, source, self.pixel_format,
+                                out=self._buffer('converted', self.pixel_format.shape(frame.shape[1], frame.shape[0])))
+            cv2.resize(frame, size, dst=dst, interpolation=cv2.INTER_LINEAR)
+        else:
+            # Riduzione: conversione alla risoluzione (minore) della webcam virtuale
+            if source is self.pixel_format:
+                cv2.resize(frame, size, dst=dst, interpolation=cv2.INTER_AREA)
+            else:
+                resized = cv2.resize(frame, size, dst=self._buffer('resized', source.shape(*size)),
+                                     interpolation=cv2.INTER_AREA)
+                convert(resized, source, self.pixel_format, out=dst)
+    
+    def _take_latest(self):
+        """Porta in _front il frame in attesa, se ce n'è uno nuovo"""
+        with self._swap_lock:
+            if self._has_pending:
+                self._front, self._pending = self._pending, self._front
+                self._has_pending = False
+    
     def _stream_thread(self):
         """Thread principale per lo streaming dei frame"""
-        frame_time = 1.0 / self.fps
-        last_frame_time = time.time()
+        # Unica cadenza: scadenze assolute del pacer (niente sleep_until_next_frame)
+        self.pacer.reset()
         
-        while not self._stop_event.is_set():
+        while self.pacer.wait(self._stop_event):
             try:
-                # Aspetta il prossimo frame
-                frame = self._frame_queue.get(timeout=0.1)
-                
-                # Calcola il tempo di attesa per mantenere il frame rate
-                current_time = time.time()
-                elapsed = current_time - last_frame_time
-                if elapsed < frame_time:
-                    time.sleep(frame_time - elapsed)
+                self._take_latest()
+                sequence, captured_at = self._slot_info[self._front]
+                action = self.pacer.reconcile(sequence)
+                if action == FramePacer.SKIP:
+                    continue
                 
-                # Invia il frame
-                self._cam.send(frame)
-                self._cam.sleep_until_next_frame()
+                # Invia il frame (nuovo o ripetuto)
+                self._cam.send(self._slots[self._front])
+                self.pacer.sent(captured_at, fresh=action == FramePacer.NEW)
                 
                 # Aggiorna le statistiche
                 self._stats['frames_sent'] += 1
                 frames_sent = self._stats['frames_sent']
-                duration = current_time - self._stats['start_time']
+                duration = time.time() - self._stats['start_time']
                 if frames_sent % 30 == 0:  # Aggiorna FPS ogni 30 frames
                     self._stats['actual_fps'] = frames_sent / duration
                 
-                last_frame_time = time.time()
-                
-            except Queue.Empty:
-                # Nessun frame disponibile, continua
-                continue
             except Exception as e:
                 logger.error(f"Errore nello streaming: {e}")
                 break
@@ -178,8 +231,16 @@ class VirtualCamera:
     
     @property
     def stats(self) -> dict:
-        """Restituisce le statistiche dello streaming"""
-        return self._stats.copy()
+        """
+        Restituisce le statistiche dello streaming
+        
+        'pacing' contiene i contatori del FramePacer (frame nuovi, ripetuti,
+        scartati, scadenze in ritardo) e gli istogrammi dell'intervallo tra
+        invii e dell'età dei frame all'invio.
+        """
+        stats = self._stats.copy()
+        stats['pacing'] = self.pacer.stats
+        return stats
     
     def get_supported_formats(self) -> list:
         """Restituisce i formati supportati dalla webcam virtuale"""
@@ -0,0 +1,296 @@
+"""
+Benchmark degli effetti video per risoluzione, formato e modalità di esecuzione
+
+Misura ogni effetto registrato e alcune catene tipiche su frame sintetici
+(nessuna telecamera né interfaccia grafica richieste) a QVGA e VGA, nei
+formati RGBA, BGR e GRAY, in tre modalità: su un solo thread ('single'), con
+l'esecuzione a bande in parallelo ('parallel') e come pipeline di thread
+('pipeline', tempo per frame = inverso del throughput, p95 = latenza).
+Per ogni configurazione riporta ms/frame (media e p95), fps
+raggiungibili, byte allocati per frame a regime e picco di memoria.
+
+I risultati possono essere salvati in JSON e confrontati con un'esecuzione
+precedente per individuare le regressioni.
+
+Esempio:
+    python tools/benchmark_effects.py --output bench_effects.json
+    python tools/benchmark_effects.py --compare bench_effects.json --threshold 0.2
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tracemalloc
+import numpy as np
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+# Aggiungi la directory src al PYTHONPATH
+src_dir = Path(__file__).parent.parent / "src"
+if str(src_dir) not in sys.path:
+    sys.path.insert(0, str(src_dir))
+
+from effects.chain import VideoEffectChain
+from effects.registry import get_registry
+from effects.pipeline import PipelinedEffectProcessor
+from check_effect_allocations import measure_peak_allocation
+
+RESOLUTIONS = {'qvga': (320, 240), 'vga': (640, 480)}
+FORMATS = {'rgba': 4, 'bgr': 3, 'gray': 1}
+MODES = ('single', 'parallel', 'pipeline')
+
+# Catene tipiche, nell'ordine di applicazione
+CHAINS = {
+    'naturale': ['denoise', 'sharpen'],
+    'stilizzata': ['cartoon', 'edge'],
+    'notte': ['denoise', 'night_vision'],
+    'completa': ['denoise', 'blur', 'sharpen', 'edge', 'cartoon', 'brightness', 'mirror'],
+}
+
+# Metriche confrontate con l'esecuzione di riferimento (più alto = peggio)
+COMPARED_METRICS = ('ms_per_frame', 'bytes_per_frame')
+
+
+def synthetic_frames(width: int, height: int, channels: int, count: int = 8) -> List[np.ndarray]:
+    """Frame sintetici con gradiente, rumore e un oggetto in movimento"""
+    rng = np.random.default_rng(0)
+    gradient = np.linspace(0, 255, width, dtype=np.float32)[None, :]
+    base = np.broadcast_to(gradient, (height, width)).copy()
+    frames = []
+    for i in range(count):
+        luma = base + rng.normal(0, 6, base.shape)
+        x = (i * width // count) % max(1, width - width // 4)
+        luma[height // 3:height // 2, x:x + width // 4] = 230
+        luma = np.clip(luma, 0, 255).astype(np.uint8)
+        if channels == 1:
+            frames.append(luma)
+            continue
+        frame = np.stack([luma, np.roll(luma, 7, axis=1), 255 - luma], axis=-1)
+        if channels == 4:
+            frame = np.concatenate([frame, np.full((height, width, 1), 255, np.uint8)], axis=-1)
+        frames.append(np.ascontiguousarray(frame))
+    return frames
+
+
+def build_chain(names: List[str], mode: str) -> VideoEffectChain:
+    chain = VideoEffectChain()
+    for name in names:
+        chain.toggle_effect(name, True)
+    if mode == 'parallel':
+        chain.set_tiling(True)
+    return chain
+
+
+def _measure_pipeline(chain: VideoEffectChain, inputs: List[np.ndarray],
+                      frames: int, warmup: int) -> Dict[str, Any]:
+    """Throughput e latenza della catena eseguita come pipeline di thread"""
+    processor = PipelinedEffectProcessor(chain, drop_when_behind=False)
+    processor.start(frame_callback=lambda frame, sequence: None)
+    try:
+        for i in range(warmup):
+            processor.submit(inputs[i % len(inputs)])
+        processor._wait_idle()
+        processor._latency.reset()
+
+        start = time.perf_counter()
+        for i in range(frames):
+            processor.submit(inputs[i % len(inputs)])
+        processor._wait_idle(timeout=60.0)
+        elapsed_ms = (time.perf_counter() - start) * 1000.0
+
+        # Allocazioni per frame: un frame alla volta, attendendo la consegna
+        tracemalloc.start()
+        try:
+            worst = 0
+            for i in range(min(frames, 20)):
+                tracemalloc.reset_peak()
+                current, _ = tracemalloc.get_traced_memory()
+                processor.submit(inputs[i % len(inputs)])
+                processor._wait_idle()
+                _, peak = tracemalloc.get_traced_memory()
+                worst = max(worst, peak - current)
+        finally:
+            tracemalloc.stop()
+        mean = elapsed_ms / frames
+        return {
+            'ms_per_frame': mean,
+            'p95_ms': processor.stats['latency_p95_ms'],
+            'fps': 1000.0 / mean if mean > 0 else 0.0,
+            'bytes_per_frame': int(worst),
+        }
+    finally:
+        processor.cleanup()
+
+
+def measure_case(names: List[str], width: int, height: int, channels: int, mode: str,
+                 frames: int, warmup: int) -> Dict[str, Any]:
+    """Misura tempi e memoria di una catena in una configurazione"""
+    inputs = synthetic_frames(width, height, channels)
+
+    # Picco di memoria dall'avvio di una catena nuova (buffer, tabelle precalcolate)
+    fresh = build_chain(names, mode)
+    tracemalloc.start()
+    try:
+        for i in range(warmup):
+            fresh.apply_effects(inputs[i % len(inputs)])
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    chain = build_chain(names, mode)
+    if mode == 'pipeline':
+        metrics = _measure_pipeline(chain, inputs, frames, warmup)
+        metrics['peak_bytes'] = int(peak)
+        return metrics
+
+    # Tempi (senza tracemalloc, che rallenterebbe le allocazioni)
+    for i in range(warmup):
+        chain.apply_effects(inputs[i % len(inputs)])
+    times = []
+    for i in range(frames):
+        start = time.perf_counter()
+        chain.apply_effects(inputs[i % len(inputs)])
+        times.append((time.perf_counter() - start) * 1000.0)
+
+    # Allocazioni per frame a regime
+    bytes_per_frame = measure_peak_allocation(chain, inputs[0], warmup=2, frames=min(frames, 20))
+
+    mean = float(np.mean(times))
+    return {
+        'ms_per_frame': mean,
+        'p95_ms': float(np.percentile(times, 95)),
+        'fps': 1000.0 / mean if mean > 0 else 0.0,
+        'bytes_per_frame': int(bytes_per_frame),
+        'peak_bytes': int(peak),
+    }
+
+
+def run_suite(resolutions: List[str], formats: List[str], modes: List[str], targets: List[str],
+              frames: int, warmup: int) -> List[Dict[str, Any]]:
+    """Esegue tutte le combinazioni richieste"""
+    results = []
+    for target in targets:
+        names = CHAINS.get(target, [target])
+        for resolution in resolutions:
+            width, height = RESOLUTIONS[resolution]
+            for fmt in formats:
+                for mode in modes:
+                    print(f"{target} {resolution} {fmt} {mode} ...", file=sys.stderr)
+                    metrics = measure_case(names, width, height, FORMATS[fmt], mode, frames, warmup)
+                    results.append({
+                        'target': target,
+                        'kind': 'chain' if target in CHAINS else 'effect',
+                        'effects': names,
+                        'resolution': resolution,
+                        'format': fmt,
+                        'mode': mode,
+                        **metrics,
+                    })
+    return results
+
+
+def _case_key(result: Dict[str, Any]) -> Tuple[str, str, str, str]:
+    return result['target'], result['resolution'], result['format'], result['mode']
+
+
+def compare(results: List[Dict[str, Any]], baseline: List[Dict[str, Any]],
+            threshold: float) -> List[Dict[str, Any]]:
+    """
+    Confronta i risultati con un'esecuzione di riferimento
+
+    Returns:
+        List[Dict[str, Any]]: Regressioni (metrica peggiorata oltre la soglia relativa)
+    """
+    reference = {_case_key(r): r for r in baseline}
+    regressions = []
+    for result in results:
+        previous = reference.get(_case_key(result))
+        if previous is None:
+            continue
+        for metric in COMPARED_METRICS:
+            old, new = previous.get(metric), result.get(metric)
+            if old is None or new is None:
+                continue
+            # Per le allocazioni conta anche il passaggio da zero a un valore significativo
+            limit = old * (1.0 + threshold) if old > 0 else (16 * 1024 if metric == 'bytes_per_frame' else 0.0)
+            if new > limit:
+                regressions.append({
+                    'case': '/'.join(_case_key(result)),
+                    'metric': metric,
+                    'before': old,
+                    'after': new,
+                })
+    return regressions
+
+
+def _parse_list(value: str) -> List[str]:
+    return [v.strip() for v in value.split(',') if v.strip()]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Funzione principale"""
+    parser = argparse.ArgumentParser(description="Benchmark degli effetti video")
+    parser.add_argument('--resolutions', default='qvga,vga', help="Risoluzioni: qvga, vga")
+    parser.add_argument('--formats', default='rgba,bgr,gray', help="Formati: rgba, bgr, gray")
+    parser.add_argument('--modes', default='single,parallel,pipeline',
+                        help="Modalità: single, parallel, pipeline")
+    parser.add_argument('--effects', default=None,
+                        help="Effetti o catene da misurare (default: tutti gli effetti e le catene tipiche)")
+    parser.add_argument('--frames', type=int, default=60, help="Frame misurati per configurazione")
+    parser.add_argument('--warmup', type=int, default=10, help="Frame di riscaldamento")
+    parser.add_argument('--output', default=None, help="File JSON dei risultati")
+    parser.add_argument('--compare', default=None, help="File JSON di riferimento per le regressioni")
+    parser.add_argument('--threshold', type=float, default=0.2, help="Peggioramento relativo tollerato")
+    args = parser.parse_args(argv)
+
+    resolutions = _parse_list(args.resolutions)
+    formats = _parse_list(args.formats)
+    modes = _parse_list(args.modes)
+    targets = _parse_list(args.effects) if args.effects else get_registry().names() + list(CHAINS)
+    for value, allowed, label in ((resolutions, RESOLUTIONS, 'Risoluzione'), (formats, FORMATS, 'Formato'),
+                                  (modes, MODES, 'Modalità')):
+        unknown = [v for v in value if v not in allowed]
+        if unknown:
+            parser.error(f"{label} sconosciuta: {', '.join(unknown)}")
+    unknown = [t for t in targets if t not in CHAINS and t not in get_registry()]
+    if unknown:
+        parser.error(f"Effetto sconosciuto: {', '.join(unknown)}")
+
+    results = run_suite(resolutions, formats, modes, targets, args.frames, args.warmup)
+
+    print(f"{'effetto':<14} {'ris':<5} {'fmt':<5} {'modo':<9} {'ms':>8} {'p95':>8} {'fps':>8} "
+          f"{'byte/frame':>11} {'picco KB':>9}")
+    for r in results:
+        print(f"{r['target']:<14} {r['resolution']:<5} {r['format']:<5} {r['mode']:<9} "
+              f"{r['ms_per_frame']:8.2f} {r['p95_ms']:8.2f} {r['fps']:8.1f} "
+              f"{r['bytes_per_frame']:>11} {r['peak_bytes'] / 1024:9.0f}")
+
+    report = {
+        'benchmark': 'effects',
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'platform': {
+            'system': platform.system(),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'cpu_count': os.cpu_count(),
+        },
+        'results': results,
+    }
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2), encoding='utf-8')
+
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text(encoding='utf-8'))['results']
+        regressions = compare(results, baseline, args.threshold)
+        for reg in regressions:
+            print(f"REGRESSIONE {reg['case']} {reg['metric']}: {reg['before']:.2f} -> {reg['after']:.2f}")
+        if regressions:
+            return 1
+        print("Nessuna regressione")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
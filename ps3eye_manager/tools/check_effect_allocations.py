@@ -0,0 +1,92 @@
+"""
+Verifica che la catena di effetti non allochi frame a regime
+
+Per ogni effetto (e per la catena con tutti gli effetti attivi) esegue alcuni
+frame di riscaldamento, poi misura con tracemalloc il picco di memoria
+allocata durante l'elaborazione. Un'allocazione della dimensione di un frame
+(o anche solo di una riga di buffer) fa fallire il controllo.
+
+Esempio:
+    python tools/check_effect_allocations.py --resolution 640x480 --channels 4
+"""
+import sys
+import argparse
+import tracemalloc
+import numpy as np
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+# Aggiungi la directory src al PYTHONPATH
+src_dir = Path(__file__).parent.parent / "src"
+if str(src_dir) not in sys.path:
+    sys.path.insert(0, str(src_dir))
+
+from effects.chain import VideoEffectChain
+
+# Oggetti Python temporanei (tuple, float, ...) restano ben sotto questa soglia
+ALLOCATION_TOLERANCE = 16 * 1024
+
+# Effetti che ristimano periodicamente uno stato interno e vanno esclusi dal controllo
+PERIODIC_EFFECTS = ('cartoon',)
+
+
+def measure_peak_allocation(chain: VideoEffectChain, frame: np.ndarray,
+                            warmup: int = 5, frames: int = 20) -> int:
+    """
+    Misura il picco di memoria allocata per frame dopo il riscaldamento
+
+    Returns:
+        int: Byte allocati al massimo durante un singolo frame
+    """
+    for _ in range(warmup):
+        chain.apply_effects(frame)
+
+    tracemalloc.start()
+    try:
+        worst = 0
+        for _ in range(frames):
+            tracemalloc.reset_peak()
+            current, _ = tracemalloc.get_traced_memory()
+            chain.apply_effects(frame)
+            _, peak = tracemalloc.get_traced_memory()
+            worst = max(worst, peak - current)
+        return worst
+    finally:
+        tracemalloc.stop()
+
+
+def run_checks(width: int, height: int, channels: int) -> List[Tuple[str, int, bool]]:
+    """Esegue il controllo per ogni effetto e per la catena completa"""
+    rng = np.random.default_rng(0)
+    shape = (height, width) if channels == 1 else (height, width, channels)
+    frame = rng.integers(0, 256, shape, dtype=np.uint8)
+
+    results = []
+    names = [stage.stage_id for stage in VideoEffectChain().stages if stage.stage_id not in PERIODIC_EFFECTS]
+    for name in names + ['*']:
+        chain = VideoEffectChain()
+        for effect_name in (names if name == '*' else [name]):
+            chain.toggle_effect(effect_name, True)
+        allocated = measure_peak_allocation(chain, frame)
+        results.append((name, allocated, allocated <= ALLOCATION_TOLERANCE))
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Funzione principale"""
+    parser = argparse.ArgumentParser(description="Controllo allocazioni della catena di effetti")
+    parser.add_argument('--resolution', default='640x480', help="Risoluzione WxH")
+    parser.add_argument('--channels', type=int, default=4, choices=(1, 3, 4), help="Canali del frame")
+    args = parser.parse_args(argv)
+
+    width, height = (int(v) for v in args.resolution.lower().split('x'))
+    failed = False
+    for name, allocated, ok in run_checks(width, height, args.channels):
+        label = 'catena completa' if name == '*' else name
+        print(f"{'OK ' if ok else 'ERR'} {label:<16} {allocated:>10} byte/frame")
+        failed |= not ok
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,366 @@
+"""
+Benchmark di carico per CameraServer/CameraClient e per lo stream MJPEG HTTP
+
+Avvia il server su una sorgente di frame sintetica, collega N client (thread o
+processi) e misura throughput aggregato, fps per client, latenza p50/p99 dei
+frame, frame persi e CPU del server. I risultati vengono scritti in JSON per
+confrontare le modifiche al protocollo e individuare regressioni.
+
+Esempio:
+    python tools/protocol_benchmark.py --clients 1,4,8 --resolutions 320x240,640x480 \\
+        --transports tcp,mjpeg --duration 5 --output bench_protocol.json
+"""
+import os
+import sys
+import json
+import time
+import socket
+import logging
+import argparse
+import platform
+import threading
+import multiprocessing
+import numpy as np
+from pathlib import Path
+from typing import Optional, List, Dict, Any, Tuple
+
+# Aggiungi la directory src al PYTHONPATH
+src_dir = Path(__file__).parent.parent / "src"
+if str(src_dir) not in sys.path:
+    sys.path.insert(0, str(src_dir))
+
+from core.camera_server import CameraServer
+from core.camera_client import CameraClient
+from core.http_server import MJPEGServer, MJPEG_BOUNDARY
+
+# Numero di timestamp di invio conservati (indicizzati per seq % TIMESTAMP_RING)
+TIMESTAMP_RING = 4096
+
+TRANSPORTS = ('tcp', 'mjpeg')
+
+
+class SyntheticFrameSource:
+    """Sorgente di frame sintetici con la stessa interfaccia di CLEyeService"""
+
+    def __init__(self, width: int, height: int, channels: int = 4, variants: int = 8):
+        self.camera = None
+        self.width = width
+        self.height = height
+        rng = np.random.default_rng(0)
+        # Pochi frame pregenerati: la generazione non deve pesare sul benchmark
+        gradient = np.linspace(0, 255, width, dtype=np.float32)[None, :, None]
+        base = np.broadcast_to(gradient, (height, width, channels)).astype(np.uint8)
+        self._frames = [
+            np.clip(base.astype(np.int16) + rng.integers(-20, 20, base.shape), 0, 255).astype(np.uint8)
+            for _ in range(variants)
+        ]
+        self._lock = threading.Lock()
+        self._current_frame = None
+        self._sequence = 0
+
+    def advance(self) -> Tuple[np.ndarray, int]:
+        """Produce il frame successivo"""
+        with self._lock:
+            self._sequence += 1
+            self._current_frame = self._frames[self._sequence % len(self._frames)]
+            return self._current_frame, self._sequence
+
+    def get_latest_frame(self) -> Tuple[Optional[np.ndarray], int]:
+        with self._lock:
+            return self._current_frame, self._sequence
+
+    def get_frame(self) -> Optional[np.ndarray]:
+        with self._lock:
+            return self._current_frame.copy() if self._current_frame is not None else None
+
+
+def _free_port() -> int:
+    """Trova una porta TCP libera"""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(('localhost', 0))
+        return s.getsockname()[1]
+
+
+def _tcp_client(port: int, duration: float, timestamps) -> Dict[str, Any]:
+    """Client basato su CameraClient"""
+    client = CameraClient()
+    latencies = []
+    sequences = []
+    errors = []
+
+    def on_frame(frame):
+        now = time.time()
+        # I timestamp sono indicizzati per sequenza della sorgente, non di trasporto
+        seq = client.last_content_sequence
+        if seq is not None:
+            sequences.append(seq)
+            latencies.append(now - timestamps[seq % TIMESTAMP_RING])
+
+    if not client.start(frame_callback=on_frame, error_callback=errors.append, port=port):
+        return {'latencies': [], 'sequences': [], 'errors': ['Connessione fallita'], 'bytes': 0, 'connected': 0.0}
+
+    connected_at = time.perf_counter()
+    time.sleep(duration)
+    client.stop()
+    return {
+        'latencies': latencies,
+        'sequences': sequences,
+        'errors': errors,
+        'bytes': client.stats['bytes_received'],
+        'connected': time.perf_counter() - connected_at
+    }
+
+
+def _mjpeg_client(port: int, duration: float, timestamps) -> Dict[str, Any]:
+    """Client che legge lo stream multipart/x-mixed-replace"""
+    latencies = []
+    sequences = []
+    errors = []
+    received = 0
+    connected_at = None
+    boundary = f'--{MJPEG_BOUNDARY}'.encode('ascii')
+
+    try:
+        sock = socket.create_connection(('localhost', port), timeout=5.0)
+        connected_at = time.perf_counter()
+        sock.sendall(b'GET /stream.mjpg HTTP/1.1\r\nHost: localhost\r\n\r\n')
+        stream = sock.makefile('rb')
+
+        # Salta gli header della risposta
+        line = None
+        while line not in (b'\r\n', b''):
+            line = stream.readline()
+            received += len(line)
+
+        deadline = time.time() + duration
+        while time.time() < deadline:
+            line = stream.readline()
+            received += len(line)
+            if not line:
+                errors.append("Connessione persa")
+                break
+            if not line.startswith(boundary):
+                continue
+
+            headers = {}
+            while True:
+                line = stream.readline()
+                received += len(line)
+                line = line.strip()
+                if not line:
+                    break
+                key, _, value = line.decode('ascii').partition(':')
+                headers[key.strip().lower()] = value.strip()
+
+            received += len(stream.read(int(headers['content-length'])))
+            now = time.time()
+            seq = int(headers['x-frame-sequence'])
+            sequences.append(seq)
+            latencies.append(now - timestamps[seq % TIMESTAMP_RING])
+
+        sock.close()
+    except Exception as e:
+        errors.append(str(e))
+
+    connected = time.perf_counter() - connected_at if connected_at is not None else 0.0
+    return {'latencies': latencies, 'sequences': sequences, 'errors': errors,
+            'bytes': received, 'connected': connected}
+
+
+def _run_client(transport: str, port: int, duration: float, timestamps, results, index: int):
+    """Punto di ingresso comune per client thread e processo"""
+    runner = _tcp_client if transport == 'tcp' else _mjpeg_client
+    result = runner(port, duration, timestamps)
+    result['index'] = index
+    results.put(result)
+
+
+def _percentile(values: List[float], q: float) -> Optional[float]:
+    return float(np.percentile(values, q)) if values else None
+
+
+def run_scenario(transport: str, clients: int, width: int, height: int,
+                 duration: float = 5.0, fps: int = 30, mode: str = 'thread') -> Dict[str, Any]:
+    """
+    Esegue una singola configurazione del benchmark
+
+    Args:
+        transport: 'tcp' (CameraServer) o 'mjpeg' (MJPEGServer)
+        clients: Numero di client
+        width: Larghezza dei frame
+        height: Altezza dei frame
+        duration: Durata della misura in secondi
+        fps: Frame rate della sorgente sintetica
+        mode: 'thread' o 'process' per i client
+
+    Returns:
+        Dict[str, Any]: Metriche della configurazione
+    """
+    source = SyntheticFrameSource(width, height)
+    port = _free_port()
+    timestamps = multiprocessing.Array('d', TIMESTAMP_RING, lock=False)
+
+    if transport == 'tcp':
+        server = CameraServer(source)
+    else:
+        server = MJPEGServer(source, max_fps=fps * 2)
+    if not server.start(port=port):
+        raise RuntimeError(f"Impossibile avviare il server {transport}")
+
+    stop_event = threading.Event()
+    produced = [0]
+
+    def producer():
+        interval = 1.0 / fps
+        next_time = time.perf_counter()
+        while not stop_event.is_set():
+            frame, seq = source.advance()
+            timestamps[seq % TIMESTAMP_RING] = time.time()
+            if transport == 'tcp':
+                server.broadcast_frame(frame, sequence=seq)
+            produced[0] += 1
+            next_time += interval
+            delay = next_time - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_time = time.perf_counter()
+
+    if mode == 'process':
+        results = multiprocessing.Queue()
+        workers = [
+            multiprocessing.Process(target=_run_client, args=(transport, port, duration, timestamps, results, i))
+            for i in range(clients)
+        ]
+    else:
+        import queue
+        results = queue.Queue()
+        workers = [
+            threading.Thread(target=_run_client, args=(transport, port, duration, timestamps, results, i), daemon=True)
+            for i in range(clients)
+        ]
+
+    producer_thread = threading.Thread(target=producer, daemon=True)
+    producer_thread.start()
+
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+
+    client_results = [results.get(timeout=duration + 30) for _ in workers]
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+
+    for worker in workers:
+        worker.join(timeout=5.0)
+    stop_event.set()
+    producer_thread.join(timeout=2.0)
+    server.stop()
+
+    # I ritmi per client usano il tempo di connessione di ciascuno (i client in
+    # processi separati si connettono dopo l'avvio della misura) e i byte
+    # effettivamente ricevuti (in MJPEG molto meno del frame RGBA)
+    per_client = []
+    all_latencies = []
+    total_frames = 0
+    for result in sorted(client_results, key=lambda r: r['index']):
+        sequences = result['sequences']
+        received = len(sequences)
+        dropped = (sequences[-1] - sequences[0] + 1 - received) if sequences else 0
+        connected = result['connected']
+        total_frames += received
+        all_latencies.extend(result['latencies'])
+        per_client.append({
+            'frames': received,
+            'bytes': result['bytes'],
+            'connected_s': connected,
+            'fps': received / connected if connected > 0 else 0.0,
+            'mb_per_s': result['bytes'] / connected / 1e6 if connected > 0 else 0.0,
+            'dropped': dropped,
+            'errors': result['errors'],
+        })
+
+    metrics = {
+        'transport': transport,
+        'mode': mode,
+        'clients': clients,
+        'resolution': [width, height],
+        'source_fps': fps,
+        'duration': duration,
+        'frames_produced': produced[0],
+        'frames_received': total_frames,
+        'aggregate_fps': sum(c['fps'] for c in per_client),
+        'aggregate_mb_per_s': sum(c['mb_per_s'] for c in per_client),
+        'client_fps_min': min((c['fps'] for c in per_client), default=0.0),
+        'client_fps_mean': float(np.mean([c['fps'] for c in per_client])) if per_client else 0.0,
+        'latency_p50_ms': _percentile(all_latencies, 50) * 1000 if all_latencies else None,
+        'latency_p99_ms': _percentile(all_latencies, 99) * 1000 if all_latencies else None,
+        'dropped': sum(c['dropped'] for c in per_client),
+        'errors': sum(len(c['errors']) for c in per_client),
+        # In modalità thread la CPU del processo include anche i client
+        'server_cpu_percent': 100.0 * cpu / wall if wall > 0 else 0.0,
+        'server_cpu_includes_clients': mode == 'thread',
+        'per_client': per_client,
+    }
+    if transport == 'mjpeg':
+        metrics['encode_cache'] = server.cache.stats
+    return metrics
+
+
+def _parse_list(value: str) -> List[str]:
+    return [v.strip() for v in value.split(',') if v.strip()]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Funzione principale"""
+    parser = argparse.ArgumentParser(description="Benchmark di carico del protocollo PS3 Eye")
+    parser.add_argument('--clients', default='1,2,4,8', help="Numero di client (lista separata da virgole)")
+    parser.add_argument('--resolutions', default='320x240,640x480', help="Risoluzioni WxH")
+    parser.add_argument('--transports', default='tcp,mjpeg', help="Trasporti: tcp, mjpeg")
+    parser.add_argument('--mode', choices=('thread', 'process'), default='thread', help="Esecuzione dei client")
+    parser.add_argument('--duration', type=float, default=5.0, help="Durata di ogni configurazione (s)")
+    parser.add_argument('--fps', type=int, default=30, help="Frame rate della sorgente sintetica")
+    parser.add_argument('--output', default=None, help="File JSON dei risultati (default: stdout)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    results = []
+    for transport in _parse_list(args.transports):
+        if transport not in TRANSPORTS:
+            parser.error(f"Trasporto sconosciuto: {transport}")
+        for resolution in _parse_list(args.resolutions):
+            width, height = (int(v) for v in resolution.lower().split('x'))
+            for clients in (int(c) for c in _parse_list(args.clients)):
+                print(f"{transport} {width}x{height} client={clients} ...", file=sys.stderr)
+                metrics = run_scenario(transport, clients, width, height,
+                                       duration=args.duration, fps=args.fps, mode=args.mode)
+                print(f"  {metrics['aggregate_fps']:.1f} fps aggregati, "
+                      f"p50 {metrics['latency_p50_ms'] or 0:.1f} ms, "
+                      f"p99 {metrics['latency_p99_ms'] or 0:.1f} ms, "
+                      f"persi {metrics['dropped']}, errori {metrics['errors']}", file=sys.stderr)
+                results.append(metrics)
+
+    report = {
+        'benchmark': 'protocol',
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'platform': {
+            'system': platform.system(),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'cpu_count': os.cpu_count(),
+        },
+        'results': results,
+    }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output, encoding='utf-8')
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,143 @@
+"""
+Verifica su file mappato che i lettori della memoria condivisa non vedano mai frame parziali
+
+Un processo scrittore pubblica frame senza pause con SharedFrameBuffer su
+un file (il layout è lo stesso della mappatura con nome usata su Windows);
+più processi lettori copiano l'ultimo frame e controllano che:
+  - tutti i byte del frame abbiano lo stesso valore (ogni frame è riempito
+    con il proprio numero modulo 256, quindi un frame parziale ne mescola due);
+  - il valore corrisponda al numero di frame letto dallo slot;
+  - i numeri di frame letti non tornino indietro.
+
+Con --unsynchronized i lettori copiano lo slot pubblicato ignorando il
+seqlock, leggendo il layout direttamente come farebbe un driver ingenuo:
+serve a mostrare che senza il protocollo i frame parziali si verificano.
+
+Esempio:
+    python tools/shared_frame_harness.py --seconds 5 --readers 2
+"""
+import os
+import sys
+import time
+import mmap
+import struct
+import argparse
+import tempfile
+import multiprocessing
+import numpy as np
+from pathlib import Path
+from typing import Dict, List, Optional
+
+# Aggiungi la directory src al PYTHONPATH
+src_dir = Path(__file__).parent.parent / "src"
+if str(src_dir) not in sys.path:
+    sys.path.insert(0, str(src_dir))
+
+from core.pixel_format import PixelFormat
+from core.shared_frame import SharedFrameBuffer, SLOT_HEADER_SIZE
+
+
+def _writer(path: str, width: int, height: int, seconds: float, ready, results):
+    frames = SharedFrameBuffer.create(width, height, PixelFormat.BGR, path=path)
+    ready.set()
+    deadline = time.monotonic() + seconds
+    count = 0
+    while time.monotonic() < deadline:
+        value = (frames.frame_number + 1) & 0xFF
+        frames.publish(lambda view: view.fill(value))
+        count += 1
+    results.put(('writer', {'frames': count}))
+    frames.close()
+
+
+def _check(frame: np.ndarray, number: int, last_number: int, stats: Dict[str, int]):
+    stats['frames'] += 1
+    if frame.min() != frame.max():
+        stats['torn'] += 1
+    elif int(frame.flat[0]) != number & 0xFF:
+        stats['mismatched'] += 1
+    if number < last_number:
+        stats['backwards'] += 1
+
+
+def _reader(index: int, path: str, seconds: float, unsynchronized: bool, ready, results):
+    ready.wait()
+    frames = SharedFrameBuffer.open(path=path)
+    out = np.empty(frames.pixel_format.shape(frames.width, frames.height), np.uint8)
+    stats = {'frames': 0, 'torn': 0, 'mismatched': 0, 'backwards': 0}
+    deadline = time.monotonic() + seconds
+    last_number = 0
+
+    if unsynchronized:
+        # Lettura diretta del layout, senza seqlock
+        with open(path, 'rb') as file:
+            memory = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            header_size, = struct.unpack_from('<H', memory, 6)
+            stride, = struct.unpack_from('<I', memory, 28)
+            while time.monotonic() < deadline:
+                latest, = struct.unpack_from('<Q', memory, 32)
+                if not latest:
+                    continue
+                offset = header_size + (latest & 0xFF) * stride
+                data = np.frombuffer(memory, np.uint8, frames.frame_size, offset + SLOT_HEADER_SIZE)
+                np.copyto(out.reshape(-1), data)
+                del data
+                number = latest >> 8
+                _check(out, number, last_number, stats)
+                last_number = number
+            memory.close()
+    else:
+        while time.monotonic() < deadline:
+            frame, number, _ = frames.read(out)
+            if frame is None:
+                continue
+            _check(frame, number, last_number, stats)
+            last_number = number
+        stats['retries'] = frames.read_retries
+
+    frames.close()
+    results.put((f'reader {index}', stats))
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Punto di ingresso da riga di comando"""
+    parser = argparse.ArgumentParser(description="Verifica del protocollo della memoria condivisa")
+    parser.add_argument('--seconds', type=float, default=3.0, help="Durata della prova")
+    parser.add_argument('--readers', type=int, default=2, help="Processi lettori")
+    parser.add_argument('--resolution', default='640x480', help="Risoluzione WxH")
+    parser.add_argument('--unsynchronized', action='store_true',
+                        help="Lettori senza seqlock (i frame parziali sono attesi)")
+    args = parser.parse_args(argv)
+
+    width, height = (int(v) for v in args.resolution.lower().split('x'))
+    path = os.path.join(tempfile.mkdtemp(prefix='ps3eye-'), 'frames.bin')
+    ready = multiprocessing.Event()
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=_writer, args=(path, width, height, args.seconds, ready, results))]
+    processes += [
+        multiprocessing.Process(target=_reader, args=(i, path, args.seconds, args.unsynchronized, ready, results))
+        for i in range(args.readers)
+    ]
+    for process in processes:
+        process.start()
+    reports = dict(results.get() for _ in processes)
+    for process in processes:
+        process.join()
+    os.remove(path)
+    os.rmdir(os.path.dirname(path))
+
+    print(f"scrittore: {reports.pop('writer')['frames']} frame")
+    errors = 0
+    for name, stats in sorted(reports.items()):
+        print(f"{name}: " + ", ".join(f"{key} {value}" for key, value in stats.items()))
+        errors += stats['torn'] + stats['mismatched'] + stats['backwards']
+
+    if args.unsynchronized:
+        print("Lettura senza seqlock: frame parziali o incoerenti", errors)
+        return 0
+    print("OK: nessun frame parziale" if not errors else f"ERRORE: {errors} frame parziali o incoerenti")
+    return 1 if errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())